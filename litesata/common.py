@@ -18,6 +18,9 @@ frequencies = {
     "sata_gen1": 37.5,
 }
 
+# runtime rates (speed negotiation), from lowest to highest
+revisions = ["sata_gen1", "sata_gen2", "sata_gen3"]
+
 
 # PHY / Link Layers
 primitives = {
@@ -64,6 +67,8 @@ def link_description(dw):
         ("data", dw),
         ("error", 1)
     ]
+    if dw > 32:
+        layout.insert(1, ("valid", dw//32))
     return EndpointDescription(layout, packetized=True)
 
 
@@ -71,11 +76,13 @@ def link_description(dw):
 fis_max_dwords = 2048
 
 fis_types = {
-    "REG_H2D":          0x27,
-    "REG_D2H":          0x34,
-    "DMA_ACTIVATE_D2H": 0x39,
-    "PIO_SETUP_D2H":    0x5F,
-    "DATA":             0x46
+    "REG_H2D":             0x27,
+    "REG_D2H":             0x34,
+    "DMA_ACTIVATE_D2H":    0x39,
+    "DMA_SETUP":           0x41,
+    "PIO_SETUP_D2H":       0x5F,
+    "DATA":                0x46,
+    "SET_DEVICE_BITS_D2H": 0xA1
 }
 
 fis_reg_h2d_header_length = 5
@@ -149,6 +156,39 @@ fis_pio_setup_d2h_header = Header(fis_pio_setup_d2h_header_fields,
                                   fis_pio_setup_d2h_header_length,
                                   swap_field_bytes=False)
 
+fis_dma_setup_header_length = 7
+fis_dma_setup_header_fields = {
+    "type":               HeaderField(0*4,  0, 8),
+    "pm_port":            HeaderField(0*4,  8, 4),
+    "d":                  HeaderField(0*4, 13, 1),
+    "i":                  HeaderField(0*4, 14, 1),
+    "a":                  HeaderField(0*4, 15, 1),
+
+    "tag":                HeaderField(1*4,  0, 5),
+
+    "dma_buffer_offset":  HeaderField(4*4,  0, 32),
+
+    "dma_transfer_count": HeaderField(5*4,  0, 32)
+}
+fis_dma_setup_header = Header(fis_dma_setup_header_fields,
+                              fis_dma_setup_header_length,
+                              swap_field_bytes=False)
+
+fis_set_device_bits_d2h_header_length = 2
+fis_set_device_bits_d2h_header_fields = {
+    "type":    HeaderField(0*4,  0, 8),
+    "pm_port": HeaderField(0*4,  8, 4),
+    "i":       HeaderField(0*4, 14, 1),
+    "n":       HeaderField(0*4, 15, 1),
+    "status":  HeaderField(0*4, 16, 8),
+    "errors":  HeaderField(0*4, 24, 8),
+
+    "sactive": HeaderField(1*4,  0, 32)
+}
+fis_set_device_bits_d2h_header = Header(fis_set_device_bits_d2h_header_fields,
+                                        fis_set_device_bits_d2h_header_length,
+                                        swap_field_bytes=False)
+
 fis_data_header_length = 1
 fis_data_header_fields = {
     "type": HeaderField(0,  0, 8)
@@ -176,18 +216,24 @@ def transport_tx_description(dw):
 
 def transport_rx_description(dw):
     param_layout = [
-        ("type",            8),
-        ("pm_port",         4),
-        ("r",               1),
-        ("d",               1),
-        ("i",               1),
-        ("status",          8),
-        ("errors",          8),
-        ("lba",            48),
-        ("device",          8),
-        ("count",          16),
-        ("transfer_count", 16),
-        ("error",           1)
+        ("type",                8),
+        ("pm_port",             4),
+        ("r",                   1),
+        ("d",                   1),
+        ("i",                   1),
+        ("a",                   1),
+        ("n",                   1),
+        ("status",              8),
+        ("errors",              8),
+        ("lba",                48),
+        ("device",              8),
+        ("count",              16),
+        ("transfer_count",     16),
+        ("tag",                 5),
+        ("dma_buffer_offset",  32),
+        ("dma_transfer_count", 32),
+        ("sactive",            32),
+        ("error",               1)
     ]
     payload_layout = [("data", dw)]
     return EndpointDescription(payload_layout, param_layout, packetized=True)
@@ -195,11 +241,16 @@ def transport_rx_description(dw):
 
 # Command Layer
 regs = {
-    "WRITE_DMA_EXT":   0x35,
-    "READ_DMA_EXT":    0x25,
-    "IDENTIFY_DEVICE": 0xEC
+    "WRITE_DMA_EXT":      0x35,
+    "READ_DMA_EXT":       0x25,
+    "WRITE_FPDMA_QUEUED": 0x61,
+    "READ_FPDMA_QUEUED":  0x60,
+    "IDENTIFY_DEVICE":    0xEC,
+    "FLUSH_CACHE_EXT":    0xEA
 }
 
+ncq_max_tags = 32
+
 reg_d2h_status = {
     "bsy":  7,
     "drdy": 6,
@@ -213,13 +264,18 @@ reg_d2h_status = {
     "err":  0
 }
 
-def command_tx_description(dw):
+# commands outstanding in a crossbar's arbiter (and then on a user port)
+arbiter_queue_depth = 4
+
+def command_tx_description(dw, count_width=16):
     param_layout = [
         ("write",    1),
         ("read",     1),
         ("identify", 1),
+        ("flush",    1),
         ("sector",  48),
-        ("count",   16)
+        ("count",   count_width),
+        ("tag",      5)
     ]
     payload_layout = [("data", dw)]
     return EndpointDescription(payload_layout, param_layout, packetized=True)
@@ -230,8 +286,10 @@ def command_rx_description(dw):
         ("write",    1),
         ("read",     1),
         ("identify", 1),
+        ("flush",    1),
         ("last",     1),
-        ("failed",   1)
+        ("failed",   1),
+        ("tag",      5)
     ]
     payload_layout = [("data", dw)]
     return EndpointDescription(payload_layout, param_layout, packetized=True)
@@ -242,6 +300,7 @@ def command_rx_cmd_description(dw):
         ("write",    1),
         ("read",     1),
         ("identify", 1),
+        ("flush",    1),
         ("last",     1),
         ("failed",   1)
     ]
@@ -2,11 +2,49 @@ from litesata.common import *
 from litesata.core.link import LiteSATALink
 from litesata.core.transport import LiteSATATransport
 from litesata.core.command import LiteSATACommand
+from litesata.core.statistics import LiteSATACoreStatistics
 
+from litex.soc.interconnect.csr import *
 
-class LiteSATACore(Module):
-    def __init__(self, phy, buffer_depth=2*fis_max_dwords):
-        self.submodules.link = LiteSATALink(phy, buffer_depth)
-        self.submodules.transport = LiteSATATransport(self.link)
-        self.submodules.command = LiteSATACommand(self.transport)
+
+class LiteSATACore(Module, AutoCSR):
+    """SATA Core
+
+    Primitives are handled by the Link layer on 32 bits words in the
+    "sys" clock domain, which must then run at the dword rate of the link
+    (150MHz for a SATA Gen3 core). The rest of the Link layer (buffers,
+    CRC, scrambler), the Transport and Command layers and user's
+    sink/source are dw bits wide (32/64/128) and run in clock_domain,
+    which only has to provide the bandwidth of the link (ex: 64 bits @
+    75MHz for SATA Gen3). Crossbar and frontends of the core have to run
+    in clock_domain, user ports of the core's width are then connected
+    without width conversion.
+
+    The Link TX buffer can be configured in cut-through mode (tx_threshold)
+    to reduce write latency and allow a smaller tx_buffer_depth.
+
+    Optional performance counters (with_statistics) can be read over CSRs,
+    they are only available when the core runs in "sys".
+    """
+    def __init__(self, phy, buffer_depth=2*fis_max_dwords,
+                 with_ncq=False, ncq_depth=ncq_max_tags,
+                 dw=32, clock_domain="sys",
+                 tx_buffer_depth=None, tx_threshold=None,
+                 with_statistics=False):
+        if with_statistics and clock_domain != "sys":
+            raise ValueError("Statistics are only available with a core running in sys")
+        self.with_ncq = with_ncq
+        self.ncq_depth = ncq_depth
+        self.submodules.link = LiteSATALink(phy, buffer_depth,
+                                            tx_buffer_depth, tx_threshold,
+                                            dw, clock_domain)
+        transport = LiteSATATransport(self.link, dw)
+        command = LiteSATACommand(transport, with_ncq, ncq_depth, dw)
+        if clock_domain != "sys":
+            transport = ClockDomainsRenamer(clock_domain)(transport)
+            command = ClockDomainsRenamer(clock_domain)(command)
+        self.submodules.transport = transport
+        self.submodules.command = command
+        if with_statistics:
+            self.submodules.statistics = LiteSATACoreStatistics(self.link, self.transport, self.command)
         self.sink, self.source = self.command.sink, self.command.source
@@ -4,19 +4,41 @@ tx_to_rx = [
     ("write", 1),
     ("read", 1),
     ("identify", 1),
+    ("flush", 1),
     ("count", 16)
 ]
 
 rx_to_tx = [
     ("dma_activate", 1),
-    ("d2h_error", 1)
+    ("reg_d2h", 1),
+    ("ready", 1)
+]
+
+ncq_tx_to_rx = [
+    ("write", 1),
+    ("read", 1),
+    ("identify", 1),
+    ("flush", 1),
+    ("tag", 5)
+]
+
+ncq_rx_to_tx = [
+    ("accepted", 1),
+    ("dma_setup", 1),
+    ("dma_activate", 1),
+    ("d2h_error", 1),
+    ("tag", 5),
+    ("identify", 1),
+    ("idle", 1),
+    ("busy", ncq_max_tags),
+    ("failed", ncq_max_tags)
 ]
 
 # command tx
 
 class LiteSATACommandTX(Module):
-    def __init__(self, transport):
-        self.sink = sink = Sink(command_tx_description(32))
+    def __init__(self, transport, dw=32):
+        self.sink = sink = Sink(command_tx_description(dw))
         self.to_rx = to_rx = Source(tx_to_rx)
         self.from_rx = from_rx = Sink(rx_to_tx)
 
@@ -33,19 +55,22 @@ class LiteSATACommandTX(Module):
             transport.sink.data.eq(sink.data)
         ]
 
-        dwords_counter = Signal(max=fis_max_dwords)
-        dwords_counter_reset = Signal()
-        dwords_counter_ce = Signal()
+        # data of dw bits in a DATA FIS
+        fis_max_datas = fis_max_dwords*32//dw
+        datas_counter = Signal(max=fis_max_datas)
+        datas_counter_reset = Signal()
+        datas_counter_ce = Signal()
         self.sync += \
-            If(dwords_counter_reset,
-                dwords_counter.eq(0)
-            ).Elif(dwords_counter_ce,
-                dwords_counter.eq(dwords_counter + 1)
+            If(datas_counter_reset,
+                datas_counter.eq(0)
+            ).Elif(datas_counter_ce,
+                datas_counter.eq(datas_counter + 1)
             )
 
         is_write = Signal()
         is_read = Signal()
         is_identify = Signal()
+        is_flush = Signal()
 
         self.fsm = fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
@@ -62,14 +87,18 @@ class LiteSATACommandTX(Module):
                 is_write.eq(sink.write),
                 is_read.eq(sink.read),
                 is_identify.eq(sink.identify),
+                is_flush.eq(sink.flush)
             )
 
+        # command is prepared and sent as soon as RX is ready to
+        # accept it (previous command completed by the device).
         fsm.act("SEND_CMD",
-            transport.sink.stb.eq(sink.stb),
+            transport.sink.stb.eq(sink.stb & from_rx.ready),
             transport.sink.sop.eq(1),
             transport.sink.eop.eq(1),
             transport.sink.c.eq(1),
             If(transport.sink.stb & transport.sink.ack,
+                to_rx.stb.eq(1),
                 If(is_write,
                     NextState("WAIT_DMA_ACTIVATE")
                 ).Else(
@@ -79,27 +108,27 @@ class LiteSATACommandTX(Module):
             )
         )
         fsm.act("WAIT_DMA_ACTIVATE",
-            dwords_counter_reset.eq(1),
+            datas_counter_reset.eq(1),
             If(from_rx.dma_activate,
                 NextState("SEND_DATA")
-            ).Elif(from_rx.d2h_error,
+            ).Elif(from_rx.reg_d2h,
                 sink.ack.eq(1),
                 NextState("IDLE")
             )
         )
         fsm.act("SEND_DATA",
-            dwords_counter_ce.eq(sink.stb & sink.ack),
+            datas_counter_ce.eq(sink.stb & sink.ack),
 
             transport.sink.stb.eq(sink.stb),
-            transport.sink.sop.eq(dwords_counter == 0),
-            transport.sink.eop.eq((dwords_counter == (fis_max_dwords-1)) |
+            transport.sink.sop.eq(datas_counter == 0),
+            transport.sink.eop.eq((datas_counter == (fis_max_datas-1)) |
                                   sink.eop),
 
             sink.ack.eq(transport.sink.ack),
             If(sink.stb & sink.ack,
                 If(sink.eop,
                     NextState("IDLE")
-                ).Elif(dwords_counter == (fis_max_dwords-1),
+                ).Elif(datas_counter == (fis_max_datas-1),
                     NextState("WAIT_DMA_ACTIVATE")
                 )
             )
@@ -113,24 +142,25 @@ class LiteSATACommandTX(Module):
                     transport.sink.command.eq(regs["WRITE_DMA_EXT"])
                 ).Elif(is_read,
                     transport.sink.command.eq(regs["READ_DMA_EXT"]),
+                ).Elif(is_flush,
+                    transport.sink.command.eq(regs["FLUSH_CACHE_EXT"]),
                 ).Else(
                     transport.sink.command.eq(regs["IDENTIFY_DEVICE"]),
                 )
             )
         self.comb += [
-            If(sink.stb,
-                to_rx.write.eq(sink.write),
-                to_rx.read.eq(sink.read),
-                to_rx.identify.eq(sink.identify),
-                to_rx.count.eq(sink.count)
-            )
+            to_rx.write.eq(sink.write),
+            to_rx.read.eq(sink.read),
+            to_rx.identify.eq(sink.identify),
+            to_rx.flush.eq(sink.flush),
+            to_rx.count.eq(sink.count)
         ]
 
 # command rx
 
 class LiteSATACommandRX(Module):
-    def __init__(self, transport):
-        self.source = source = Source(command_rx_description(32))
+    def __init__(self, transport, dw=32):
+        self.source = source = Source(command_rx_description(dw))
         self.to_tx = to_tx = Source(rx_to_tx)
         self.from_tx = from_tx = Sink(tx_to_rx)
 
@@ -145,23 +175,45 @@ class LiteSATACommandRX(Module):
 
         is_identify = Signal()
         is_dma_activate = Signal()
-        read_ndwords = Signal(max=sectors2dwords(2**16))
-        dwords_counter = Signal(max=sectors2dwords(2**16))
-        dwords_counter_reset = Signal()
-        dwords_counter_ce = Signal()
+        # data of dw bits read
+        read_ndatas = Signal(max=sectors2dwords(2**16))
+        datas_counter = Signal(max=sectors2dwords(2**16))
+        datas_counter_reset = Signal()
+        datas_counter_ce = Signal()
         self.sync += \
-            If(dwords_counter_reset,
-                dwords_counter.eq(0)
-            ).Elif(dwords_counter_ce,
-                dwords_counter.eq(dwords_counter + 1)
+            If(datas_counter_reset,
+                datas_counter.eq(0)
+            ).Elif(datas_counter_ce,
+                datas_counter.eq(datas_counter + 1)
             )
         read_done = Signal()
 
+        # command sent by TX, waiting to be handled
+        pending = Signal()
+        pending_clr = Signal()
+        pending_write = Signal()
+        pending_read = Signal()
+        pending_identify = Signal()
+        pending_flush = Signal()
+        pending_count = Signal(16)
+        self.sync += \
+            If(from_tx.stb,
+                pending.eq(1),
+                pending_write.eq(from_tx.write),
+                pending_read.eq(from_tx.read),
+                pending_identify.eq(from_tx.identify),
+                pending_flush.eq(from_tx.flush),
+                pending_count.eq(from_tx.count)
+            ).Elif(pending_clr,
+                pending.eq(0)
+            )
+
+        load = Signal()
         self.sync += \
-            If(from_tx.read,
-                read_ndwords.eq(from_tx.count*sectors2dwords(1) - 1)
+            If(load,
+                read_ndatas.eq(pending_count*(sectors2dwords(1)*32//dw) - 1)
             )
-        self.comb += read_done.eq(dwords_counter == read_ndwords)
+        self.comb += read_done.eq(datas_counter == read_ndatas)
 
         d2h_error = Signal()
         clr_d2h_error = Signal()
@@ -192,22 +244,30 @@ class LiteSATACommandRX(Module):
 
         self.fsm = fsm = FSM(reset_state="IDLE")
         self.submodules += fsm
+        # FISes of a pending command (sent while its previous response was
+        # presented) are kept for the wait states, others are dropped.
         fsm.act("IDLE",
-            dwords_counter_reset.eq(1),
-            transport.source.ack.eq(1),
+            datas_counter_reset.eq(1),
+            transport.source.ack.eq(~pending),
             clr_d2h_error.eq(1),
             clr_read_error.eq(1),
-            If(from_tx.write,
-                NextState("WAIT_WRITE_ACTIVATE_OR_REG_D2H")
-            ).Elif(from_tx.read,
-                NextState("WAIT_READ_DATA_OR_REG_D2H"),
-            ).Elif(from_tx.identify,
-                NextState("WAIT_PIO_SETUP_D2H"),
+            If(pending,
+                pending_clr.eq(1),
+                load.eq(1),
+                If(pending_write,
+                    NextState("WAIT_WRITE_ACTIVATE_OR_REG_D2H")
+                ).Elif(pending_read,
+                    NextState("WAIT_READ_DATA_OR_REG_D2H"),
+                ).Elif(pending_identify,
+                    NextState("WAIT_PIO_SETUP_D2H"),
+                ).Elif(pending_flush,
+                    NextState("WAIT_FLUSH_REG_D2H"),
+                )
             )
         )
         self.sync += \
-            If(fsm.ongoing("IDLE"),
-                is_identify.eq(from_tx.identify)
+            If(load,
+                is_identify.eq(pending_identify)
             )
         fsm.act("WAIT_WRITE_ACTIVATE_OR_REG_D2H",
             transport.source.ack.eq(1),
@@ -216,7 +276,8 @@ class LiteSATACommandRX(Module):
                     is_dma_activate.eq(1),
                 ).Elif(test_type("REG_D2H"),
                     update_d2h.eq(1),
-                    set_d2h_error.eq(transport.source.status[reg_d2h_status["err"]]),
+                    set_d2h_error.eq(transport.source.status[reg_d2h_status["err"]] |
+                                     transport.source.error),
                     NextState("PRESENT_WRITE_RESPONSE")
                 )
             )
@@ -227,7 +288,27 @@ class LiteSATACommandRX(Module):
             source.eop.eq(1),
             source.write.eq(1),
             source.last.eq(1),
-            source.failed.eq(transport.source.error | d2h_error),
+            source.failed.eq(d2h_error),
+            If(source.stb & source.ack,
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WAIT_FLUSH_REG_D2H",
+            transport.source.ack.eq(1),
+            If(transport.source.stb & test_type("REG_D2H"),
+                update_d2h.eq(1),
+                set_d2h_error.eq(transport.source.status[reg_d2h_status["err"]] |
+                                 transport.source.error),
+                NextState("PRESENT_FLUSH_RESPONSE")
+            )
+        )
+        fsm.act("PRESENT_FLUSH_RESPONSE",
+            source.stb.eq(1),
+            source.sop.eq(1),
+            source.eop.eq(1),
+            source.flush.eq(1),
+            source.last.eq(1),
+            source.failed.eq(d2h_error),
             If(source.stb & source.ack,
                 NextState("IDLE")
             )
@@ -273,7 +354,7 @@ class LiteSATACommandRX(Module):
             source.data.eq(transport.source.data),
             transport.source.ack.eq(source.ack),
             If(source.stb & source.ack,
-                dwords_counter_ce.eq(~read_done),
+                datas_counter_ce.eq(~read_done),
                 If(source.eop,
                     If(is_identify,
                         NextState("IDLE")
@@ -296,17 +377,425 @@ class LiteSATACommandRX(Module):
             )
         )
 
+        # reg_d2h pulses on any REG_D2H received while a write waits for
+        # DMA Activate, error or not: the device ended the command early
+        # and TX must stop waiting. It is not an error indication, the
+        # error is reported by the write response.
         self.comb += [
             to_tx.dma_activate.eq(is_dma_activate),
-            to_tx.d2h_error.eq(d2h_error)
+            to_tx.reg_d2h.eq(fsm.ongoing("WAIT_WRITE_ACTIVATE_OR_REG_D2H") &
+                             transport.source.stb &
+                             test_type("REG_D2H"))
+        ]
+
+        # next command can be sent once the device has completed the
+        # current one, even if the response is not yet presented.
+        self.comb += \
+            to_tx.ready.eq(~pending & (fsm.ongoing("IDLE") |
+                                       fsm.ongoing("PRESENT_WRITE_RESPONSE") |
+                                       fsm.ongoing("PRESENT_READ_RESPONSE") |
+                                       fsm.ongoing("PRESENT_FLUSH_RESPONSE")))
+
+
+# ncq command tx
+
+class LiteSATANCQCommandTX(Module):
+    def __init__(self, transport, ncq_depth=ncq_max_tags, dw=32):
+        self.sink = sink = Sink(command_tx_description(dw))
+        self.to_rx = to_rx = Source(ncq_tx_to_rx)
+        self.from_rx = from_rx = Sink(ncq_rx_to_tx)
+
+        # # #
+
+        tag = Signal(max=ncq_depth)
+        is_write = Signal()
+        is_read = Signal()
+        is_identify = Signal()
+        is_flush = Signal()
+
+        busy = Array(from_rx.busy[i] for i in range(ncq_depth))
+        failed = Array(from_rx.failed[i] for i in range(ncq_depth))
+
+        self.comb += [
+            transport.sink.pm_port.eq(0),
+            transport.sink.lba.eq(sink.sector),
+            transport.sink.icc.eq(0),
+            transport.sink.control.eq(0),
+            transport.sink.data.eq(sink.data)
+        ]
+
+        # data of dw bits in a DATA FIS
+        fis_max_datas = fis_max_dwords*32//dw
+        datas_counter = Signal(max=fis_max_datas)
+        datas_counter_reset = Signal()
+        datas_counter_ce = Signal()
+        self.sync += \
+            If(datas_counter_reset,
+                datas_counter.eq(0)
+            ).Elif(datas_counter_ce,
+                datas_counter.eq(datas_counter + 1)
+            )
+
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        self.submodules += fsm
+        fsm.act("IDLE",
+            sink.ack.eq(0),
+            If(sink.stb & sink.sop,
+                NextState("WAIT_TAG")
+            ).Else(
+                sink.ack.eq(1)
+            )
+        )
+        self.sync += \
+            If(fsm.ongoing("IDLE"),
+                tag.eq(sink.tag),
+                is_write.eq(sink.write),
+                is_read.eq(sink.read),
+                is_identify.eq(sink.identify),
+                is_flush.eq(sink.flush)
+            )
+
+        # identify/flush are not queued commands and can only be issued
+        # when no queued command is outstanding.
+        fsm.act("WAIT_TAG",
+            If(is_identify | is_flush,
+                If(from_rx.idle,
+                    NextState("SEND_CMD")
+                )
+            ).Elif(~busy[tag] & ~from_rx.identify,
+                NextState("SEND_CMD")
+            )
+        )
+        fsm.act("SEND_CMD",
+            transport.sink.stb.eq(sink.stb),
+            transport.sink.sop.eq(1),
+            transport.sink.eop.eq(1),
+            transport.sink.c.eq(1),
+            If(transport.sink.stb & transport.sink.ack,
+                to_rx.stb.eq(1),
+                If(is_identify | is_flush,
+                    sink.ack.eq(1),
+                    NextState("IDLE")
+                ).Else(
+                    NextState("WAIT_ACCEPT")
+                )
+            )
+        )
+        fsm.act("WAIT_ACCEPT",
+            If(from_rx.accepted,
+                If(is_write,
+                    NextState("WAIT_DMA_SETUP")
+                ).Else(
+                    sink.ack.eq(1),
+                    NextState("IDLE")
+                )
+            ).Elif(from_rx.d2h_error,
+                sink.ack.eq(1),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WAIT_DMA_SETUP",
+            datas_counter_reset.eq(1),
+            If(from_rx.dma_setup & (from_rx.tag == tag),
+                If(from_rx.dma_activate,
+                    NextState("SEND_DATA")
+                ).Else(
+                    NextState("WAIT_DMA_ACTIVATE")
+                )
+            ).Elif(failed[tag],
+                sink.ack.eq(1),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WAIT_DMA_ACTIVATE",
+            datas_counter_reset.eq(1),
+            If(from_rx.dma_activate,
+                NextState("SEND_DATA")
+            ).Elif(failed[tag],
+                sink.ack.eq(1),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("SEND_DATA",
+            datas_counter_ce.eq(sink.stb & sink.ack),
+
+            transport.sink.stb.eq(sink.stb),
+            transport.sink.sop.eq(datas_counter == 0),
+            transport.sink.eop.eq((datas_counter == (fis_max_datas-1)) |
+                                  sink.eop),
+
+            sink.ack.eq(transport.sink.ack),
+            If(sink.stb & sink.ack,
+                If(sink.eop,
+                    NextState("IDLE")
+                ).Elif(datas_counter == (fis_max_datas-1),
+                    NextState("WAIT_DMA_ACTIVATE")
+                )
+            )
+        )
+        self.comb += \
+            If(fsm.ongoing("SEND_DATA"),
+                transport.sink.type.eq(fis_types["DATA"]),
+            ).Else(
+                transport.sink.type.eq(fis_types["REG_H2D"]),
+                If(is_identify | is_flush,
+                    If(is_flush,
+                        transport.sink.command.eq(regs["FLUSH_CACHE_EXT"])
+                    ).Else(
+                        transport.sink.command.eq(regs["IDENTIFY_DEVICE"])
+                    ),
+                    transport.sink.features.eq(0),
+                    transport.sink.device.eq(0xe0),
+                    transport.sink.count.eq(sink.count)
+                ).Else(
+                    If(is_write,
+                        transport.sink.command.eq(regs["WRITE_FPDMA_QUEUED"])
+                    ).Else(
+                        transport.sink.command.eq(regs["READ_FPDMA_QUEUED"])
+                    ),
+                    transport.sink.features.eq(sink.count),
+                    transport.sink.device.eq(0x40),
+                    transport.sink.count.eq(tag << 3)
+                )
+            )
+        self.comb += [
+            to_rx.write.eq(is_write),
+            to_rx.read.eq(is_read),
+            to_rx.identify.eq(is_identify),
+            to_rx.flush.eq(is_flush),
+            to_rx.tag.eq(tag)
+        ]
+
+# ncq command rx
+
+class LiteSATANCQCommandRX(Module):
+    def __init__(self, transport, ncq_depth=ncq_max_tags, dw=32):
+        self.source = source = Source(command_rx_description(dw))
+        self.to_tx = to_tx = Source(ncq_rx_to_tx)
+        self.from_tx = from_tx = Sink(ncq_tx_to_rx)
+
+        # debug
+        self.d2h_status = Signal(8)
+        self.d2h_errors = Signal(8)
+
+        # # #
+
+        def test_type(name):
+            return transport.source.type == fis_types[name]
+
+        # tag table
+        busy = Signal(ncq_depth)
+        is_write = Signal(ncq_depth)
+        failed = Signal(ncq_depth)
+        done = Signal(ncq_depth)
+
+        set_done = Signal(ncq_depth)
+        set_failed = Signal(ncq_depth)
+        complete = Signal()
+
+        issue = Signal()
+        self.comb += issue.eq(from_tx.stb & ~from_tx.identify & ~from_tx.flush)
+
+        # last queued command issued, waiting for its REG_D2H
+        accept_pending = Signal()
+        accept_tag = Signal(max=ncq_depth)
+        accept_mask = Signal(ncq_depth)
+        clr_accept_pending = Signal()
+        self.sync += \
+            If(issue,
+                accept_pending.eq(1),
+                accept_tag.eq(from_tx.tag)
+            ).Elif(clr_accept_pending,
+                accept_pending.eq(0)
+            )
+
+        identify_pending = Signal()
+        clr_identify_pending = Signal()
+        self.sync += \
+            If(from_tx.stb & from_tx.identify,
+                identify_pending.eq(1)
+            ).Elif(clr_identify_pending,
+                identify_pending.eq(0)
+            )
+
+        # flush issued, waiting for its REG_D2H
+        flush_pending = Signal()
+        flush_failed = Signal()
+        clr_flush_pending = Signal()
+        set_flush_failed = Signal()
+        self.sync += [
+            If(from_tx.stb & from_tx.flush,
+                flush_pending.eq(1)
+            ).Elif(clr_flush_pending,
+                flush_pending.eq(0)
+            ),
+            If(from_tx.stb & from_tx.flush,
+                flush_failed.eq(0)
+            ).Elif(set_flush_failed,
+                flush_failed.eq(1)
+            )
+        ]
+
+        # tag of the read data phase selected by the last DMA Setup
+        read_tag = Signal(max=ncq_depth)
+        read_mask = Signal(ncq_depth)
+        update_read_tag = Signal()
+        self.sync += \
+            If(update_read_tag,
+                read_tag.eq(transport.source.tag)
+            )
+
+        # lowest completed tag is presented first
+        done_tag = Signal(max=ncq_depth)
+        done_mask = Signal(ncq_depth)
+        for i in reversed(range(ncq_depth)):
+            self.comb += If(done[i], done_tag.eq(i))
+
+        for i in range(ncq_depth):
+            self.comb += [
+                accept_mask[i].eq(accept_tag == i),
+                read_mask[i].eq(read_tag == i),
+                done_mask[i].eq(done_tag == i)
+            ]
+            self.sync += [
+                If(issue & (from_tx.tag == i),
+                    busy[i].eq(1),
+                    is_write[i].eq(from_tx.write),
+                    failed[i].eq(0),
+                    done[i].eq(0)
+                ).Elif(complete & done_mask[i],
+                    busy[i].eq(0),
+                    done[i].eq(0)
+                ).Else(
+                    If(set_done[i], done[i].eq(1)),
+                    If(set_failed[i], failed[i].eq(1))
+                )
+            ]
+
+        update_d2h = Signal()
+        self.sync += \
+            If(update_d2h,
+                self.d2h_status.eq(transport.source.status),
+                self.d2h_errors.eq(transport.source.errors)
+            )
+
+        d2h_error = Signal()
+        self.comb += d2h_error.eq(transport.source.status[reg_d2h_status["err"]])
+
+        self.fsm = fsm = FSM(reset_state="IDLE")
+        self.submodules += fsm
+        fsm.act("IDLE",
+            If(done != 0,
+                NextState("PRESENT_COMPLETION")
+            ).Elif(transport.source.stb,
+                transport.source.ack.eq(1),
+                If(test_type("REG_D2H"),
+                    update_d2h.eq(1),
+                    If(accept_pending,
+                        clr_accept_pending.eq(1),
+                        If(d2h_error,
+                            to_tx.d2h_error.eq(1),
+                            set_done.eq(accept_mask),
+                            set_failed.eq(accept_mask)
+                        ).Else(
+                            to_tx.accepted.eq(1)
+                        )
+                    ).Elif(flush_pending,
+                        set_flush_failed.eq(d2h_error),
+                        NextState("PRESENT_FLUSH_RESPONSE")
+                    ).Elif(d2h_error,
+                        set_done.eq(busy),
+                        set_failed.eq(busy)
+                    )
+                ).Elif(test_type("DMA_SETUP"),
+                    If(transport.source.d,
+                        update_read_tag.eq(1)
+                    ).Else(
+                        to_tx.dma_setup.eq(1),
+                        to_tx.dma_activate.eq(transport.source.a)
+                    )
+                ).Elif(test_type("DMA_ACTIVATE_D2H"),
+                    to_tx.dma_activate.eq(1)
+                ).Elif(test_type("SET_DEVICE_BITS_D2H"),
+                    update_d2h.eq(1),
+                    If(d2h_error,
+                        set_done.eq(busy),
+                        set_failed.eq(busy)
+                    ).Else(
+                        set_done.eq(transport.source.sactive & busy)
+                    )
+                ).Elif(test_type("DATA"),
+                    transport.source.ack.eq(0),
+                    NextState("PRESENT_READ_DATA")
+                )
+            )
+        )
+        fsm.act("PRESENT_READ_DATA",
+            source.stb.eq(transport.source.stb),
+            source.sop.eq(transport.source.sop),
+            source.eop.eq(transport.source.eop),
+            source.read.eq(~identify_pending),
+            source.identify.eq(identify_pending),
+            source.failed.eq(transport.source.error),
+            source.last.eq(identify_pending),
+            source.tag.eq(read_tag),
+            source.data.eq(transport.source.data),
+            transport.source.ack.eq(source.ack),
+            If(transport.source.stb & transport.source.error & ~identify_pending,
+                set_failed.eq(read_mask)
+            ),
+            If(source.stb & source.ack & source.eop,
+                clr_identify_pending.eq(1),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("PRESENT_FLUSH_RESPONSE",
+            source.stb.eq(1),
+            source.sop.eq(1),
+            source.eop.eq(1),
+            source.flush.eq(1),
+            source.last.eq(1),
+            source.failed.eq(flush_failed),
+            If(source.stb & source.ack,
+                clr_flush_pending.eq(1),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("PRESENT_COMPLETION",
+            source.stb.eq(1),
+            source.sop.eq(1),
+            source.eop.eq(1),
+            source.write.eq((is_write & done_mask) != 0),
+            source.read.eq((is_write & done_mask) == 0),
+            source.last.eq(1),
+            source.failed.eq((failed & done_mask) != 0),
+            source.tag.eq(done_tag),
+            If(source.stb & source.ack,
+                complete.eq(1),
+                NextState("IDLE")
+            )
+        )
+
+        self.comb += [
+            to_tx.tag.eq(transport.source.tag),
+            to_tx.identify.eq(identify_pending),
+            to_tx.idle.eq((busy == 0) & ~accept_pending & ~identify_pending & ~flush_pending),
+            to_tx.busy.eq(busy),
+            to_tx.failed.eq(failed)
         ]
 
 # command
 
 class LiteSATACommand(Module):
-    def __init__(self, transport):
-        self.submodules.tx = LiteSATACommandTX(transport)
-        self.submodules.rx = LiteSATACommandRX(transport)
+    def __init__(self, transport, with_ncq=False, ncq_depth=ncq_max_tags, dw=32):
+        if with_ncq:
+            if ncq_depth > ncq_max_tags:
+                raise ValueError("NCQ depth is limited to {} tags".format(ncq_max_tags))
+            self.submodules.tx = LiteSATANCQCommandTX(transport, ncq_depth, dw)
+            self.submodules.rx = LiteSATANCQCommandRX(transport, ncq_depth, dw)
+        else:
+            self.submodules.tx = LiteSATACommandTX(transport, dw)
+            self.submodules.rx = LiteSATACommandRX(transport, dw)
         self.comb += [
             self.rx.to_tx.connect(self.tx.from_rx),
             self.tx.to_rx.connect(self.rx.from_tx)
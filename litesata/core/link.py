@@ -4,6 +4,8 @@ from operator import xor
 
 from litesata.common import *
 
+from litex.gen.genlib.cdc import MultiReg
+
 from litex.soc.interconnect.stream_packet import Buffer
 
 # link crc
@@ -12,28 +14,42 @@ class CRCEngine(Module):
     """Cyclic Redundancy Check Engine
 
     Compute next CRC value from last CRC value and data input using
-    an optimized asynchronous LFSR.
+    an optimized asynchronous LFSR. The data input can contain several
+    words of CRC's width, absorbed in a single clock cycle (first word
+    in LSBs).
 
     Parameters
     ----------
     width : int
-        Width of the data bus and CRC.
+        Width of the CRC (and of a data word).
     polynom : int
         Polynom of the CRC (ex: 0x04C11DB7 for IEEE 802.3 CRC)
+    data_width : int
+        Width of the data bus, multiple of width (default: width).
 
     Attributes
     ----------
-    d : in
+    data : in
         Data input.
     last : in
         last CRC value.
-    next :
-        next CRC value.
+    next : out
+        next CRC value (all data words absorbed).
+    nexts : out
+        next CRC values after absorbing the first 1..N data words, used
+        for partial final words.
     """
-    def __init__(self, width, polynom):
-        self.data = Signal(width)
+    def __init__(self, width, polynom, data_width=None):
+        if data_width is None:
+            data_width = width
+        if data_width%width:
+            raise ValueError("data_width must be a multiple of width")
+        nwords = data_width//width
+
+        self.data = Signal(data_width)
         self.last = Signal(width)
-        self.next = Signal(width)
+        self.nexts = [Signal(width) for i in range(nwords)]
+        self.next = self.nexts[-1]
 
         # # #
 
@@ -54,26 +70,28 @@ class CRCEngine(Module):
                     r.append(key)
             return r
 
-        new = Signal(32)
-        self.comb += new.eq(self.last ^ self.data)
-
         # compute and optimize CRC's LFSR
-        curval = [[("new", i)] for i in range(width)]
-        for i in range(width):
-            feedback = curval.pop()
-            for j in range(width-1):
-                if (polynom & (1<<(j+1))):
-                    curval[j] += feedback
-                curval[j] = _optimize_eq(curval[j])
-            curval.insert(0, feedback)
-
-        # implement logic
-        for i in range(width):
-            xors = []
-            for t, n in curval[i]:
-                if t == "new":
-                    xors += [new[n]]
-            self.comb += self.next[i].eq(reduce(xor, xors))
+        curval = [[("last", i)] for i in range(width)]
+        for n in range(nwords):
+            for i in range(width):
+                curval[i] = curval[i] + [("data", n*width + i)]
+            for i in range(width):
+                feedback = curval.pop()
+                for j in range(width-1):
+                    if (polynom & (1<<(j+1))):
+                        curval[j] = curval[j] + feedback
+                    curval[j] = _optimize_eq(curval[j])
+                curval.insert(0, feedback)
+
+            # implement logic
+            for i in range(width):
+                xors = []
+                for t, k in curval[i]:
+                    if t == "last":
+                        xors += [self.last[k]]
+                    else:
+                        xors += [self.data[k]]
+                self.comb += self.nexts[n][i].eq(reduce(xor, xors))
 
 
 @ResetInserter()
@@ -83,10 +101,19 @@ class LiteSATACRC(Module):
 
     Implement a SATA CRC generator/checker
 
+    Parameters
+    ----------
+    dw : int
+        Width of the data bus (multiple of 32 bits).
+
     Attributes
     ----------
+    valid : in
+        Valid dwords of data (contiguous from LSBs), only for dw > 32.
     value : out
         CRC value (used for generator).
+    next : out
+        CRC value including current data (used for wide generator).
     error : out
         CRC error (used for checker).
     """
@@ -95,23 +122,31 @@ class LiteSATACRC(Module):
     init = 0x52325032
     check = 0x00000000
 
-    def __init__(self):
-        self.data = Signal(self.width)
+    def __init__(self, dw=32):
+        self.data = Signal(dw)
+        self.valid = Signal(dw//self.width)
         self.value = Signal(self.width)
+        self.next = Signal(self.width)
         self.error = Signal()
 
         # # #
 
-        engine = CRCEngine(self.width, self.polynom)
+        engine = CRCEngine(self.width, self.polynom, dw)
         self.submodules += engine
+        if dw == self.width:
+            self.comb += self.next.eq(engine.next)
+        else:
+            # select CRC after the last valid dword
+            for i in range(dw//self.width):
+                self.comb += If(self.valid[i], self.next.eq(engine.nexts[i]))
         reg_i = Signal(self.width, reset=self.init)
-        self.sync += reg_i.eq(engine.next)
+        self.sync += reg_i.eq(self.next)
         self.comb += [
             engine.data.eq(self.data),
             engine.last.eq(reg_i),
 
             self.value.eq(reg_i),
-            self.error.eq(engine.next != self.check)
+            self.error.eq(self.next != self.check)
         ]
 
 
@@ -139,7 +174,10 @@ class LiteSATACRCInserter(Module):
 
         # # #
 
-        crc = LiteSATACRC()
+        dw = len(sink.data)
+        n = dw//32
+
+        crc = LiteSATACRC(dw)
         fsm = FSM(reset_state="IDLE")
         self.submodules += crc, fsm
 
@@ -151,15 +189,48 @@ class LiteSATACRCInserter(Module):
                 NextState("COPY"),
             )
         )
-        fsm.act("COPY",
-            crc.ce.eq(sink.stb & source.ack),
-            crc.data.eq(sink.data),
-            Record.connect(sink, source),
-            source.eop.eq(0),
-            If(sink.stb & sink.eop & source.ack,
-                NextState("INSERT"),
+        if n == 1:
+            fsm.act("COPY",
+                crc.ce.eq(sink.stb & source.ack),
+                crc.data.eq(sink.data),
+                Record.connect(sink, source),
+                source.eop.eq(0),
+                If(sink.stb & sink.eop & source.ack,
+                    NextState("INSERT"),
+                )
             )
-        )
+        else:
+            # CRC is inserted in the first free dword of the last
+            # data, or in a new data if last data is full.
+            crc_cases = []
+            for i in range(1, n):
+                crc_cases.append(
+                    If(sink.valid[i-1] & ~sink.valid[i],
+                        source.data[32*i:32*(i+1)].eq(crc.next)
+                    )
+                )
+            fsm.act("COPY",
+                crc.ce.eq(sink.stb & source.ack),
+                crc.data.eq(sink.data),
+                crc.valid.eq(sink.valid),
+                Record.connect(sink, source),
+                If(sink.eop,
+                    If(sink.valid[n-1],
+                        source.eop.eq(0)
+                    ).Else(
+                        source.valid.eq(Cat(1, sink.valid[:n-1])),
+                        *crc_cases
+                    )
+                ),
+                If(sink.stb & sink.eop & source.ack,
+                    If(sink.valid[n-1],
+                        NextState("INSERT")
+                    ).Else(
+                        NextState("IDLE")
+                    )
+                )
+            )
+            self.comb += If(fsm.ongoing("INSERT"), source.valid.eq(1))
         fsm.act("INSERT",
             source.stb.eq(1),
             source.eop.eq(1),
@@ -194,124 +265,207 @@ class LiteSATACRCChecker(Module):
 
         # # #
 
-        crc = LiteSATACRC()
-        self.submodules += crc
+        dw = len(sink.data)
+        n = dw//32
 
-        error = Signal()
-        fifo = ResetInserter()(SyncFIFO(description, 2))
-        self.submodules += fifo
+        if n == 1:
+            crc = LiteSATACRC()
+            self.submodules += crc
 
-        fsm = FSM(reset_state="RESET")
-        self.submodules += fsm
+            error = Signal()
+            fifo = ResetInserter()(SyncFIFO(description, 2))
+            self.submodules += fifo
 
-        fifo_in = Signal()
-        fifo_out = Signal()
-        fifo_full = Signal()
+            fsm = FSM(reset_state="RESET")
+            self.submodules += fsm
 
-        self.comb += [
-            fifo_full.eq(fifo.level == 1),
-            fifo_in.eq(sink.stb & (~fifo_full | fifo_out)),
-            fifo_out.eq(source.stb & source.ack),
+            fifo_in = Signal()
+            fifo_out = Signal()
+            fifo_full = Signal()
 
-            Record.connect(sink, fifo.sink),
-            fifo.sink.stb.eq(fifo_in),
-            self.sink.ack.eq(fifo_in),
+            self.comb += [
+                fifo_full.eq(fifo.level == 1),
+                fifo_in.eq(sink.stb & (~fifo_full | fifo_out)),
+                fifo_out.eq(source.stb & source.ack),
 
-            source.stb.eq(sink.stb & fifo_full),
-            source.sop.eq(fifo.source.sop),
-            source.eop.eq(sink.eop),
-            fifo.source.ack.eq(fifo_out),
-            source.payload.eq(fifo.source.payload),
+                Record.connect(sink, fifo.sink),
+                fifo.sink.stb.eq(fifo_in),
+                self.sink.ack.eq(fifo_in),
 
-            source.error.eq(sink.error | crc.error),
-        ]
+                source.stb.eq(sink.stb & fifo_full),
+                source.sop.eq(fifo.source.sop),
+                source.eop.eq(sink.eop),
+                fifo.source.ack.eq(fifo_out),
+                source.payload.eq(fifo.source.payload),
 
-        fsm.act("RESET",
-            crc.reset.eq(1),
-            fifo.reset.eq(1),
-            NextState("IDLE"),
-        )
-        fsm.act("IDLE",
-            crc.data.eq(sink.data),
-            If(sink.stb & sink.sop & sink.ack,
-                crc.ce.eq(1),
-                NextState("COPY")
+                source.error.eq(sink.error | crc.error),
+            ]
+
+            fsm.act("RESET",
+                crc.reset.eq(1),
+                fifo.reset.eq(1),
+                NextState("IDLE"),
             )
-        )
-        fsm.act("COPY",
-            crc.data.eq(sink.data),
-            If(sink.stb & sink.ack,
-                crc.ce.eq(1),
-                If(sink.eop,
-                    NextState("RESET")
+            fsm.act("IDLE",
+                crc.data.eq(sink.data),
+                If(sink.stb & sink.sop & sink.ack,
+                    crc.ce.eq(1),
+                    NextState("COPY")
                 )
             )
-        )
-        self.comb += self.busy.eq(~fsm.ongoing("IDLE"))
+            fsm.act("COPY",
+                crc.data.eq(sink.data),
+                If(sink.stb & sink.ack,
+                    crc.ce.eq(1),
+                    If(sink.eop,
+                        NextState("RESET")
+                    )
+                )
+            )
+            self.comb += self.busy.eq(~fsm.ongoing("IDLE"))
+        else:
+            # data is delayed by one data to remove the CRC (last
+            # valid dword) and report the error on eop.
+            crc = LiteSATACRC(dw)
+            self.submodules += crc
+
+            crc_only = Signal()
+            load = Signal()
+            hold_full = Signal()
+            hold_data = Signal(dw)
+            hold_valid = Signal(n)
+            hold_sop = Signal()
+            hold_eop = Signal()
+            hold_error = Signal()
+
+            self.comb += [
+                crc_only.eq(sink.valid == 1),
+                crc.data.eq(sink.data),
+                crc.valid.eq(sink.valid),
+                crc.ce.eq(sink.stb & sink.ack),
+                crc.reset.eq(sink.stb & sink.eop & sink.ack),
+
+                source.data.eq(hold_data),
+                source.valid.eq(hold_valid),
+                source.sop.eq(hold_sop),
+                source.eop.eq(hold_eop),
+                source.error.eq(hold_error),
+                If(hold_full,
+                    If(hold_eop,
+                        source.stb.eq(1)
+                    ).Elif(sink.stb,
+                        source.stb.eq(1),
+                        sink.ack.eq(source.ack),
+                        If(sink.eop & crc_only,
+                            source.eop.eq(1),
+                            source.error.eq(hold_error | sink.error | crc.error)
+                        ).Else(
+                            load.eq(source.ack)
+                        )
+                    )
+                ).Else(
+                    sink.ack.eq(1),
+                    load.eq(sink.stb)
+                )
+            ]
+            self.sync += \
+                If(load,
+                    hold_full.eq(1),
+                    hold_data.eq(sink.data),
+                    hold_sop.eq(sink.sop),
+                    hold_eop.eq(sink.eop),
+                    If(sink.eop,
+                        hold_valid.eq(sink.valid >> 1),
+                        hold_error.eq(sink.error | crc.error)
+                    ).Else(
+                        hold_valid.eq(sink.valid),
+                        hold_error.eq(sink.error)
+                    )
+                ).Elif(source.stb & source.ack,
+                    hold_full.eq(0)
+                )
+            self.comb += self.busy.eq(hold_full)
 
 # link scrambler
 
+# XXX: from SATA specification, replace it with
+# a generic implementation using polynoms.
+scrambler_lfsr_coefs = (
+    (15, 13, 4, 0),  # 0
+    (15, 14, 13, 5, 4, 1, 0),
+    (14, 13, 6, 5, 4, 2, 1, 0),
+    (15, 14, 7, 6, 5, 3, 2, 1),
+    (13, 8, 7, 6, 3, 2, 0),
+    (14, 9, 8, 7, 4, 3, 1),
+    (15, 10, 9, 8, 5, 4, 2),
+    (15, 13, 11, 10, 9, 6, 5, 4, 3, 0),
+    (15, 14, 13, 12, 11, 10, 7, 6, 5, 1, 0),
+    (14, 12, 11, 8, 7, 6, 4, 2, 1, 0),
+    (15, 13, 12, 9, 8, 7, 5, 3, 2, 1),
+    (15, 14, 10, 9, 8, 6, 3, 2, 0),
+    (13, 11, 10, 9, 7, 3, 1, 0),
+    (14, 12, 11, 10, 8, 4, 2, 1),
+    (15, 13, 12, 11, 9, 5, 3, 2),
+    (15, 14, 12, 10, 6, 3, 0),
+
+    (11, 7, 1, 0),  # 16
+    (12, 8, 2, 1),
+    (13, 9, 3, 2),
+    (14, 10, 4, 3),
+    (15, 11, 5, 4),
+    (15, 13, 12, 6, 5, 4, 0),
+    (15, 14, 7, 6, 5, 4, 1, 0),
+    (13, 8, 7, 6, 5, 4, 2, 1, 0),
+    (14, 9, 8, 7, 6, 5, 3, 2, 1),
+    (15, 10, 9, 8, 7, 6, 4, 3, 2),
+    (15, 13, 11, 10, 9, 8, 7, 5, 3, 0),
+    (15, 14, 13, 12, 11, 10, 9, 8, 6, 1, 0),
+    (14, 12, 11, 10, 9, 7, 4, 2, 1, 0),
+    (15, 13, 12, 11, 10, 8, 5, 3, 2, 1),
+    (15, 14, 12, 11, 9, 6, 3, 2, 0),
+    (12, 10, 7, 3, 1, 0),
+)
+
+
 @CEInserter()
 class Scrambler(Module):
     """SATA Scrambler
 
     Implement a SATA Scrambler
 
+    Parameters
+    ----------
+    n : int
+        Number of dwords generated per cycle.
+
     Attributes
     ----------
+    valid : in
+        Dwords consumed (contiguous from LSBs), only for n > 1.
     value : out
-        Scrambled value.
+        Scrambled value (first dword in LSBs).
     """
-    def __init__(self):
-        self.value = Signal(32)
+    def __init__(self, n=1):
+        self.valid = Signal(n, reset=2**n-1)
+        self.value = Signal(32*n)
 
         # # #
 
         context = Signal(16, reset=0xf0f6)
-        next_value = Signal(32)
-        self.sync += context.eq(next_value[16:32])
-
-        # XXX: from SATA specification, replace it with
-        # a generic implementation using polynoms.
-        lfsr_coefs = (
-            (15, 13, 4, 0),  # 0
-            (15, 14, 13, 5, 4, 1, 0),
-            (14, 13, 6, 5, 4, 2, 1, 0),
-            (15, 14, 7, 6, 5, 3, 2, 1),
-            (13, 8, 7, 6, 3, 2, 0),
-            (14, 9, 8, 7, 4, 3, 1),
-            (15, 10, 9, 8, 5, 4, 2),
-            (15, 13, 11, 10, 9, 6, 5, 4, 3, 0),
-            (15, 14, 13, 12, 11, 10, 7, 6, 5, 1, 0),
-            (14, 12, 11, 8, 7, 6, 4, 2, 1, 0),
-            (15, 13, 12, 9, 8, 7, 5, 3, 2, 1),
-            (15, 14, 10, 9, 8, 6, 3, 2, 0),
-            (13, 11, 10, 9, 7, 3, 1, 0),
-            (14, 12, 11, 10, 8, 4, 2, 1),
-            (15, 13, 12, 11, 9, 5, 3, 2),
-            (15, 14, 12, 10, 6, 3, 0),
-
-            (11, 7, 1, 0),  # 16
-            (12, 8, 2, 1),
-            (13, 9, 3, 2),
-            (14, 10, 4, 3),
-            (15, 11, 5, 4),
-            (15, 13, 12, 6, 5, 4, 0),
-            (15, 14, 7, 6, 5, 4, 1, 0),
-            (13, 8, 7, 6, 5, 4, 2, 1, 0),
-            (14, 9, 8, 7, 6, 5, 3, 2, 1),
-            (15, 10, 9, 8, 7, 6, 4, 3, 2),
-            (15, 13, 11, 10, 9, 8, 7, 5, 3, 0),
-            (15, 14, 13, 12, 11, 10, 9, 8, 6, 1, 0),
-            (14, 12, 11, 10, 9, 7, 4, 2, 1, 0),
-            (15, 13, 12, 11, 10, 8, 5, 3, 2, 1),
-            (15, 14, 12, 11, 9, 6, 3, 2, 0),
-            (12, 10, 7, 3, 1, 0),
-        )
-
-        for n, coefs in enumerate(lfsr_coefs):
-            eq = [context[i] for i in coefs]
-            self.comb += next_value[n].eq(reduce(xor, eq))
+        next_value = Signal(32*n)
+
+        # each dword is generated from the context left by the previous one
+        dword_context = context
+        for j in range(n):
+            for i, coefs in enumerate(scrambler_lfsr_coefs):
+                eq = [dword_context[k] for k in coefs]
+                self.comb += next_value[32*j+i].eq(reduce(xor, eq))
+            dword_context = next_value[32*j+16:32*(j+1)]
+            # continue from the context left by the last consumed dword
+            if n == 1:
+                self.sync += context.eq(dword_context)
+            else:
+                self.sync += If(self.valid[j], context.eq(dword_context))
 
         self.comb += self.value.eq(next_value)
 
@@ -324,8 +478,11 @@ class LiteSATAScrambler(Module):
 
         # # #
 
-        scrambler = Scrambler()
+        n = len(sink.data)//32
+        scrambler = Scrambler(n)
         self.submodules += scrambler
+        if n > 1:
+            self.comb += scrambler.valid.eq(sink.valid)
         self.comb += [
             scrambler.ce.eq(sink.stb & sink.ack),
             Record.connect(sink, source),
@@ -465,19 +622,30 @@ from_rx = [
     ("primitive", 32)
 ]
 
+crc_status = [
+    ("error", 1)
+]
+
 class LiteSATALinkTX(Module):
-    def __init__(self):
+    def __init__(self, with_crc_scrambler=True):
         self.sink = sink = Sink(link_description(32))
         self.source = source = Source(phy_description(32))
         self.from_rx = Sink(from_rx)
 
+        # debug
+        self.r_err = Signal()
+
         # # #
 
-        # CRC / Scrambler
-        crc = LiteSATACRCInserter(link_description(32))
-        scrambler = LiteSATAScrambler(link_description(32))
-        pipeline = Pipeline(sink, crc, scrambler)
-        self.submodules += crc, scrambler, pipeline
+        # CRC / Scrambler (or frames already encoded by the wide datapath)
+        if with_crc_scrambler:
+            crc = LiteSATACRCInserter(link_description(32))
+            scrambler = LiteSATAScrambler(link_description(32))
+            pipeline = Pipeline(sink, crc, scrambler)
+            self.submodules += crc, scrambler, pipeline
+            frame = pipeline.source
+        else:
+            frame = sink
 
         # datas / primitives mux
         insert = Signal(32)
@@ -492,9 +660,9 @@ class LiteSATALinkTX(Module):
                 source.data.eq(insert),
                 source.charisk.eq(0x0001),
             ).Elif(copy,
-                source.stb.eq(pipeline.source.stb),
-                source.data.eq(pipeline.source.data),
-                pipeline.source.ack.eq(source.ack),
+                source.stb.eq(frame.stb),
+                source.data.eq(frame.data),
+                frame.ack.eq(source.ack),
                 source.charisk.eq(0)
             )
         ]
@@ -502,10 +670,9 @@ class LiteSATALinkTX(Module):
         # FSM
         self.submodules.fsm = fsm = FSM(reset_state="IDLE")
         fsm.act("IDLE",
-            scrambler.reset.eq(1),
             If(self.from_rx.idle,
                 insert.eq(primitives["SYNC"]),
-                If(pipeline.source.stb & pipeline.source.sop,
+                If(frame.stb & frame.sop,
                     If(self.from_rx.primitive_stb & 
                        (self.from_rx.primitive == primitives["SYNC"]),
                         NextState("RDY")
@@ -530,14 +697,14 @@ class LiteSATALinkTX(Module):
         )
         fsm.act("COPY",
             copy.eq(1),
-            If(pipeline.source.stb &
-               pipeline.source.eop &
-               pipeline.source.ack,
+            If(frame.stb &
+               frame.eop &
+               frame.ack,
                 NextState("EOF")
             ).Elif(self.from_rx.primitive_stb & 
                (self.from_rx.primitive == primitives["HOLD"]),
                NextState("HOLDA")
-            ).Elif(~pipeline.source.stb,
+            ).Elif(~frame.stb,
                 insert.eq(primitives["HOLD"])
             )
         )
@@ -560,19 +727,28 @@ class LiteSATALinkTX(Module):
                 If(self.from_rx.primitive == primitives["R_OK"],
                     NextState("IDLE")
                 ).Elif(self.from_rx.primitive == primitives["R_ERR"],
+                    self.r_err.eq(1),
                     NextState("IDLE")
                 )
             )
         )
+        if with_crc_scrambler:
+            self.comb += scrambler.reset.eq(fsm.ongoing("IDLE"))
 
 # link rx
 
 class LiteSATALinkRX(Module):
-    def __init__(self):
+    def __init__(self, with_crc_scrambler=True):
         self.sink = sink = Sink(phy_description(32))
         self.source = source = Source(link_description(32))
         self.hold = Signal()
         self.to_tx = Source(from_rx)
+        # CRC check of the frames by the wide datapath
+        if not with_crc_scrambler:
+            self.crc_status = Sink(crc_status)
+
+        # debug
+        self.crc_error = Signal()
 
         # # #
 
@@ -592,11 +768,15 @@ class LiteSATALinkRX(Module):
             primitive.eq(sink.data)
         ]
 
-        # descrambler / CRC
-        descrambler = LiteSATAScrambler(link_description(32))
-        crc = LiteSATACRCChecker(link_description(32))
-        pipeline = Pipeline(descrambler, crc, source)
-        self.submodules += descrambler, crc, pipeline
+        # descrambler / CRC (or raw frames to the wide datapath)
+        if with_crc_scrambler:
+            descrambler = LiteSATAScrambler(link_description(32))
+            crc = LiteSATACRCChecker(link_description(32))
+            pipeline = Pipeline(descrambler, crc, source)
+            self.submodules += descrambler, crc, pipeline
+            frame = pipeline.sink
+        else:
+            frame = source
 
         # internal logic
         sop = Signal()
@@ -604,16 +784,21 @@ class LiteSATALinkRX(Module):
         sop_set = Signal()
         self.sync += If(sop_clr, sop.eq(0)).Elif(sop_set, sop.eq(1))
 
-        crc_error = Signal()
-        self.sync += \
-            If(crc.source.stb & crc.source.eop & crc.source.ack,
-                crc_error.eq(crc.source.error)
-            )
+        if with_crc_scrambler:
+            crc_error = Signal()
+            self.sync += \
+                If(crc.source.stb & crc.source.eop & crc.source.ack,
+                    crc_error.eq(crc.source.error)
+                )
+            self.comb += self.crc_error.eq(crc.source.stb & crc.source.eop &
+                                           crc.source.ack & crc.source.error)
+        else:
+            self.comb += self.crc_error.eq(self.crc_status.stb & self.crc_status.ack &
+                                           self.crc_status.error)
 
         # FSM
         self.submodules.fsm = fsm = FSM(reset_state="IDLE")
         fsm.act("IDLE",
-            descrambler.reset.eq(1),
             If(primitive_stb & 
                (primitive == primitives["X_RDY"]),
                 NextState("RDY")
@@ -635,16 +820,16 @@ class LiteSATALinkRX(Module):
         )
         fsm.act("COPY",
             sop_clr.eq(data_stb),
-            pipeline.sink.stb.eq(data_stb),
-            pipeline.sink.sop.eq(sop),
+            frame.stb.eq(data_stb),
+            frame.sop.eq(sop),
             insert.eq(primitives["R_IP"]),
             If(primitive_stb,
                 If(primitive == primitives["HOLD"],
                     insert.eq(primitives["HOLDA"])
                 ).Elif(primitive == primitives["EOF"],
                     # 1 clock cycle latency
-                    pipeline.sink.stb.eq(1), 
-                    pipeline.sink.eop.eq(1),
+                    frame.stb.eq(1), 
+                    frame.eop.eq(1),
                     NextState("WTRM")
                 )
             ).Elif(self.hold,
@@ -652,7 +837,7 @@ class LiteSATALinkRX(Module):
             )
         )
         # 1 clock cycle latency
-        self.sync += If(data_stb, pipeline.sink.data.eq(sink.data))
+        self.sync += If(data_stb, frame.data.eq(sink.data))
         fsm.act("EOF",
             insert.eq(primitives["R_IP"]),
             If(primitive_stb &
@@ -660,14 +845,28 @@ class LiteSATALinkRX(Module):
                 NextState("WTRM")
             )
         )
-        fsm.act("WTRM",
-            insert.eq(primitives["R_IP"]),
-            If(~crc_error,
-                NextState("R_OK")
-            ).Else(
-                NextState("R_ERR")
+        if with_crc_scrambler:
+            fsm.act("WTRM",
+                insert.eq(primitives["R_IP"]),
+                If(~crc_error,
+                    NextState("R_OK")
+                ).Else(
+                    NextState("R_ERR")
+                )
+            )
+        else:
+            # wait for the frame to be checked by the wide datapath
+            fsm.act("WTRM",
+                insert.eq(primitives["R_IP"]),
+                self.crc_status.ack.eq(1),
+                If(self.crc_status.stb,
+                    If(~self.crc_status.error,
+                        NextState("R_OK")
+                    ).Else(
+                        NextState("R_ERR")
+                    )
+                )
             )
-        )
         fsm.act("R_OK",
             insert.eq(primitives["R_OK"]),
             If(primitive_stb &
@@ -690,24 +889,345 @@ class LiteSATALinkRX(Module):
             self.to_tx.primitive_stb.eq(primitive_stb),
             self.to_tx.primitive.eq(primitive)
         ]
+        if with_crc_scrambler:
+            self.comb += descrambler.reset.eq(fsm.ongoing("IDLE"))
+
+# link tx cut-through buffer
+
+class LiteSATALinkTXBuffer(Module):
+    """SATA Link TX cut-through buffer
+
+    Start forwarding a packet once threshold data are buffered or the
+    packet is complete, instead of storing the whole packet. If the
+    buffer runs empty during a packet, Link TX inserts HOLD primitives
+    until data are available again.
+
+    Parameters
+    ----------
+    description : description
+        Description of the dataflow.
+    depth : int
+        Depth of the buffer.
+    threshold : int
+        Number of data to buffer before starting a packet (0 when source
+        is able to provide sustained data).
+    """
+    def __init__(self, description, depth, threshold):
+        if threshold > depth:
+            raise ValueError("threshold must be lower or equal to depth")
+        self.sink = sink = Sink(description)
+        self.source = source = Source(description)
+
+        # # #
+
+        fifo = SyncFIFO(description, depth)
+        self.submodules += fifo
+        self.comb += Record.connect(sink, fifo.sink)
+
+        # complete packets in the buffer
+        packets = Signal(max=depth+1)
+        packets_inc = Signal()
+        packets_dec = Signal()
+        self.comb += [
+            packets_inc.eq(sink.stb & sink.eop & sink.ack),
+            packets_dec.eq(source.stb & source.eop & source.ack)
+        ]
+        self.sync += \
+            If(packets_inc & ~packets_dec,
+                packets.eq(packets + 1)
+            ).Elif(~packets_inc & packets_dec,
+                packets.eq(packets - 1)
+            )
+
+        # FSM
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(fifo.source.stb & ((fifo.level >= threshold) | (packets != 0)),
+                NextState("COPY")
+            )
+        )
+        fsm.act("COPY",
+            Record.connect(fifo.source, source),
+            If(source.stb & source.eop & source.ack,
+                NextState("IDLE")
+            )
+        )
+
+# link wide datapath
+
+# depth of the dwords buffer between LiteSATALinkRX and the wide datapath,
+# HOLD is sent when half full: leaves room for the dwords still received
+# before the device sends HOLDA (20 dwords max).
+rx_cdc_buffer_depth = 64
+
+
+class LiteSATALinkDownConverter(Module):
+    """SATA Link down converter
+
+    Convert frames of dw bits to frames of dwords, only valid dwords
+    are forwarded.
+    """
+    def __init__(self, dw):
+        self.sink = sink = Sink(link_description(dw))
+        self.source = source = Source(link_description(32))
+
+        # # #
+
+        n = dw//32
+        mux = Signal(max=n)
+        last = Signal()
+        next_valid = Signal()
+        datas = Array(sink.data[32*i:32*(i+1)] for i in range(n))
+        for i in range(n-1):
+            self.comb += If(mux == i, next_valid.eq(sink.valid[i+1]))
+        self.comb += [
+            last.eq(~next_valid),
+            source.stb.eq(sink.stb),
+            source.sop.eq(sink.sop & (mux == 0)),
+            source.eop.eq(sink.eop & last),
+            source.data.eq(datas[mux]),
+            source.error.eq(sink.error),
+            sink.ack.eq(source.ack & last)
+        ]
+        self.sync += \
+            If(source.stb & source.ack,
+                If(last,
+                    mux.eq(0)
+                ).Else(
+                    mux.eq(mux + 1)
+                )
+            )
+
+
+class LiteSATALinkUpConverter(Module):
+    """SATA Link up converter
+
+    Convert frames of dwords to frames of dw bits, the last data of a
+    frame can be partial (valid).
+    """
+    def __init__(self, dw):
+        self.sink = sink = Sink(link_description(32))
+        self.source = source = Source(link_description(dw))
+
+        # # #
+
+        n = dw//32
+        demux = Signal(max=n)
+        load = Signal()
+        last = Signal()
+        strobe_all = Signal()
+        self.comb += [
+            sink.ack.eq(~strobe_all | source.ack),
+            source.stb.eq(strobe_all),
+            load.eq(sink.stb & sink.ack),
+            last.eq((demux == (n-1)) | sink.eop)
+        ]
+        cases = {}
+        cases[0] = [
+            source.data[:32].eq(sink.data),
+            source.valid.eq(1),
+            source.sop.eq(sink.sop),
+            source.error.eq(sink.error)
+        ]
+        for i in range(1, n):
+            cases[i] = [
+                source.data[32*i:32*(i+1)].eq(sink.data),
+                source.valid[i].eq(1),
+                source.error.eq(source.error | sink.error)
+            ]
+        self.sync += [
+            If(source.ack,
+                strobe_all.eq(0)
+            ),
+            If(load,
+                Case(demux, cases),
+                source.eop.eq(sink.eop),
+                If(last,
+                    demux.eq(0),
+                    strobe_all.eq(1)
+                ).Else(
+                    demux.eq(demux + 1)
+                )
+            )
+        ]
+
+
+class LiteSATALinkWideTX(Module):
+    """SATA Link wide TX datapath
+
+    Buffer frames of dw bits, insert their CRC and scramble them. The
+    frames are then sent on dwords by a LiteSATALinkTX without CRC and
+    scrambler.
+    """
+    def __init__(self, dw, buffer_depth, threshold=None):
+        self.sink = sink = Sink(link_description(dw))
+        self.source = source = Source(link_description(dw))
+
+        # # #
+
+        if threshold is None:
+            buf = Buffer(link_description(dw), buffer_depth)
+        else:
+            buf = LiteSATALinkTXBuffer(link_description(dw), buffer_depth, threshold)
+        crc = LiteSATACRCInserter(link_description(dw))
+        scrambler = LiteSATAScrambler(link_description(dw))
+        pipeline = Pipeline(sink, buf, crc, scrambler, source)
+        self.submodules += buf, crc, scrambler, pipeline
+
+        # scrambler restarts with each frame
+        self.comb += scrambler.reset.eq(scrambler.sink.stb &
+                                        scrambler.sink.eop &
+                                        scrambler.sink.ack)
+
+
+class LiteSATALinkWideRX(Module):
+    """SATA Link wide RX datapath
+
+    Descramble frames of dw bits received by a LiteSATALinkRX without CRC
+    and descrambler, check and remove their CRC and buffer them. The
+    result of the CRC check of each frame is sent to the LiteSATALinkRX
+    (crc_status) that acknowledges the frame with R_OK or R_ERR.
+    """
+    def __init__(self, dw, buffer_depth):
+        self.sink = sink = Sink(link_description(dw))
+        self.source = source = Source(link_description(dw))
+        self.crc_status = Source(crc_status)
+        self.almost_full = Signal()
+
+        # # #
+
+        descrambler = LiteSATAScrambler(link_description(dw))
+        crc = LiteSATACRCChecker(link_description(dw))
+        buf = Buffer(link_description(dw), buffer_depth,
+                     almost_full=3*buffer_depth//4)
+        pipeline = Pipeline(sink, descrambler, crc, buf, source)
+        self.submodules += descrambler, crc, buf, pipeline
+
+        # descrambler restarts with each frame
+        self.comb += descrambler.reset.eq(descrambler.sink.stb &
+                                          descrambler.sink.eop &
+                                          descrambler.sink.ack)
+
+        self.comb += [
+            self.crc_status.stb.eq(crc.source.stb & crc.source.eop & crc.source.ack),
+            self.crc_status.error.eq(crc.source.error),
+            self.almost_full.eq(buf.almost_full)
+        ]
 
 # link
 
 class LiteSATALink(Module):
-    def __init__(self, phy, buffer_depth):
-        # tx
-        self.submodules.tx_buffer = Buffer(link_description(32), buffer_depth)
-        self.submodules.tx = BufferizeEndpoints("source")(LiteSATALinkTX())
-        self.submodules.tx_cont = LiteSATACONTInserter(phy_description(32))
-        self.submodules.tx_pipeline = Pipeline(self.tx_buffer, self.tx, self.tx_cont, phy)
-
-        # rx
-        self.submodules.rx_cont = LiteSATACONTRemover(phy_description(32))
-        self.submodules.rx = BufferizeEndpoints("sink")(LiteSATALinkRX())
-        self.submodules.rx_buffer = Buffer(link_description(32), buffer_depth,
-                                                 almost_full=3*buffer_depth//4)
-        self.comb += self.rx.hold.eq(self.rx_buffer.almost_full)
-        self.submodules.rx_pipeline = Pipeline(phy, self.rx_cont, self.rx, self.rx_buffer)
+    """SATA Link
+
+    Primitives are handled on dwords in the "sys" clock domain, which
+    must run at the dword rate of the link (150MHz for a SATA Gen3 link).
+    With dw > 32 and/or clock_domain, frames are buffered, CRC checked/
+    inserted and (de)scrambled on dw bits in clock_domain: only the
+    primitives handling and the width conversion then run at the dword
+    rate, the user side can run at sys_clk*32/dw (ex: 64 bits @ 75MHz
+    for SATA Gen3). Received dwords are buffered in sys and HOLD is sent
+    when the wide datapath stalls.
+
+    Parameters
+    ----------
+    phy : phy
+        SATA PHY.
+    buffer_depth : int
+        Depth of the RX buffer (and of the TX buffer if tx_buffer_depth
+        is not specified), in dwords.
+    tx_buffer_depth : int
+        Depth of the TX buffer, in dwords.
+    tx_threshold : int
+        When None, the TX buffer stores complete packets before sending
+        them (store-and-forward). Otherwise, packets are sent once
+        tx_threshold dwords are buffered (cut-through), which reduces
+        latency and allows a smaller TX buffer.
+    dw : int
+        Width of the user datapath (32, 64 or 128).
+    clock_domain : str
+        Clock domain of the user datapath, must provide at least the
+        bandwidth of the link (clk*dw >= sys_clk*32).
+    """
+    def __init__(self, phy, buffer_depth, tx_buffer_depth=None, tx_threshold=None,
+                 dw=32, clock_domain="sys"):
+        if tx_buffer_depth is None:
+            tx_buffer_depth = buffer_depth
+
+        if dw == 32 and clock_domain == "sys":
+            # tx
+            if tx_threshold is None:
+                self.submodules.tx_buffer = Buffer(link_description(32), tx_buffer_depth)
+            else:
+                self.submodules.tx_buffer = LiteSATALinkTXBuffer(link_description(32),
+                                                                 tx_buffer_depth,
+                                                                 tx_threshold)
+            self.submodules.tx = BufferizeEndpoints("source")(LiteSATALinkTX())
+            self.submodules.tx_cont = LiteSATACONTInserter(phy_description(32))
+            self.submodules.tx_pipeline = Pipeline(self.tx_buffer, self.tx, self.tx_cont, phy)
+
+            # rx
+            self.submodules.rx_cont = LiteSATACONTRemover(phy_description(32))
+            self.submodules.rx = BufferizeEndpoints("sink")(LiteSATALinkRX())
+            self.submodules.rx_buffer = Buffer(link_description(32), buffer_depth,
+                                                     almost_full=3*buffer_depth//4)
+            self.comb += self.rx.hold.eq(self.rx_buffer.almost_full)
+            self.submodules.rx_pipeline = Pipeline(phy, self.rx_cont, self.rx, self.rx_buffer)
+        else:
+            n = dw//32
+            if tx_threshold is not None:
+                tx_threshold //= n
+            cdc = clock_domain != "sys"
+
+            # tx
+            tx_wide = LiteSATALinkWideTX(dw, tx_buffer_depth//n, tx_threshold)
+            tx_modules = [ClockDomainsRenamer(clock_domain)(tx_wide)]
+            if cdc:
+                tx_cdc = AsyncFIFO(link_description(dw), 8)
+                tx_cdc = ClockDomainsRenamer({"write": clock_domain, "read": "sys"})(tx_cdc)
+                tx_modules.append(tx_cdc)
+            if n > 1:
+                tx_modules.append(LiteSATALinkDownConverter(dw))
+            self.submodules += tx_modules
+            self.submodules.tx = BufferizeEndpoints("source")(LiteSATALinkTX(False))
+            self.submodules.tx_cont = LiteSATACONTInserter(phy_description(32))
+            self.submodules.tx_pipeline = Pipeline(*tx_modules, self.tx, self.tx_cont, phy)
+
+            # rx
+            self.submodules.rx_cont = LiteSATACONTRemover(phy_description(32))
+            self.submodules.rx = BufferizeEndpoints("sink")(LiteSATALinkRX(False))
+            # LiteSATALinkRX does not handle backpressure: buffer dwords
+            # in sys and send HOLD before the buffer gets full, the
+            # converter and the CDC FIFO can then stall (ex: bandwidth
+            # matched clock_domain or busy wide datapath).
+            rx_buffer = Buffer(link_description(32), rx_cdc_buffer_depth,
+                               almost_full=rx_cdc_buffer_depth//2)
+            rx_modules = [rx_buffer]
+            if n > 1:
+                rx_modules.append(LiteSATALinkUpConverter(dw))
+            if cdc:
+                rx_cdc = AsyncFIFO(link_description(dw), 8)
+                rx_cdc = ClockDomainsRenamer({"write": "sys", "read": clock_domain})(rx_cdc)
+                rx_modules.append(rx_cdc)
+            rx_wide = LiteSATALinkWideRX(dw, buffer_depth//n)
+            rx_modules.append(ClockDomainsRenamer(clock_domain)(rx_wide))
+            self.submodules += rx_modules
+            self.submodules.rx_pipeline = Pipeline(phy, self.rx_cont, self.rx, *rx_modules)
+
+            # crc status / hold
+            if cdc:
+                crc_status_fifo = AsyncFIFO(crc_status, 4)
+                crc_status_fifo = ClockDomainsRenamer({"write": clock_domain, "read": "sys"})(crc_status_fifo)
+                rx_wide_almost_full = Signal()
+                self.specials += MultiReg(rx_wide.almost_full, rx_wide_almost_full)
+            else:
+                crc_status_fifo = SyncFIFO(crc_status, 4)
+                rx_wide_almost_full = rx_wide.almost_full
+            self.submodules += crc_status_fifo
+            self.comb += [
+                self.rx.hold.eq(rx_buffer.almost_full | rx_wide_almost_full),
+                Record.connect(rx_wide.crc_status, crc_status_fifo.sink),
+                Record.connect(crc_status_fifo.source, self.rx.crc_status)
+            ]
 
         # rx --> tx
         self.comb += Record.connect(self.rx.to_tx, self.tx.from_rx)
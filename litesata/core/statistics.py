@@ -0,0 +1,230 @@
+from collections import OrderedDict
+
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+
+class LiteSATACoreStatistics(Module, AutoCSR):
+    """SATA Core statistics
+
+    64 bits performance counters of a LiteSATACore. Counters are free
+    running, a write to snapshot latches all of them in their CSRs
+    for an atomic readout without stopping the traffic.
+
+    Counters:
+        - write/read/identify/flush_cmds: commands issued
+        - write/read/identify/flush_cmds_done: commands completed
+        - failed_cmds: commands completed with failed set
+        - tx_bytes/rx_bytes: data bytes written/read, tx_bytes only
+          counts data sent in DATA FISes (not data of failed writes
+          drained by the Command layer)
+        - tx_holds/tx_holdas: HOLD/HOLDA primitives sent by the link
+        - rx_holds/rx_holdas: HOLD/HOLDA primitives received by the link
+        - r_errs: frames rejected by the device (R_ERR received)
+        - crc_errors: frames received with CRC errors (R_ERR sent)
+        - busy_cycles/idle_cycles: cycles with/without outstanding commands
+    """
+    def __init__(self, link, transport, command):
+        self._snapshot = CSR()
+
+        # # #
+
+        cmd = command.sink
+        rsp = command.source
+        data = transport.sink
+        tx = link.tx.source
+        rx = link.rx.sink
+
+        def primitive(endpoint, name):
+            return (endpoint.stb & endpoint.ack &
+                    (endpoint.charisk == 0b0001) &
+                    (endpoint.data == primitives[name]))
+
+        issued = Signal()
+        completed = Signal()
+        self.comb += [
+            issued.eq(cmd.stb & cmd.sop & cmd.ack),
+            completed.eq(rsp.stb & rsp.last & rsp.eop & rsp.ack)
+        ]
+
+        outstanding = Signal(8)
+        self.sync += \
+            If(issued & ~completed,
+                outstanding.eq(outstanding + 1)
+            ).Elif(~issued & completed,
+                outstanding.eq(outstanding - 1)
+            )
+        busy = Signal()
+        self.comb += busy.eq(outstanding != 0)
+
+        events = OrderedDict()
+        events["write_cmds"] = (issued & cmd.write, 1)
+        events["read_cmds"] = (issued & cmd.read, 1)
+        events["identify_cmds"] = (issued & cmd.identify, 1)
+        events["flush_cmds"] = (issued & cmd.flush, 1)
+        events["write_cmds_done"] = (completed & rsp.write, 1)
+        events["read_cmds_done"] = (completed & rsp.read, 1)
+        events["identify_cmds_done"] = (completed & rsp.identify, 1)
+        events["flush_cmds_done"] = (completed & rsp.flush, 1)
+        events["failed_cmds"] = (completed & rsp.failed, 1)
+        events["tx_bytes"] = (data.stb & data.ack & (data.type == fis_types["DATA"]), len(data.data)//8)
+        events["rx_bytes"] = (rsp.stb & rsp.ack & ((rsp.read & ~rsp.last) | rsp.identify), len(rsp.data)//8)
+        events["tx_holds"] = (primitive(tx, "HOLD"), 1)
+        events["tx_holdas"] = (primitive(tx, "HOLDA"), 1)
+        events["rx_holds"] = (primitive(rx, "HOLD"), 1)
+        events["rx_holdas"] = (primitive(rx, "HOLDA"), 1)
+        events["r_errs"] = (link.tx.r_err, 1)
+        events["crc_errors"] = (link.rx.crc_error, 1)
+        events["busy_cycles"] = (busy, 1)
+        events["idle_cycles"] = (~busy, 1)
+
+        for name, (event, increment) in events.items():
+            counter = Signal(64, name=name)
+            csr = CSRStatus(64, name=name)
+            setattr(self, name, counter)
+            setattr(self, "_" + name, csr)
+            self.sync += [
+                If(event,
+                    counter.eq(counter + increment)
+                ),
+                If(self._snapshot.re,
+                    csr.status.eq(counter)
+                )
+            ]
+
+
+class LiteSATALatencyHistogram(Module, AutoCSR):
+    """SATA commands latency histogram
+
+    Measure the latency of the commands of a port (LiteSATACommand or
+    LiteSATAUserPort) from command acceptation on port.sink to final
+    completion (last) on port.source, in system clock cycles.
+
+    Latencies are accumulated in log2 spaced buckets: bucket 0 counts
+    latencies < 2, bucket i latencies in [2**i, 2**(i+1)[ and the last
+    bucket all latencies >= 2**(nbuckets-1). Minimum, maximum, sum and
+    number of commands are also provided. A write to clear resets the
+    histogram, buckets are read by writing their index to bucket_sel. A
+    write to snapshot latches min, max, sum and count in their CSRs for an
+    atomic readout.
+
+    Completions are expected in commands' order (not suitable for NCQ),
+    with up to queue_depth outstanding commands (the depth of the
+    crossbar's arbiter queue by default). When more commands are
+    outstanding, overflow is set and measurements are suspended until
+    the port is idle again.
+    """
+    def __init__(self, port, nbuckets=32, queue_depth=arbiter_queue_depth):
+        self._clear = CSR()
+        self._snapshot = CSR()
+        self._bucket_sel = CSRStorage(bits_for(nbuckets-1))
+        self._bucket_count = CSRStatus(32)
+        self._min = CSRStatus(32)
+        self._max = CSRStatus(32)
+        self._sum = CSRStatus(64)
+        self._count = CSRStatus(32)
+        self._overflow = CSRStatus()
+
+        self.overflow = Signal()
+        self.min = Signal(32, reset=2**32-1)
+        self.max = Signal(32)
+        self.sum = Signal(64)
+        self.count = Signal(32)
+        self.buckets = []
+        for i in range(nbuckets):
+            bucket = Signal(32, name="bucket{}".format(i))
+            setattr(self, "bucket{}".format(i), bucket)
+            self.buckets.append(bucket)
+
+        # # #
+
+        sink, source = port.sink, port.source
+
+        timestamp = Signal(32)
+        self.sync += timestamp.eq(timestamp + 1)
+
+        start = Signal()
+        done = Signal()
+        self.comb += [
+            start.eq(sink.stb & sink.sop & sink.ack),
+            done.eq(source.stb & source.last & source.eop & source.ack)
+        ]
+
+        # timestamps of outstanding commands
+        fifo = SyncFIFO([("timestamp", 32)], queue_depth)
+        self.submodules += fifo
+
+        # a timestamp can't be stored when more than queue_depth commands
+        # are outstanding: measurements are suspended until all outstanding
+        # commands are completed (timestamps FIFO is then empty).
+        outstanding = Signal(16)
+        self.sync += \
+            If(start & ~done,
+                outstanding.eq(outstanding + 1)
+            ).Elif(~start & done,
+                outstanding.eq(outstanding - 1)
+            )
+        suspended = Signal()
+        self.sync += \
+            If(start & ~fifo.sink.ack,
+                suspended.eq(1)
+            ).Elif(outstanding == 0,
+                suspended.eq(0)
+            )
+
+        self.comb += [
+            fifo.sink.stb.eq(start & (~suspended | (outstanding == 0))),
+            fifo.sink.timestamp.eq(timestamp),
+            fifo.source.ack.eq(done)
+        ]
+
+        latency = Signal(32)
+        self.comb += latency.eq(timestamp - fifo.source.timestamp)
+
+        bucket = Signal(max=nbuckets)
+        for i in range(1, nbuckets):
+            self.comb += If(latency >= 2**i, bucket.eq(i))
+
+        update = Signal()
+        clear = Signal()
+        self.comb += [
+            update.eq(done & fifo.source.stb & ~suspended),
+            clear.eq(self._clear.re)
+        ]
+        self.sync += \
+            If(clear,
+                self.overflow.eq(0)
+            ).Elif(start & ~fifo.sink.ack,
+                self.overflow.eq(1)
+            )
+        self.sync += \
+            If(clear,
+                self.min.eq(2**32-1),
+                self.max.eq(0),
+                self.sum.eq(0),
+                self.count.eq(0),
+                [b.eq(0) for b in self.buckets]
+            ).Elif(update,
+                If(latency < self.min,
+                    self.min.eq(latency)
+                ),
+                If(latency > self.max,
+                    self.max.eq(latency)
+                ),
+                self.sum.eq(self.sum + latency),
+                self.count.eq(self.count + 1),
+                [If(bucket == i, b.eq(b + 1)) for i, b in enumerate(self.buckets)]
+            )
+
+        self.comb += [
+            self._bucket_count.status.eq(Array(self.buckets)[self._bucket_sel.storage]),
+            self._overflow.status.eq(self.overflow)
+        ]
+        self.sync += \
+            If(self._snapshot.re,
+                self._min.status.eq(self.min),
+                self._max.status.eq(self.max),
+                self._sum.status.eq(self.sum),
+                self._count.status.eq(self.count)
+            )
@@ -4,19 +4,26 @@ from litesata.common import *
 def test_type(name, signal):
     return signal == fis_types[name]
 
+
+def ndatas(ndwords, dw):
+    return ceil(ndwords*32/dw)
+
 # transport tx
 
 class LiteSATATransportTX(Module):
-    def __init__(self, link):
-        self.sink = sink = Sink(transport_tx_description(32))
+    def __init__(self, link, dw=32):
+        self.sink = sink = Sink(transport_tx_description(dw))
 
         # # #
 
+        n = dw//32
+
         cmd_ndwords = max(fis_reg_h2d_header.length,
                           fis_data_header.length)
-        encoded_cmd = Signal(cmd_ndwords*32)
+        cmd_ndatas = ndatas(cmd_ndwords, dw)
+        encoded_cmd = Signal(cmd_ndatas*dw)
 
-        counter = Signal(max=cmd_ndwords+1)
+        counter = Signal(max=cmd_ndatas+1)
         counter_ce = Signal()
         counter_reset = Signal()
         self.sync += \
@@ -27,6 +34,7 @@ class LiteSATATransportTX(Module):
             )
 
         cmd_len = Signal(len(counter))
+        cmd_last_valid = Signal(n)
         cmd_with_data = Signal()
 
         cmd_send = Signal()
@@ -60,9 +68,15 @@ class LiteSATATransportTX(Module):
         self.sync += \
             If(update_fis_type, fis_type.eq(link.source.data[:8]))
 
+        # with dw > 32, the last data of the header is partial and the
+        # header of a DATA FIS is sent alone in the first data.
+        def last_valid(ndwords):
+            return 2**(ndwords - n*(ndatas(ndwords, dw) - 1)) - 1
+
         fsm.act("SEND_CTRL_CMD",
             fis_reg_h2d_header.encode(sink, encoded_cmd),
-            cmd_len.eq(fis_reg_h2d_header.length-1),
+            cmd_len.eq(ndatas(fis_reg_h2d_header.length, dw)-1),
+            cmd_last_valid.eq(last_valid(fis_reg_h2d_header.length)),
             cmd_send.eq(1),
             If(cmd_done,
                 sink.ack.eq(1),
@@ -72,7 +86,8 @@ class LiteSATATransportTX(Module):
         fsm.act("SEND_DATA_CMD",
             sink.ack.eq(0),
             fis_data_header.encode(sink, encoded_cmd),
-            cmd_len.eq(fis_data_header.length-1),
+            cmd_len.eq(ndatas(fis_data_header.length, dw)-1),
+            cmd_last_valid.eq(last_valid(fis_data_header.length)),
             cmd_with_data.eq(1),
             cmd_send.eq(1),
             If(cmd_done,
@@ -88,8 +103,8 @@ class LiteSATATransportTX(Module):
         )
 
         cmd_cases = {}
-        for i in range(cmd_ndwords):
-            cmd_cases[i] = [link.sink.data.eq(encoded_cmd[32*i:32*(i+1)])]
+        for i in range(cmd_ndatas):
+            cmd_cases[i] = [link.sink.data.eq(encoded_cmd[dw*i:dw*(i+1)])]
 
         self.comb += [
             counter_ce.eq(sink.stb & link.sink.ack),
@@ -108,22 +123,34 @@ class LiteSATATransportTX(Module):
                 link.sink.data.eq(sink.data)
             )
         ]
+        if n > 1:
+            self.comb += \
+                If(cmd_send & (counter == cmd_len),
+                    link.sink.valid.eq(cmd_last_valid)
+                ).Else(
+                    link.sink.valid.eq(2**n-1)
+                )
 
 # transport rx
 
 class LiteSATATransportRX(Module):
-    def __init__(self, link):
-        self.source = source = Source(transport_rx_description(32))
+    def __init__(self, link, dw=32):
+        self.source = source = Source(transport_rx_description(dw))
 
         # # #
 
+        n = dw//32
+
         cmd_ndwords = max(fis_reg_d2h_header.length,
                           fis_dma_activate_d2h_header.length,
+                          fis_dma_setup_header.length,
                           fis_pio_setup_d2h_header.length,
+                          fis_set_device_bits_d2h_header.length,
                           fis_data_header.length)
-        encoded_cmd = Signal(cmd_ndwords*32)
+        cmd_ndatas = ndatas(cmd_ndwords, dw)
+        encoded_cmd = Signal(cmd_ndatas*dw)
 
-        counter = Signal(max=cmd_ndwords+1)
+        counter = Signal(max=cmd_ndatas+1)
         counter_ce = Signal()
         counter_reset = Signal()
         self.sync += \
@@ -159,8 +186,12 @@ class LiteSATATransportRX(Module):
                     NextState("RECEIVE_CTRL_CMD")
                 ).Elif(test_type_rx("DMA_ACTIVATE_D2H"),
                     NextState("RECEIVE_CTRL_CMD")
+                ).Elif(test_type_rx("DMA_SETUP"),
+                    NextState("RECEIVE_CTRL_CMD")
                 ).Elif(test_type_rx("PIO_SETUP_D2H"),
                     NextState("RECEIVE_CTRL_CMD")
+                ).Elif(test_type_rx("SET_DEVICE_BITS_D2H"),
+                    NextState("RECEIVE_CTRL_CMD")
                 ).Elif(test_type_rx("DATA"),
                     NextState("RECEIVE_DATA_CMD"),
                 ).Else(
@@ -175,11 +206,15 @@ class LiteSATATransportRX(Module):
 
         fsm.act("RECEIVE_CTRL_CMD",
             If(test_type("REG_D2H", fis_type),
-                cmd_len.eq(fis_reg_d2h_header.length-1)
+                cmd_len.eq(ndatas(fis_reg_d2h_header.length, dw)-1)
             ).Elif(test_type("DMA_ACTIVATE_D2H", fis_type),
-                cmd_len.eq(fis_dma_activate_d2h_header.length-1)
+                cmd_len.eq(ndatas(fis_dma_activate_d2h_header.length, dw)-1)
+            ).Elif(test_type("DMA_SETUP", fis_type),
+                cmd_len.eq(ndatas(fis_dma_setup_header.length, dw)-1)
+            ).Elif(test_type("SET_DEVICE_BITS_D2H", fis_type),
+                cmd_len.eq(ndatas(fis_set_device_bits_d2h_header.length, dw)-1)
             ).Else(
-                cmd_len.eq(fis_pio_setup_d2h_header.length-1)
+                cmd_len.eq(ndatas(fis_pio_setup_d2h_header.length, dw)-1)
             ),
             cmd_receive.eq(1),
             link.source.ack.eq(1),
@@ -195,6 +230,10 @@ class LiteSATATransportRX(Module):
                 fis_reg_d2h_header.decode(encoded_cmd, source)
             ).Elif(test_type("DMA_ACTIVATE_D2H", fis_type),
                 fis_dma_activate_d2h_header.decode(encoded_cmd, source)
+            ).Elif(test_type("DMA_SETUP", fis_type),
+                fis_dma_setup_header.decode(encoded_cmd, source)
+            ).Elif(test_type("SET_DEVICE_BITS_D2H", fis_type),
+                fis_set_device_bits_d2h_header.decode(encoded_cmd, source)
             ).Else(
                 fis_pio_setup_d2h_header.decode(encoded_cmd, source)
             ),
@@ -203,7 +242,7 @@ class LiteSATATransportRX(Module):
             )
         )
         fsm.act("RECEIVE_DATA_CMD",
-            cmd_len.eq(fis_data_header.length-1),
+            cmd_len.eq(ndatas(fis_data_header.length, dw)-1),
             cmd_receive.eq(1),
             link.source.ack.eq(1),
             If(cmd_done,
@@ -217,7 +256,6 @@ class LiteSATATransportRX(Module):
             source.sop.eq(data_sop),
             source.eop.eq(link.source.eop),
             source.error.eq(link.source.error),
-            source.data.eq(link.source.data),
             link.source.ack.eq(source.ack),
             If(source.stb & source.eop & source.ack,
                 NextState("IDLE")
@@ -233,9 +271,23 @@ class LiteSATATransportRX(Module):
                 )
             )
 
+        # with dw > 32, the payload of a DATA FIS starts in the first
+        # data (after the header dword): data are realigned on the
+        # payload, which is a multiple of dw bits (sectors), the last
+        # data then only contains the end of the payload.
+        if n == 1:
+            self.comb += source.data.eq(link.source.data)
+        else:
+            last_data = Signal(dw)
+            self.sync += \
+                If(link.source.stb & link.source.ack,
+                    last_data.eq(link.source.data)
+                )
+            self.comb += source.data.eq(Cat(last_data[32:], link.source.data[:32]))
+
         cmd_cases = {}
-        for i in range(cmd_ndwords):
-            cmd_cases[i] = [encoded_cmd[32*i:32*(i+1)].eq(link.source.data)]
+        for i in range(cmd_ndatas):
+            cmd_cases[i] = [encoded_cmd[dw*i:dw*(i+1)].eq(link.source.data)]
 
         self.comb += \
             If(cmd_receive & link.source.stb,
@@ -250,7 +302,7 @@ class LiteSATATransportRX(Module):
 # transport
 
 class LiteSATATransport(Module):
-    def __init__(self, link):
-        self.submodules.tx = LiteSATATransportTX(link)
-        self.submodules.rx = LiteSATATransportRX(link)
+    def __init__(self, link, dw=32):
+        self.submodules.tx = LiteSATATransportTX(link, dw)
+        self.submodules.rx = LiteSATATransportRX(link, dw)
         self.sink, self.source = self.tx.sink, self.rx.source
@@ -1,4 +1,10 @@
 from litesata.common import *
 from litesata.frontend.arbitration import LiteSATAArbiter, LiteSATACrossbar
-from litesata.frontend.raid import LiteSATAStriping, LiteSATAMirroring
+from litesata.frontend.raid import LiteSATAStriping, LiteSATAChunkedStriping, LiteSATAParity
+from litesata.frontend.raid import LiteSATAMirroring
+from litesata.frontend.splitter import LiteSATASplitter
+from litesata.frontend.dma import LiteSATADMA
+from litesata.frontend.adapters import LiteSATAAXIStreamAdapter, LiteSATAAvalonSTAdapter
+from litesata.frontend.readahead import LiteSATAReadAhead
+from litesata.frontend.cache import LiteSATAWriteBackCache
 from litesata.frontend.bist import LiteSATABIST
@@ -0,0 +1,122 @@
+from litesata.common import *
+
+
+def axi_stream_layout(dw, user_width):
+    return [
+        ("tvalid", 1),
+        ("tready", 1),
+        ("tdata", dw),
+        ("tlast", 1),
+        ("tuser", user_width)
+    ]
+
+
+def avalon_st_layout(dw):
+    return [
+        ("valid", 1),
+        ("ready", 1),
+        ("data", dw),
+        ("startofpacket", 1),
+        ("endofpacket", 1)
+    ]
+
+
+class _LiteSATAStreamAdapter(Module):
+    def __init__(self, user_port, register):
+        cmd_source, cmd_sink = user_port.sink, user_port.source
+
+        # optional register slices (full throughput FIFOs cutting
+        # the combinatorial paths between the user and the port)
+        if register:
+            tx_fifo = SyncFIFO(cmd_source.description, 2)
+            rx_fifo = SyncFIFO(cmd_sink.description, 2)
+            self.submodules += tx_fifo, rx_fifo
+            self.comb += [
+                Record.connect(tx_fifo.source, cmd_source),
+                Record.connect(cmd_sink, rx_fifo.sink)
+            ]
+            self.tx, self.rx = tx_fifo.sink, rx_fifo.source
+        else:
+            self.tx, self.rx = cmd_source, cmd_sink
+
+
+class LiteSATAAXIStreamAdapter(_LiteSATAStreamAdapter):
+    """SATA AXI4-Stream adapter
+
+    Expose a user port as AXI4-Stream interfaces: commands are received
+    on sink (slave) and responses are sent on source (master). TLAST
+    frames the packets, command/response parameters (write, read,
+    identify, sector, count, ... as in command_tx_description and
+    command_rx_description) are carried on TUSER, packed in description
+    order from the LSB.
+
+    Adapters transfer one beat per cycle. With register, register slices
+    are inserted on both directions for timing.
+    """
+    def __init__(self, user_port, register=False):
+        dw = user_port.dw
+        self.sink = Record(axi_stream_layout(dw, len(user_port.sink.param)))
+        self.source = Record(axi_stream_layout(dw, len(user_port.source.param)))
+
+        # # #
+
+        _LiteSATAStreamAdapter.__init__(self, user_port, register)
+        sink, source, tx, rx = self.sink, self.source, self.tx, self.rx
+
+        # start of packet: beat following a last beat
+        first = Signal(reset=1)
+        self.sync += \
+            If(tx.stb & tx.ack,
+                first.eq(tx.eop)
+            )
+
+        self.comb += [
+            tx.stb.eq(sink.tvalid),
+            sink.tready.eq(tx.ack),
+            tx.sop.eq(first),
+            tx.eop.eq(sink.tlast),
+            tx.data.eq(sink.tdata),
+            tx.param.raw_bits().eq(sink.tuser),
+
+            source.tvalid.eq(rx.stb),
+            rx.ack.eq(source.tready),
+            source.tlast.eq(rx.eop),
+            source.tdata.eq(rx.data),
+            source.tuser.eq(rx.param.raw_bits())
+        ]
+
+
+class LiteSATAAvalonSTAdapter(_LiteSATAStreamAdapter):
+    """SATA Avalon-ST adapter
+
+    Expose a user port as Avalon-ST interfaces (ready latency of 0):
+    commands are received on sink and responses are sent on source.
+    Avalon-ST has no side-band signal for the command/response parameters,
+    they are carried on the MSBs of data, above the dw bits of payload.
+
+    Adapters transfer one beat per cycle. With register, register slices
+    are inserted on both directions for timing.
+    """
+    def __init__(self, user_port, register=False):
+        dw = user_port.dw
+        self.sink = Record(avalon_st_layout(dw + len(user_port.sink.param)))
+        self.source = Record(avalon_st_layout(dw + len(user_port.source.param)))
+
+        # # #
+
+        _LiteSATAStreamAdapter.__init__(self, user_port, register)
+        sink, source, tx, rx = self.sink, self.source, self.tx, self.rx
+
+        self.comb += [
+            tx.stb.eq(sink.valid),
+            sink.ready.eq(tx.ack),
+            tx.sop.eq(sink.startofpacket),
+            tx.eop.eq(sink.endofpacket),
+            Cat(tx.data, tx.param.raw_bits()).eq(sink.data),
+
+            source.valid.eq(rx.stb),
+            rx.ack.eq(source.ready),
+            source.startofpacket.eq(rx.sop),
+            source.endofpacket.eq(rx.eop),
+            source.data.eq(Cat(rx.data, rx.param.raw_bits()))
+        ]
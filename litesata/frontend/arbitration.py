@@ -1,7 +1,10 @@
 from litesata.common import *
+from litesata.frontend.splitter import LiteSATASplitter
 
 from litex.gen.genlib.roundrobin import *
 
+from litex.soc.interconnect.csr import *
+
 
 class LiteSATAMasterPort:
     def __init__(self, dw):
@@ -17,9 +20,9 @@ class LiteSATAMasterPort:
 
 
 class LiteSATASlavePort:
-    def __init__(self, dw):
+    def __init__(self, dw, count_width=16):
         self.dw = dw
-        self.sink = Sink(command_tx_description(dw))
+        self.sink = Sink(command_tx_description(dw, count_width))
         self.source = Source(command_rx_description(dw))
 
     def connect(self, master):
@@ -30,80 +33,359 @@ class LiteSATASlavePort:
 
 
 class LiteSATAUserPort(LiteSATASlavePort):
-    def __init__(self, dw, controller_dw=None):
+    def __init__(self, dw, controller_dw=None, ndrives=1, count_width=16):
         self.controller_dw = dw if controller_dw is None else controller_dw
-        LiteSATASlavePort.__init__(self, dw)
+        self.ndrives = ndrives
+        LiteSATASlavePort.__init__(self, dw, count_width)
+
+
+class LiteSATAPriorityPolicy(Module):
+    """Strict priority arbitration
+
+    When the granted port releases its request, the requesting port with
+    the highest priority is granted (lowest index on equal priorities).
+    """
+    def __init__(self, n, priorities):
+        self.request = Signal(n)
+        self.grant = Signal(max=max(2, n))
+        self.served = Signal()
+        self.cost = Signal(16)
+
+        # # #
+
+        order = sorted(range(n), key=lambda i: priorities[i], reverse=True)
+        next_grant = Signal(max=max(2, n))
+        self.comb += next_grant.eq(self.grant)
+        for i in reversed(order):
+            self.comb += If(self.request[i], next_grant.eq(i))
+        self.sync += If(~self.request[self.grant], self.grant.eq(next_grant))
+
+
+class LiteSATAWeightedPolicy(Module):
+    """Weighted round-robin arbitration
+
+    Each port has weights[i] credits per round, a credit is consumed by
+    each command. Ports with credits left are granted in round-robin
+    order, credits are reloaded when no requesting port has credits.
+    """
+    def __init__(self, n, weights):
+        self.request = Signal(n)
+        self.grant = Signal(max=max(2, n))
+        self.served = Signal()
+        self.cost = Signal(16)
+        self.weights = [Signal(16, reset=w) for w in weights]
+
+        # # #
+
+        rr = RoundRobin(n, SP_CE)
+        self.submodules += rr
+
+        credits = [Signal(16, reset=w) for w in weights]
+        has_credits = Signal(n)
+        reload = Signal()
+        self.comb += [
+            has_credits.eq(Cat(*[c != 0 for c in credits])),
+            reload.eq((self.request & has_credits) == 0),
+            If(reload,
+                rr.request.eq(self.request)
+            ).Else(
+                rr.request.eq(self.request & has_credits)
+            ),
+            rr.ce.eq(~self.request[self.grant]),
+            self.grant.eq(rr.grant)
+        ]
+        for i in range(n):
+            served = Signal()
+            self.comb += served.eq(self.served & (self.grant == i))
+            self.sync += \
+                If(reload,
+                    credits[i].eq(self.weights[i] - served)
+                ).Elif(served & (credits[i] != 0),
+                    credits[i].eq(credits[i] - 1)
+                )
+
+
+class LiteSATADeficitPolicy(Module):
+    """Deficit round-robin arbitration (by sector count)
+
+    Each port receives a quantum of weights[i] sectors per round, the
+    sector count of each command is deducted from the port's deficit.
+    Ports with a positive deficit are granted in round-robin order,
+    requesting ports are given a new quantum when none has a positive
+    deficit. As in standard DRR, the remaining (positive) deficit of a
+    port is cleared when it stops requesting.
+    """
+    def __init__(self, n, weights):
+        self.request = Signal(n)
+        self.grant = Signal(max=max(2, n))
+        self.served = Signal()
+        self.cost = Signal(16)
+        self.weights = [Signal(16, reset=w) for w in weights]
+
+        # # #
+
+        rr = RoundRobin(n, SP_CE)
+        self.submodules += rr
+
+        deficits = [Signal((32, True)) for i in range(n)]
+        positive = Signal(n)
+        replenish = Signal()
+        self.comb += [
+            positive.eq(Cat(*[d > 0 for d in deficits])),
+            replenish.eq((self.request & positive) == 0),
+            If(replenish,
+                rr.request.eq(self.request)
+            ).Else(
+                rr.request.eq(self.request & positive)
+            ),
+            rr.ce.eq(~self.request[self.grant]),
+            self.grant.eq(rr.grant)
+        ]
+        for i in range(n):
+            cost = Signal(16)
+            quantum = Signal(16)
+            deficit = Signal((32, True))
+            self.comb += [
+                If(self.served & (self.grant == i),
+                    cost.eq(self.cost)
+                ),
+                If(replenish & self.request[i],
+                    quantum.eq(self.weights[i])
+                ),
+                deficit.eq(deficits[i] + quantum - cost)
+            ]
+            self.sync += \
+                If(~self.request[i] & (deficit > 0),
+                    deficits[i].eq(0)
+                ).Else(
+                    deficits[i].eq(deficit)
+                )
 
 
 class LiteSATAArbiter(Module):
-    def __init__(self, users, master):
-        self.rr = RoundRobin(len(users))
-        self.submodules += self.rr
-        self.grant = self.rr.grant
-        cases = {}
+    """SATA Arbiter
+
+    Grant is only kept by a port while its command is sent, the next
+    command can then be presented to the controller while the previous
+    one is still executing. Responses are routed back to the ports
+    in commands' order (queue_depth commands can be outstanding).
+
+    With tagged (NCQ controllers, completing out of order), responses
+    are instead routed on their tag. The ntags tags of the controller
+    are split in equal power of 2 ranges, one per port: the port index
+    is prefixed to the low bits of the port's tag on commands and
+    removed from responses, so each port uses tags 0 to
+    port_ntags-1 independently of the others.
+
+    Arbitration policies:
+        - "roundrobin": ports are granted in turn.
+        - "priority": strict priority (weights are priorities).
+        - "weighted": weighted round-robin (weights are commands per round).
+        - "deficit": deficit round-robin (weights are sectors per round).
+    """
+    def __init__(self, users, master, queue_depth=arbiter_queue_depth, policy="roundrobin", weights=None,
+                 tagged=False, ntags=ncq_max_tags):
+        n = len(users)
+        if tagged:
+            port_bits = log2_int(n, need_pow2=False)
+            local_bits = bits_for(ntags) - 1 - port_bits
+            if local_bits < 0:
+                raise ValueError("{} tags can't be shared by {} ports".format(ntags, n))
+            self.port_ntags = 2**local_bits
+        if weights is None:
+            weights = [1]*n
+        if policy == "roundrobin":
+            self.rr = RoundRobin(n)
+            self.submodules += self.rr
+            self.policy = self.rr
+        elif policy == "priority":
+            self.submodules.policy = LiteSATAPriorityPolicy(n, weights)
+        elif policy == "weighted":
+            self.submodules.policy = LiteSATAWeightedPolicy(n, weights)
+        elif policy == "deficit":
+            self.submodules.policy = LiteSATADeficitPolicy(n, weights)
+        else:
+            raise ValueError("Unknown arbitration policy: {}".format(policy))
+        self.grant = self.policy.grant
+
+        # # #
+
+        issued = Signal()
+        self.comb += issued.eq(master.source.stb & master.source.sop & master.source.ack)
+
+        if tagged:
+            # owner of queued commands is given by the tag's prefix,
+            # identify/flush are not queued
+            nonqueued_owner = Signal(bits_for(n-1))
+            self.sync += \
+                If(issued & (master.source.identify | master.source.flush),
+                    nonqueued_owner.eq(self.grant)
+                )
+            queue_ready = 1
+        else:
+            queue = SyncFIFO([("grant", bits_for(n-1))], queue_depth)
+            self.submodules += queue
+            self.comb += [
+                queue.sink.stb.eq(issued),
+                queue.sink.grant.eq(self.grant)
+            ]
+            queue_ready = queue.sink.ack
+
+        # commands
+        tx_cases = {}
         for i, slave in enumerate(users):
-            sink, source = slave.sink, slave.source
+            sink = slave.sink
             start = Signal()
-            done = Signal()
+            sent = Signal()
             ongoing = Signal()
             self.comb += [
                 start.eq(sink.stb & sink.sop),
-                done.eq(source.stb & source.last & source.eop & source.ack)
+                sent.eq(sink.stb & sink.eop & sink.ack)
             ]
             self.sync += \
                 If(start,
                     ongoing.eq(1)
-                ).Elif(done,
+                ).Elif(sent,
                     ongoing.eq(0)
                 )
-            self.comb += self.rr.request[i].eq((start | ongoing) & ~done)
-            cases[i] = [users[i].connect(master)]
-        self.comb += Case(self.grant, cases)
+            self.comb += self.policy.request[i].eq((start | ongoing) & ~sent)
+            tx_cases[i] = [
+                Record.connect(sink, master.source),
+                # wait for a free slot in the queue to start a command
+                If(sink.sop & ~queue_ready,
+                    master.source.stb.eq(0),
+                    sink.ack.eq(0)
+                )
+            ]
+            if tagged:
+                tx_cases[i] += [master.source.tag.eq((i << local_bits) |
+                                                     (sink.tag & (2**local_bits - 1)))]
+        self.comb += Case(self.grant, tx_cases)
+        if policy != "roundrobin":
+            self.comb += [
+                self.policy.served.eq(issued),
+                self.policy.cost.eq(master.source.count)
+            ]
+
+        # responses
+        rx_cases = {}
+        for i, slave in enumerate(users):
+            rx_cases[i] = Record.connect(master.sink, slave.source)
+            if tagged:
+                rx_cases[i] += [slave.source.tag.eq(master.sink.tag & (2**local_bits - 1))]
+        if tagged:
+            self.comb += \
+                If(master.sink.identify | master.sink.flush,
+                    Case(nonqueued_owner, rx_cases)
+                ).Else(
+                    Case(master.sink.tag >> local_bits, rx_cases)
+                )
+        else:
+            self.comb += [
+                If(queue.source.stb,
+                    Case(queue.source.grant, rx_cases)
+                ),
+                queue.source.ack.eq(master.sink.stb & master.sink.last &
+                                    master.sink.eop & master.sink.ack)
+            ]
 
 
-class LiteSATACrossbar(Module):
-    def __init__(self, controller):
+class LiteSATACrossbar(Module, AutoCSR):
+    """SATA Crossbar
+
+    Provides user ports (get_port) to a controller. The arbitration
+    policy of the ports is selected with policy (see LiteSATAArbiter),
+    each port is given a priority/weight with get_port. With with_csr,
+    weights of "weighted" and "deficit" policies can also be modified
+    at runtime through CSRs (weight0, weight1, ...).
+
+    With max_count, get_port inserts a splitter that slices the port's
+    commands in commands of at most max_count sectors, other ports can
+    then be interleaved between slices. The port still sees a single
+    completion and can use counts of count_width bits.
+
+    With an NCQ controller (LiteSATACore with_ncq), responses are routed
+    on their tag: the controller's tags are split between the ports (see
+    LiteSATAArbiter), each port can use tags 0 to port_ntags-1 (known
+    once the crossbar is finalized).
+    """
+    def __init__(self, controller, policy="roundrobin", with_csr=False):
         self.dw = len(controller.sink.data)
+        self.ndrives = getattr(controller, "ndrives", 1)
+        self.tagged = getattr(controller, "with_ncq", False)
+        self.ntags = getattr(controller, "ncq_depth", ncq_max_tags)
+        self.policy = policy
+        self.with_csr = with_csr
         self.users = []
+        self.weights = []
+        self.weights_csrs = []
         self.master = LiteSATAMasterPort(self.dw)
         self.comb += [
             self.master.source.connect(controller.sink),
             controller.source.connect(self.master.sink)
         ]
 
-    def get_port(self, dw=32):
-        user_port = LiteSATAUserPort(dw, self.dw)
-        internal_port = LiteSATAUserPort(self.dw, self.dw)
+    def get_port(self, dw=32, priority=None, weight=None, max_count=None, count_width=16):
+        if priority is not None and weight is not None:
+            raise ValueError("priority and weight are exclusive")
+        weight = priority if priority is not None else weight
+        weight = 1 if weight is None else weight
+        if self.with_csr and self.policy in ["weighted", "deficit"]:
+            csr = CSRStorage(16, reset=weight, name="weight{}".format(len(self.weights)))
+            setattr(self, "_weight{}".format(len(self.weights)), csr)
+            self.weights_csrs.append(csr)
+        self.weights.append(weight)
+
+        user_port = LiteSATAUserPort(dw, self.dw, self.ndrives, count_width)
+        port = user_port
+        internal_port = LiteSATAUserPort(self.dw, self.dw, self.ndrives)
+
+        if max_count is not None:
+            port = LiteSATAUserPort(dw, self.dw, self.ndrives)
+            splitter = LiteSATASplitter(port, count_width, max_count)
+            self.submodules += splitter
+            self.comb += [
+                Record.connect(user_port.sink, splitter.sink),
+                Record.connect(splitter.source, user_port.source)
+            ]
 
         if dw != self.dw:
-            converter = Converter(command_tx_description(user_port.dw),
+            converter = Converter(command_tx_description(port.dw),
                                   command_tx_description(self.dw))
             self.submodules += converter
             self.comb += [
-                Record.connect(user_port.sink, converter.sink),
+                Record.connect(port.sink, converter.sink),
                 Record.connect(converter.source, internal_port.sink)
             ]
 
             converter = Converter(command_rx_description(self.dw),
-                                  command_rx_description(user_port.dw))
+                                  command_rx_description(port.dw))
             self.submodules += converter
             self.comb += [
                 Record.connect(internal_port.source, converter.sink),
-                Record.connect(converter.source, user_port.source)
+                Record.connect(converter.source, port.source)
             ]
 
             self.users += [internal_port]
         else:
-            self.users += [user_port]
+            self.users += [port]
 
         return user_port
 
-    def get_ports(self, n, dw=32):
+    def get_ports(self, n, dw=32, priority=None, weight=None, max_count=None, count_width=16):
         ports = []
         for i in range(n):
-            ports.append(self.get_port(dw))
+            ports.append(self.get_port(dw, priority, weight, max_count, count_width))
         return ports
 
     def do_finalize(self):
-        arbiter = LiteSATAArbiter(self.users, self.master)
+        arbiter = LiteSATAArbiter(self.users, self.master,
+                                  policy=self.policy,
+                                  weights=self.weights,
+                                  tagged=self.tagged,
+                                  ntags=self.ntags)
         self.submodules += arbiter
+        if self.tagged:
+            self.port_ntags = arbiter.port_ntags
+        for i, csr in enumerate(self.weights_csrs):
+            self.comb += arbiter.policy.weights[i].eq(csr.storage)
@@ -17,7 +17,7 @@ class LiteSATABISTGenerator(Module):
         # # #
 
         n = user_port.dw//32
-        count_mult = user_port.dw//user_port.controller_dw
+        count_mult = user_port.dw//(32*user_port.ndrives)
 
         source, sink = user_port.sink, user_port.source
 
@@ -91,7 +91,7 @@ class LiteSATABISTChecker(Module):
         # # #
 
         n = user_port.dw//32
-        count_mult = user_port.dw//user_port.controller_dw
+        count_mult = user_port.dw//(32*user_port.ndrives)
 
         source, sink = user_port.sink, user_port.source
 
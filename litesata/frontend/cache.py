@@ -0,0 +1,199 @@
+from litesata.common import *
+
+
+class LiteSATAWriteBackCache(Module):
+    """SATA write-back cache
+
+    Absorb writes in an on-chip buffer of buffer_sectors sectors and
+    complete them immediately. Writes to adjacent sectors are merged in
+    the buffer and written to the controller as a single command when:
+        - a write can't be merged (not adjacent or buffer full).
+        - a read overlaps the buffered sectors.
+        - a flush command is received.
+        - no command has been received for flush_timeout cycles.
+
+    A flush command writes the buffer to the controller then is forwarded
+    to it (FLUSH CACHE EXT): its completion acts as a barrier for all the
+    previous writes, failed is set if one of them failed since the
+    previous flush.
+
+    Writes larger than the buffer, reads and identify are forwarded. Like
+    the striping module, the cache provides sink/source (and ndrives) and
+    is used in place of the controller with LiteSATACrossbar.
+    """
+    def __init__(self, controller, buffer_sectors=64, flush_timeout=2**16):
+        if buffer_sectors > 2**16-1:
+            raise ValueError("buffer_sectors must be lower than 2**16")
+        self.dw = dw = len(controller.sink.data)
+        self.ndrives = getattr(controller, "ndrives", 1)
+        self.sink = sink = Sink(command_tx_description(dw))
+        self.source = source = Source(command_rx_description(dw))
+
+        # # #
+
+        cmd_source, cmd_sink = controller.sink, controller.source
+
+        # data per sector on controller
+        sector_words = sectors2dwords(self.ndrives)*32//dw
+
+        # buffer
+        mem = Memory(dw, buffer_sectors*sector_words)
+        wr_port = mem.get_port(write_capable=True)
+        rd_port = mem.get_port(async_read=True)
+        self.specials += mem, wr_port, rd_port
+
+        buffer_sector = Signal(48)
+        buffer_count = Signal(max=buffer_sectors+1)
+        buffer_end = Signal(48)
+        empty = Signal()
+        self.comb += [
+            buffer_end.eq(buffer_sector + buffer_count),
+            empty.eq(buffer_count == 0)
+        ]
+
+        mergeable = Signal()
+        overlap = Signal()
+        self.comb += [
+            mergeable.eq((sink.count != 0) &
+                         (empty | (sink.sector == buffer_end)) &
+                         ((buffer_count + sink.count) <= buffer_sectors)),
+            overlap.eq(~empty &
+                       (sink.sector < buffer_end) &
+                       ((sink.sector + sink.count) > buffer_sector))
+        ]
+
+        # command parameters
+        tag = Signal(5)
+        count = Signal(16)
+        flush = Signal()
+        load = Signal()
+        self.sync += \
+            If(load,
+                tag.eq(sink.tag),
+                count.eq(sink.count),
+                flush.eq(sink.flush)
+            )
+
+        counter = Signal(max=buffer_sectors*sector_words+1)
+        counter_reset = Signal()
+        counter_ce = Signal()
+        self.sync += \
+            If(counter_reset,
+                counter.eq(0)
+            ).Elif(counter_ce,
+                counter.eq(counter + 1)
+            )
+
+        # background flush when no command is received
+        timeout = Signal(max=flush_timeout+1)
+        self.sync += \
+            If(sink.stb | empty,
+                timeout.eq(0)
+            ).Elif(timeout != flush_timeout,
+                timeout.eq(timeout + 1)
+            )
+
+        # errors of the buffered writes, reported on next flush
+        error = Signal()
+        clr_error = Signal()
+        set_error = Signal()
+        self.sync += \
+            If(clr_error,
+                error.eq(0)
+            ).Elif(set_error,
+                error.eq(1)
+            )
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            counter_reset.eq(1),
+            If(sink.stb & sink.sop,
+                If(sink.write & mergeable,
+                    load.eq(1),
+                    NextState("MERGE")
+                ).Elif(~empty & (sink.write | sink.flush | overlap),
+                    NextState("FLUSH")
+                ).Else(
+                    load.eq(1),
+                    NextState("FORWARD")
+                )
+            ).Elif(~empty & (timeout == flush_timeout),
+                NextState("FLUSH")
+            )
+        )
+
+        # merge write in the buffer and complete it
+        self.sync += \
+            If(load & sink.write & mergeable & empty,
+                buffer_sector.eq(sink.sector)
+            )
+        fsm.act("MERGE",
+            sink.ack.eq(1),
+            wr_port.adr.eq(buffer_count*sector_words + counter),
+            wr_port.dat_w.eq(sink.data),
+            wr_port.we.eq(sink.stb),
+            counter_ce.eq(sink.stb),
+            If(sink.stb & sink.eop,
+                NextState("MERGE_RESPONSE")
+            )
+        )
+        self.sync += \
+            If(fsm.ongoing("MERGE") & sink.stb & sink.eop,
+                buffer_count.eq(buffer_count + count)
+            ).Elif(fsm.ongoing("FLUSH_WAIT") & cmd_sink.stb & cmd_sink.last & cmd_sink.eop,
+                buffer_count.eq(0)
+            )
+        fsm.act("MERGE_RESPONSE",
+            source.stb.eq(1),
+            source.sop.eq(1),
+            source.eop.eq(1),
+            source.write.eq(1),
+            source.last.eq(1),
+            source.tag.eq(tag),
+            If(source.ack,
+                NextState("IDLE")
+            )
+        )
+
+        # write buffer to the controller
+        fsm.act("FLUSH",
+            cmd_source.stb.eq(1),
+            cmd_source.sop.eq(counter == 0),
+            cmd_source.eop.eq(counter == (buffer_count*sector_words - 1)),
+            cmd_source.write.eq(1),
+            cmd_source.sector.eq(buffer_sector),
+            cmd_source.count.eq(buffer_count),
+            cmd_source.data.eq(rd_port.dat_r),
+            If(cmd_source.ack,
+                counter_ce.eq(1),
+                If(cmd_source.eop,
+                    NextState("FLUSH_WAIT")
+                )
+            )
+        )
+        self.comb += rd_port.adr.eq(counter)
+        fsm.act("FLUSH_WAIT",
+            cmd_sink.ack.eq(1),
+            If(cmd_sink.stb & cmd_sink.last & cmd_sink.eop,
+                set_error.eq(cmd_sink.failed),
+                NextState("IDLE")
+            )
+        )
+
+        # other commands are forwarded
+        fsm.act("FORWARD",
+            Record.connect(sink, cmd_source),
+            If(sink.stb & sink.eop & sink.ack,
+                NextState("FORWARD_RESPONSE")
+            )
+        )
+        fsm.act("FORWARD_RESPONSE",
+            Record.connect(cmd_sink, source),
+            If(flush,
+                source.failed.eq(cmd_sink.failed | error)
+            ),
+            If(cmd_sink.stb & cmd_sink.last & cmd_sink.eop & cmd_sink.ack,
+                clr_error.eq(flush),
+                NextState("IDLE")
+            )
+        )
@@ -0,0 +1,340 @@
+from litesata.common import *
+
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+
+
+dma_descriptor_dwords = 8
+
+dma_descriptor_fields = {
+    "control": 0,
+    "sector_lsb": 1,
+    "sector_msb": 2,
+    "count": 3,
+    "address": 4,
+    "length": 5
+}
+
+dma_control = {
+    "write": 0,
+    "done": 30,
+    "failed": 31
+}
+
+
+class LiteSATADMA(Module, AutoCSR):
+    """SATA scatter-gather DMA
+
+    Move data between system memory and a user port, commands are described
+    by a ring of descriptors in memory (dma_descriptor_dwords dwords each):
+        - control: write (memory to drive) bit, done/failed bits written
+          back by the DMA on completion.
+        - sector_lsb/sector_msb: 48 bits sector.
+        - count: sector count.
+        - address: byte address of the buffer (dword aligned).
+        - length: length of the buffer in bytes, the descriptor fails
+          without issuing a command if smaller than count sectors.
+
+    Software fills descriptors and moves head, the DMA processes the
+    descriptors from tail to head and increments tail on each completion.
+    Up to queue_depth commands can be outstanding: the next descriptors are
+    fetched and issued while previous commands are executing. The write
+    data of a descriptor is only read from memory once the previous reads
+    are completed (a write can use the buffer of a previous read).
+
+    Disabling the DMA resets the ring indexes (tail and next descriptor to
+    fetch): software disables it when idle (tail == head) and then restarts
+    with head at 0.
+
+    Parameters
+    ----------
+    user_port : port
+        User port (from crossbar.get_port(32)) commands are issued on.
+    queue_depth : int
+        Maximum number of outstanding commands.
+    fifo_depth : int
+        Depth of the prefetch FIFO of the writes.
+    with_csr : bool
+        Add CSRs for the ring parameters (enable, base, size, head, tail).
+
+    Attributes
+    ----------
+    bus : wishbone.Interface
+        Wishbone master used for descriptors and data accesses.
+    enable : in
+        Enable descriptors processing.
+    base : in
+        Byte address of the ring.
+    size : in
+        Number of descriptors of the ring.
+    head : in
+        Index of the last descriptor + 1 provided by software.
+    tail : out
+        Index of the next descriptor to complete.
+    """
+    def __init__(self, user_port, queue_depth=4, fifo_depth=16, with_csr=True):
+        if user_port.dw != 32:
+            raise ValueError("DMA only supports 32 bits user ports")
+        self.bus = wishbone.Interface()
+
+        self.enable = Signal()
+        self.base = Signal(32)
+        self.size = Signal(16)
+        self.head = Signal(16)
+        self.tail = Signal(16)
+
+        if with_csr:
+            self._enable = CSRStorage()
+            self._base = CSRStorage(32)
+            self._size = CSRStorage(16)
+            self._head = CSRStorage(16)
+            self._tail = CSRStatus(16)
+            self.comb += [
+                self.enable.eq(self._enable.storage),
+                self.base.eq(self._base.storage),
+                self.size.eq(self._size.storage),
+                self.head.eq(self._head.storage),
+                self._tail.status.eq(self.tail)
+            ]
+
+        # # #
+
+        cmd_source, cmd_sink = user_port.sink, user_port.source
+
+        issue_bus = wishbone.Interface()
+        completion_bus = wishbone.Interface()
+        self.submodules += wishbone.Arbiter([issue_bus, completion_bus], self.bus)
+
+        def next_index(index):
+            return If(index == (self.size - 1),
+                index.eq(0)
+            ).Else(
+                index.eq(index + 1)
+            )
+
+        def descriptor_adr(index):
+            return (self.base[2:] + index*dma_descriptor_dwords)
+
+        # commands issued, completions are processed in the same order
+        queue_layout = [
+            ("index", 16),
+            ("write", 1),
+            ("address", 32),
+            ("skip", 1)
+        ]
+        queue = SyncFIFO(queue_layout, queue_depth)
+        self.submodules += queue
+
+        # issue: fetch descriptor and send command/write data
+        fetch_index = Signal(16)
+        fetch_word = Signal(3)
+        descriptor = Array(Signal(32) for i in range(6))
+
+        control = descriptor[dma_descriptor_fields["control"]]
+        sector = Signal(48)
+        count = Signal(16)
+        address = Signal(32)
+        length = Signal(32)
+        write = Signal()
+        self.comb += [
+            sector.eq(Cat(descriptor[dma_descriptor_fields["sector_lsb"]],
+                          descriptor[dma_descriptor_fields["sector_msb"]][:16])),
+            count.eq(descriptor[dma_descriptor_fields["count"]]),
+            address.eq(descriptor[dma_descriptor_fields["address"]]),
+            length.eq(descriptor[dma_descriptor_fields["length"]]),
+            write.eq(control[dma_control["write"]])
+        ]
+
+        ndwords = Signal(32)
+        self.comb += ndwords.eq(count*sectors2dwords(1))
+
+        self.comb += [
+            cmd_source.sector.eq(sector),
+            cmd_source.count.eq(count),
+            queue.sink.index.eq(fetch_index),
+            queue.sink.write.eq(write),
+            queue.sink.address.eq(address)
+        ]
+
+        # reads issued and not completed
+        reads = Signal(max=queue_depth+1)
+        read_issued = Signal()
+        read_completed = Signal()
+        self.comb += [
+            read_issued.eq(queue.sink.stb & queue.sink.ack &
+                           ~queue.sink.write & ~queue.sink.skip),
+            read_completed.eq(queue.source.stb & queue.source.ack &
+                              ~queue.source.write & ~queue.source.skip)
+        ]
+        self.sync += \
+            If(read_issued & ~read_completed,
+                reads.eq(reads + 1)
+            ).Elif(~read_issued & read_completed,
+                reads.eq(reads - 1)
+            )
+
+        # write data prefetch
+        prefetch = SyncFIFO([("data", 32)], fifo_depth)
+        self.submodules += prefetch
+        prefetch_reset = Signal()
+        prefetch_offset = Signal(32)
+        send_offset = Signal(32)
+        self.sync += \
+            If(prefetch_reset,
+                prefetch_offset.eq(0),
+                send_offset.eq(0)
+            ).Else(
+                If(prefetch.sink.stb,
+                    prefetch_offset.eq(prefetch_offset + 1)
+                ),
+                If(cmd_source.stb & cmd_source.ack,
+                    send_offset.eq(send_offset + 1)
+                )
+            )
+        self.comb += [
+            prefetch.sink.data.eq(issue_bus.dat_r),
+            cmd_source.data.eq(prefetch.source.data)
+        ]
+
+        self.issue_fsm = issue_fsm = FSM(reset_state="IDLE")
+        self.submodules += issue_fsm
+        issue_fsm.act("IDLE",
+            prefetch_reset.eq(1),
+            If(self.enable & (fetch_index != self.head) & queue.sink.ack,
+                NextState("FETCH")
+            )
+        )
+        self.sync += If(issue_fsm.ongoing("IDLE"), fetch_word.eq(0))
+        issue_fsm.act("FETCH",
+            issue_bus.adr.eq(descriptor_adr(fetch_index) + fetch_word),
+            issue_bus.sel.eq(0xf),
+            issue_bus.cyc.eq(1),
+            issue_bus.stb.eq(1),
+            If(issue_bus.ack & (fetch_word == (len(descriptor) - 1)),
+                NextState("CHECK")
+            )
+        )
+        self.sync += \
+            If(issue_fsm.ongoing("FETCH") & issue_bus.ack,
+                descriptor[fetch_word].eq(issue_bus.dat_r),
+                fetch_word.eq(fetch_word + 1)
+            )
+        issue_fsm.act("CHECK",
+            If((count == 0) | (length < 4*ndwords),
+                queue.sink.stb.eq(1),
+                queue.sink.skip.eq(1),
+                NextState("NEXT")
+            ).Elif(write,
+                NextState("SEND_WRITE")
+            ).Else(
+                NextState("SEND_READ")
+            )
+        )
+        issue_fsm.act("SEND_READ",
+            cmd_source.stb.eq(1),
+            cmd_source.sop.eq(1),
+            cmd_source.eop.eq(1),
+            cmd_source.read.eq(1),
+            If(cmd_source.ack,
+                queue.sink.stb.eq(1),
+                NextState("NEXT")
+            )
+        )
+        issue_fsm.act("SEND_WRITE",
+            # read data from memory while there is room in the prefetch fifo
+            # (one access can be in flight), once previous reads are completed
+            If((reads == 0) &
+               (prefetch_offset != ndwords) & (prefetch.level < (fifo_depth - 1)),
+                issue_bus.adr.eq(address[2:] + prefetch_offset),
+                issue_bus.sel.eq(0xf),
+                issue_bus.cyc.eq(1),
+                issue_bus.stb.eq(1)
+            ),
+            prefetch.sink.stb.eq(issue_bus.stb & issue_bus.ack),
+
+            cmd_source.stb.eq(prefetch.source.stb),
+            cmd_source.sop.eq(send_offset == 0),
+            cmd_source.eop.eq(send_offset == (ndwords - 1)),
+            cmd_source.write.eq(1),
+            prefetch.source.ack.eq(cmd_source.ack),
+            If(cmd_source.stb & cmd_source.sop & cmd_source.ack,
+                queue.sink.stb.eq(1)
+            ),
+            If(cmd_source.stb & cmd_source.eop & cmd_source.ack,
+                NextState("NEXT")
+            )
+        )
+        issue_fsm.act("NEXT",
+            NextState("IDLE")
+        )
+        self.sync += If(issue_fsm.ongoing("NEXT"), next_index(fetch_index))
+
+        # completion: write read data to memory and write back descriptor
+        completion = queue.source
+        self.completion_fsm = completion_fsm = FSM(reset_state="IDLE")
+        self.submodules += completion_fsm
+        offset = Signal(32)
+        failed = Signal()
+        self.sync += [
+            If(completion_fsm.ongoing("IDLE"),
+                offset.eq(0),
+                failed.eq(1)
+            ).Elif(completion_bus.stb & completion_bus.ack & completion_fsm.ongoing("RECEIVE"),
+                offset.eq(offset + 1)
+            ),
+            If(cmd_sink.stb & cmd_sink.last & cmd_sink.ack,
+                failed.eq(cmd_sink.failed)
+            )
+        ]
+
+        completion_fsm.act("IDLE",
+            If(completion.stb,
+                If(completion.skip,
+                    NextState("WRITE_BACK")
+                ).Else(
+                    NextState("RECEIVE")
+                )
+            )
+        )
+        completion_fsm.act("RECEIVE",
+            If(cmd_sink.stb,
+                If(cmd_sink.last,
+                    cmd_sink.ack.eq(1),
+                    NextState("WRITE_BACK")
+                ).Else(
+                    completion_bus.adr.eq(completion.address[2:] + offset),
+                    completion_bus.dat_w.eq(cmd_sink.data),
+                    completion_bus.sel.eq(0xf),
+                    completion_bus.we.eq(1),
+                    completion_bus.cyc.eq(1),
+                    completion_bus.stb.eq(1),
+                    cmd_sink.ack.eq(completion_bus.ack)
+                )
+            )
+        )
+        completion_fsm.act("WRITE_BACK",
+            completion_bus.adr.eq(descriptor_adr(completion.index) +
+                                  dma_descriptor_fields["control"]),
+            completion_bus.dat_w[dma_control["write"]].eq(completion.write),
+            completion_bus.dat_w[dma_control["done"]].eq(1),
+            completion_bus.dat_w[dma_control["failed"]].eq(failed),
+            completion_bus.sel.eq(0xf),
+            completion_bus.we.eq(1),
+            completion_bus.cyc.eq(1),
+            completion_bus.stb.eq(1),
+            If(completion_bus.ack,
+                completion.ack.eq(1),
+                NextState("IDLE")
+            )
+        )
+        self.sync += \
+            If(completion.stb & completion.ack,
+                next_index(self.tail)
+            )
+
+        # ring indexes are reset when disabled
+        self.sync += \
+            If(~self.enable,
+                fetch_index.eq(0),
+                self.tail.eq(0)
+            )
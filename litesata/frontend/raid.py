@@ -1,8 +1,9 @@
 from functools import reduce
-from operator import and_, or_
+from operator import and_, or_, xor
 
 from litesata.common import *
-from litesata.frontend.arbitration import LiteSATAUserPort
+from litesata.frontend.arbitration import LiteSATAMasterPort, LiteSATAUserPort
+from litesata.frontend.arbitration import LiteSATAArbiter, LiteSATACrossbar
 
 from litex.soc.interconnect.stream_packet import Status, Arbiter, Dispatcher
 
@@ -120,152 +121,648 @@ class LiteSATAStriping(Module):
         - port's throughput = N x (slowest) controller's throughput
 
     Can be used to increase capacity and writes/reads throughput.
+
+    Without buffering, a stall on one controller (HOLD, latency) stalls
+    all the controllers. fifo_depth adds per-controller FIFOs on writes
+    and reads that decouple the controllers: throughput is then limited by
+    the average throughput of the controllers instead of the instantaneous
+    one.
     """
-    def __init__(self, controllers):
+    def __init__(self, controllers, fifo_depth=0):
 
         # # #
         n = len(controllers)
         dw = len(controllers[0].sink.data)
+        self.ndrives = n
 
         self.submodules.tx = LiteSATAStripingTX(n, dw)
         self.submodules.rx = LiteSATAStripingRX(n, dw)
         for i in range(n):
+            if fifo_depth:
+                tx_fifo = SyncFIFO(command_tx_description(dw), fifo_depth)
+                rx_fifo = SyncFIFO(command_rx_description(dw), fifo_depth)
+                self.submodules += tx_fifo, rx_fifo
+                self.comb += [
+                    Record.connect(self.tx.sources[i], tx_fifo.sink),
+                    Record.connect(tx_fifo.source, controllers[i].sink),
+                    Record.connect(controllers[i].source, rx_fifo.sink),
+                    Record.connect(rx_fifo.source, self.rx.sinks[i])
+                ]
+            else:
+                self.comb += [
+                    Record.connect(self.tx.sources[i], controllers[i].sink),
+                    Record.connect(controllers[i].source, self.rx.sinks[i])
+                ]
+        self.sink, self.source = self.tx.sink, self.rx.source
+
+# parity
+
+class LiteSATAParity(Module):
+    """SATA Parity
+
+    Segment data on N controllers as the striping module does and store the
+    parity (XOR) of the N data words on an additional controller:
+                     +----> controller0 (dw)
+    port (N*dw) <----+----> controllerX (dw)
+                     +----> controllerN-1 (dw)
+                     +----> controllerN (dw, parity)
+
+    Each write covers all the controllers (full stripe): parity is computed
+    at line rate on the written data, no read-modify-write is needed. Reads
+    only use the N data controllers.
+
+    In degraded mode (degraded set, failed_drive selecting the missing
+    controller), the failed controller is no longer accessed: writes are done
+    on the other controllers and reads use the parity controller to
+    reconstruct the missing data. degraded/failed_drive must only be changed
+    when no command is ongoing.
+
+    Characteristics:
+        - port's visible capacity = N x controller's visible capacity
+        - port's throughput = N x (slowest) controller's throughput
+
+    Can be used for data redundancy with only one additional controller.
+    """
+    def __init__(self, controllers):
+        n = len(controllers) - 1
+        if n < 2:
+            raise ValueError("Parity needs at least 3 controllers")
+        dw = len(controllers[0].sink.data)
+        self.ndrives = n
+        self.sink = sink = Sink(command_tx_description(dw*n))
+        self.source = source = Source(command_rx_description(dw*n))
+
+        self.degraded = Signal()
+        self.failed_drive = Signal(max=n+1)
+
+        # # #
+
+        self.submodules.tx = LiteSATAStripingTX(n+1, dw)
+        self.submodules.rx = LiteSATAStripingRX(n+1, dw)
+
+        failed = Signal(n+1)
+        for i in range(n+1):
+            self.comb += failed[i].eq(self.degraded & (self.failed_drive == i))
+
+        # controllers not accessed by a command: the failed controller and,
+        # for reads out of degraded mode, the parity controller.
+        def disables(write):
+            _disables = Signal(n+1)
             self.comb += [
-                Record.connect(self.tx.sources[i], controllers[i].sink),
-                Record.connect(controllers[i].source, self.rx.sinks[i])
+                _disables.eq(failed),
+                If(~write & ~self.degraded,
+                    _disables[n].eq(1)
+                )
             ]
-        self.sink, self.source = self.tx.sink, self.rx.source
+            return _disables
+
+        # tx: compute parity and drop data of disabled controllers
+        tx_lanes = [sink.data[i*dw:(i+1)*dw] for i in range(n)]
+        self.comb += [
+            Record.connect(sink, self.tx.sink, leave_out=set(["data"])),
+            self.tx.sink.data.eq(Cat(*tx_lanes, reduce(xor, tx_lanes)))
+        ]
+        tx_disables = disables(sink.write | sink.flush)
+        for i in range(n+1):
+            self.comb += \
+                If(tx_disables[i],
+                    self.tx.sources[i].ack.eq(1)
+                ).Else(
+                    Record.connect(self.tx.sources[i], controllers[i].sink)
+                )
+
+        # rx: a disabled controller is replaced by a copy of the responses of
+        # the next controller (with null data) and its data is reconstructed
+        # from the other controllers.
+        rx_write = Signal()
+        self.comb += \
+            If(failed[0],
+                rx_write.eq(controllers[1].source.write | controllers[1].source.flush)
+            ).Else(
+                rx_write.eq(controllers[0].source.write | controllers[0].source.flush)
+            )
+        rx_disables = disables(rx_write)
+        for i in range(n+1):
+            self.comb += \
+                If(rx_disables[i],
+                    Record.connect(controllers[(i+1)%(n+1)].source, self.rx.sinks[i],
+                                   leave_out=set(["ack", "data"]))
+                ).Else(
+                    Record.connect(controllers[i].source, self.rx.sinks[i])
+                )
+        rx_lanes = [self.rx.source.data[i*dw:(i+1)*dw] for i in range(n+1)]
+        self.comb += Record.connect(self.rx.source, source, leave_out=set(["data"]))
+        for i in range(n):
+            self.comb += \
+                If(rx_disables[i],
+                    source.data[i*dw:(i+1)*dw].eq(reduce(xor, rx_lanes))
+                ).Else(
+                    source.data[i*dw:(i+1)*dw].eq(rx_lanes[i])
+                )
+
+# chunked striping
+
+class LiteSATAChunkedStripingPort(Module):
+    """SATA Chunked Striping port
+
+    Map commands of the port on the drives (RAID0 with a stripe unit of
+    stripe_sectors): each command is split at stripe boundaries in
+    per-drive commands issued back-to-back on drive_ports. Responses are
+    collected in order, intermediate completions are hidden so that the
+    port sees a single completion.
+
+    In mirroring mode, drives hold identical data: chunks are dispatched
+    to the drives in the same way but drive's LBA is the port's LBA.
+    """
+    def __init__(self, drive_ports, stripe_sectors, queue_depth, mirroring_mode=False):
+        n = len(drive_ports)
+        dw = drive_ports[0].dw
+        self.port = port = LiteSATAUserPort(dw)
+
+        # # #
+
+        sink, source = port.sink, port.source
+
+        stripe_bits = log2_int(stripe_sectors)
+        drive_bits = log2_int(n, need_pow2=True)
+        sector_words = sectors2dwords(1)*32//dw
+
+        # command parameters
+        write = Signal()
+        read = Signal()
+        identify = Signal()
+        flush = Signal()
+        tag = Signal(5)
+        sector = Signal(48)
+        remaining = Signal(16)
+        load = Signal()
+        update = Signal()
+
+        # LBA --> (drive, drive's LBA)
+        offset = Signal(stripe_bits)
+        chunk = Signal(48 - stripe_bits)
+        drive = Signal(max=max(2, n))
+        drive_sector = Signal(48)
+        chunk_left = Signal(stripe_bits + 1)
+        chunk_count = Signal(16)
+        last_chunk = Signal()
+        self.comb += [
+            offset.eq(sector[:stripe_bits]),
+            chunk.eq(sector[stripe_bits:]),
+            drive_sector.eq(sector if mirroring_mode else Cat(offset, chunk[drive_bits:])),
+            chunk_left.eq(stripe_sectors - offset),
+            last_chunk.eq(remaining <= chunk_left),
+            If(last_chunk,
+                chunk_count.eq(remaining)
+            ).Else(
+                chunk_count.eq(chunk_left)
+            )
+        ]
+        if n > 1:
+            self.comb += drive.eq(chunk[:drive_bits])
+
+        # flush is issued on all the drives
+        flush_drive = Signal(max=max(2, n))
+        self.comb += \
+            If(flush,
+                drive.eq(flush_drive),
+                last_chunk.eq(flush_drive == (n - 1)),
+                chunk_count.eq(0)
+            )
+        self.sync += \
+            If(load,
+                flush_drive.eq(0)
+            ).Elif(update,
+                flush_drive.eq(flush_drive + 1)
+            )
+
+        self.sync += \
+            If(load,
+                write.eq(sink.write),
+                read.eq(sink.read),
+                identify.eq(sink.identify),
+                flush.eq(sink.flush),
+                tag.eq(sink.tag),
+                sector.eq(sink.sector),
+                remaining.eq(sink.count)
+            ).Elif(update,
+                sector.eq(sector + chunk_count),
+                remaining.eq(remaining - chunk_count)
+            )
+
+        counter = Signal(32)
+        counter_reset = Signal()
+        counter_ce = Signal()
+        self.sync += \
+            If(counter_reset,
+                counter.eq(0)
+            ).Elif(counter_ce,
+                counter.eq(counter + 1)
+            )
+
+        # drives of the issued commands
+        order = SyncFIFO([("drive", bits_for(n-1))], queue_depth)
+        self.submodules += order
+
+        tx_done = Signal()
+        self.sync += \
+            If(load,
+                tx_done.eq(0)
+            ).Elif(update & last_chunk,
+                tx_done.eq(1)
+            )
+
+        # commands
+        cmd = Source(command_tx_description(dw))
+        cmd_cases = {}
+        for i, drive_port in enumerate(drive_ports):
+            cmd_cases[i] = Record.connect(cmd, drive_port.sink)
+        self.comb += [
+            Case(drive, cmd_cases),
+            cmd.sop.eq(counter == 0),
+            If(write,
+                cmd.eop.eq(counter == (chunk_count*sector_words - 1))
+            ).Else(
+                cmd.eop.eq(1)
+            ),
+            cmd.write.eq(write),
+            cmd.read.eq(read),
+            cmd.identify.eq(identify),
+            cmd.flush.eq(flush),
+            cmd.tag.eq(tag),
+            cmd.sector.eq(drive_sector),
+            cmd.count.eq(chunk_count),
+            cmd.data.eq(sink.data),
+            order.sink.drive.eq(drive),
+            order.sink.stb.eq(cmd.stb & cmd.sop & cmd.ack)
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            counter_reset.eq(1),
+            If(sink.stb & sink.sop,
+                load.eq(1),
+                NextState("SEND")
+            )
+        )
+        fsm.act("SEND",
+            # wait for a free slot in the queue to start a command
+            cmd.stb.eq(sink.stb & (order.sink.ack | ~cmd.sop)),
+            # command of a read is only consumed with the last chunk
+            sink.ack.eq(cmd.stb & cmd.ack & (write | last_chunk)),
+            If(cmd.stb & cmd.ack,
+                counter_ce.eq(1),
+                If(cmd.eop,
+                    counter_reset.eq(1),
+                    update.eq(1),
+                    If(last_chunk,
+                        NextState("WAIT_COMPLETION")
+                    )
+                )
+            )
+        )
+
+        # responses
+        rsp = Sink(command_rx_description(dw))
+        rsp_cases = {}
+        for i, drive_port in enumerate(drive_ports):
+            rsp_cases[i] = Record.connect(drive_port.source, rsp)
+        self.comb += If(order.source.stb, Case(order.source.drive, rsp_cases))
+
+        completion = Signal()
+        final = Signal()
+        failed = Signal()
+        self.comb += [
+            completion.eq(rsp.stb & rsp.last),
+            final.eq(tx_done & (order.level == 1)),
+            Record.connect(rsp, source),
+            If(completion & ~final,
+                source.stb.eq(0),
+                rsp.ack.eq(1)
+            ),
+            source.failed.eq(rsp.failed | failed),
+            order.source.ack.eq(completion & rsp.eop & rsp.ack)
+        ]
+        self.sync += \
+            If(load,
+                failed.eq(0)
+            ).Elif(rsp.stb & rsp.ack,
+                failed.eq(failed | rsp.failed)
+            )
+        fsm.act("WAIT_COMPLETION",
+            If(completion & final & rsp.eop & rsp.ack,
+                NextState("IDLE")
+            )
+        )
+
+
+class LiteSATAChunkedStriping(Module):
+    """SATA Chunked Striping
+
+    RAID0 with a configurable stripe unit (stripe_size in bytes): LBAs
+    of the ports are mapped on the N controllers by chunks of stripe_size.
+                          +----> arbiter --> controller0
+    ports (dw) <--+-------+----> arbiter --> controllerX
+                          +----> arbiter --> controllerN
+
+    Each controller has its own arbiter, commands of the ports are split
+    in per-drive commands that are executed concurrently on the
+    different drives: small random accesses of different ports are
+    serviced in parallel, large accesses are spread over all the drives.
+
+    Characteristics:
+        - port's visible capacity = N x controller's visible capacity
+        - random I/O throughput scales with N
+
+    N and stripe_size must be powers of 2.
+    """
+    def __init__(self, controllers, stripe_size=64*1024, queue_depth=None):
+        n = len(controllers)
+        stripe_sectors = stripe_size//logical_sector_size
+        if stripe_sectors*logical_sector_size != stripe_size or stripe_sectors > 2**15:
+            raise ValueError("stripe_size must be a multiple of {} and <= {}".format(
+                logical_sector_size, 2**15*logical_sector_size))
+        self.dw = len(controllers[0].sink.data)
+        self.ndrives = n
+        self.stripe_sectors = stripe_sectors
+        self.queue_depth = n if queue_depth is None else queue_depth
+
+        # # #
+
+        self.crossbars = []
+        for i, controller in enumerate(controllers):
+            crossbar = LiteSATACrossbar(controller)
+            setattr(self.submodules, "crossbar{}".format(i), crossbar)
+            self.crossbars.append(crossbar)
+
+    def get_port(self):
+        drive_ports = [crossbar.get_port(self.dw) for crossbar in self.crossbars]
+        port = LiteSATAChunkedStripingPort(drive_ports, self.stripe_sectors, self.queue_depth)
+        self.submodules += port
+        return port.port
+
+    def get_ports(self, n):
+        ports = []
+        for i in range(n):
+            ports.append(self.get_port())
+        return ports
 
 # mirroring
 
 
-class LiteSATAMirroringCtrl(Module):
-    def __init__(self, n):
-        self.new_cmds = Signal(n)
-        self.ack_cmds = Signal(n)
+class LiteSATAMirroringReadBalancer(Module):
+    """SATA Mirroring read balancer
 
-        self.reading = Signal()
-        self.writing = Signal()
+    Dispatch reads of all the ports on all the controllers: reads are
+    split in chunks of chunk_sectors, consecutive chunks are read from
+    different controllers and reassembled in order. A single port doing
+    sequential reads then uses the read bandwidth of all the mirrors.
+    """
+    def __init__(self, n, dw, chunk_sectors):
+        self.sinks = []
+        self.sources = []
+        self.ctrl_sources = []
+        self.ctrl_sinks = []
+
+        # # #
+
+        # one arbiter per controller
+        users = [[LiteSATAUserPort(dw) for j in range(n)] for i in range(n)]
+        for i in range(n):
+            master = LiteSATAMasterPort(dw)
+            self.submodules += LiteSATAArbiter(users[i], master)
+            self.ctrl_sources.append(master.source)
+            self.ctrl_sinks.append(master.sink)
 
+        # one chunker per port
+        for j in range(n):
+            drive_ports = [users[i][j] for i in range(n)]
+            chunker = LiteSATAChunkedStripingPort(drive_ports, chunk_sectors, n,
+                                                  mirroring_mode=True)
+            self.submodules += chunker
+            self.sinks.append(chunker.port.sink)
+            self.sources.append(chunker.port.source)
+
+
+class LiteSATAMirroringCtrl(Module):
+    def __init__(self, n, max_writes=None, max_cycles=None, queue_depth=4):
+        if max_writes is not None and max_cycles is None:
+            raise ValueError("max_writes requires max_cycles (bound of the read phase)")
+        self.read_cmds = Signal(n)
+        self.read_dones = Signal(n)
+        self.read_enables = Signal(n)
+        self.write_enables = Signal(n)
+
+        self.wants_read = Signal()
         self.wants_write = Signal()
+        self.writing = Signal()
+
+        self.write_start = Signal()
+        self.write_start_sel = Signal(max=n)
+        self.write_ready = Signal()
+        self.write_done = Signal()
         self.write_sel = Signal(max=n)
 
         # # #
 
-        pending_cmds = Signal(n)
-        self.sync += pending_cmds.eq(self.new_cmds | (pending_cmds & ~self.ack_cmds))
-        can_commute = Signal()
-        self.comb += can_commute.eq((pending_cmds | self.new_cmds)  == 0)
+        # write responses are routed back to the ports in writes' order
+        queue = SyncFIFO([("sel", bits_for(n-1))], queue_depth)
+        self.submodules += queue
+        self.comb += [
+            queue.sink.stb.eq(self.write_start),
+            queue.sink.sel.eq(self.write_start_sel),
+            self.write_ready.eq(queue.sink.ack),
+            self.write_sel.eq(queue.source.sel),
+            queue.source.ack.eq(self.write_done)
+        ]
+
+        # a port does not mix reads and writes: a read (resp. write) is only
+        # issued once all the writes (resp. reads) of the port are completed
+        for i in range(n):
+            pending_reads = Signal(4)
+            pending_writes = Signal(4)
+            write_cmd = Signal()
+            write_done = Signal()
+            self.comb += [
+                write_cmd.eq(self.write_start & (self.write_start_sel == i)),
+                write_done.eq(self.write_done & (self.write_sel == i))
+            ]
+            self.sync += [
+                If(self.read_cmds[i] & ~self.read_dones[i],
+                    pending_reads.eq(pending_reads + 1)
+                ).Elif(~self.read_cmds[i] & self.read_dones[i],
+                    pending_reads.eq(pending_reads - 1)
+                ),
+                If(write_cmd & ~write_done,
+                    pending_writes.eq(pending_writes + 1)
+                ).Elif(~write_cmd & write_done,
+                    pending_writes.eq(pending_writes - 1)
+                )
+            ]
+            self.comb += [
+                self.read_enables[i].eq(pending_writes == 0),
+                self.write_enables[i].eq(pending_reads == 0)
+            ]
+
+        # write batching
+        commute = Signal()
+        writes = Signal(max=(max_writes or 0) + 1)
+        writes_exhausted = Signal()
+        if max_writes is not None:
+            self.comb += writes_exhausted.eq(writes == max_writes)
+        cycles = Signal(max=(max_cycles or 0) + 1)
+        cycles_exhausted = Signal()
+        if max_cycles is not None:
+            self.comb += cycles_exhausted.eq(cycles == max_cycles)
+        self.sync += \
+            If(commute,
+                writes.eq(0),
+                cycles.eq(0)
+            ).Else(
+                If(self.writing & self.write_start & ~writes_exhausted,
+                    writes.eq(writes + 1)
+                ),
+                If(~cycles_exhausted,
+                    cycles.eq(cycles + 1)
+                )
+            )
+
+        can_write = Signal()
+        if max_writes is None and max_cycles is None:
+            self.comb += can_write.eq(1)
+        else:
+            self.comb += can_write.eq(~self.wants_read | cycles_exhausted)
 
         self.fsm = fsm = FSM(reset_state="READ")
         self.submodules += fsm
         fsm.act("READ",
-            self.reading.eq(1),
-            If(self.wants_write & can_commute,
+            If(self.wants_write & can_write,
+                commute.eq(1),
                 NextState("WRITE")
             )
         )
         fsm.act("WRITE",
             self.writing.eq(1),
-            If(~self.wants_write & can_commute,
+            If(~self.wants_write | (self.wants_read & (writes_exhausted | cycles_exhausted)),
+                commute.eq(1),
                 NextState("READ")
             )
         )
 
 
 class LiteSATAMirroringTX(Module):
-    def __init__(self, n, dw, ctrl):
+    def __init__(self, n, dw, ctrl, balancer=None):
         self.sinks = sinks = [Sink(command_tx_description(dw)) for i in range(n)]
         self.sources = sources = [Source(command_tx_description(dw)) for i in range(n)]
 
         # # #
 
-        wants_write = Signal()
-
-        reading = Signal()
-        writing = Signal()
-
-        reads = [Sink(command_tx_description(dw)) for i in range(dw)]
-        writes = [Sink(command_tx_description(dw)) for i in range(dw)]
-        for sink, read, write in zip(sinks, reads, writes):
-            read_stall = Signal()
+        reads = [Sink(command_tx_description(dw)) for i in range(n)]
+        writes = [Sink(command_tx_description(dw)) for i in range(n)]
+        for i, (sink, read, write) in enumerate(zip(sinks, reads, writes)):
             read_status = Status(read)
             self.submodules += read_status
             self.comb += [
                 Record.connect(sink, read, leave_out=set(["stb", "ack"])),
                 Record.connect(sink, write, leave_out=set(["stb", "ack"])),
-                read.stb.eq(sink.stb & (sink.read | sink.identify) & ~read_stall),
-                write.stb.eq(sink.stb & sink.write),
+                read.stb.eq(sink.stb & (sink.read | sink.identify) & ctrl.read_enables[i]),
+                write.stb.eq(sink.stb & (sink.write | sink.flush) & ctrl.write_enables[i]),
                 If(sink.read | sink.identify,
-                    sink.ack.eq((read.ack & ~read_stall))
+                    sink.ack.eq(read.ack & ctrl.read_enables[i])
                 ).Else(
-                    sink.ack.eq(write.ack)
-                )
+                    sink.ack.eq(write.ack & ctrl.write_enables[i])
+                ),
+                ctrl.read_cmds[i].eq(read_status.eop)
             ]
-            self.sync += \
-                If(~ctrl.wants_write,
-                    read_stall.eq(0)
-                ).Elif(~read_status.ongoing,
-                    read_stall.eq(1)
-                )
+        self.comb += ctrl.wants_read.eq(reduce(or_, [read.stb for read in reads]))
+
+        if balancer is not None:
+            for i in range(n):
+                self.comb += Record.connect(reads[i], balancer.sinks[i])
+            reads = balancer.ctrl_sources
 
+        write_cmds = Sink(command_tx_description(dw))
+        write_arbiter = Arbiter(writes, write_cmds)
         write_striper = LiteSATAStripingTX(n, dw, mirroring_mode=True)
-        write_arbiter = Arbiter(writes, write_striper.sink)
-        self.submodules += write_striper, write_arbiter
+        self.submodules += write_arbiter, write_striper
 
-        for i in range(n):
-            source_status = Status(sources[i])
-            self.submodules += source_status
-            self.comb += [
-                If(ctrl.reading,
-                    Record.connect(reads[i], sources[i]) # independent reads
-                ).Elif(ctrl.writing,
-                    Record.connect(write_striper.sources[i], sources[i]) # identical writes
-                ),
-                ctrl.new_cmds[i].eq(source_status.eop)
-            ]
-        write_striper_sink_status = Status(write_striper.sink)
-        self.submodules += write_striper_sink_status
+        # new writes are only started in write mode
+        write_admit = Signal()
         self.comb += [
-            ctrl.wants_write.eq(write_striper_sink_status.ongoing),
-            ctrl.write_sel.eq(write_arbiter.rr.grant)
+            write_admit.eq(write_striper.fsm.ongoing("SPLIT") | (ctrl.writing & ctrl.write_ready)),
+            Record.connect(write_cmds, write_striper.sink, leave_out=set(["stb", "ack"])),
+            write_striper.sink.stb.eq(write_cmds.stb & write_admit),
+            write_cmds.ack.eq(write_striper.sink.ack & write_admit),
+
+            ctrl.wants_write.eq(write_cmds.stb),
+            ctrl.write_start.eq(write_cmds.stb & write_cmds.sop & write_cmds.ack),
+            ctrl.write_start_sel.eq(write_arbiter.rr.grant)
         ]
 
+        # writes have priority, reads are serviced by the controllers
+        # that are not receiving a write: a controller that has received
+        # its copy of a write serves reads while the others are still
+        # receiving it.
+        for i in range(n):
+            write = write_striper.sources[i]
+            write_ongoing = Signal()
+            self.sync += \
+                If(write.stb & write.eop & write.ack,
+                    write_ongoing.eq(0)
+                ).Elif(write.stb & write.sop & write.ack,
+                    write_ongoing.eq(1)
+                )
+            self.comb += \
+                If(write.stb | write_ongoing,
+                    Record.connect(write, sources[i]) # identical writes
+                ).Else(
+                    Record.connect(reads[i], sources[i]) # independent reads
+                )
+
 
 class LiteSATAMirroringRX(Module):
-    def __init__(self, n, dw, ctrl):
+    def __init__(self, n, dw, ctrl, balancer=None):
         self.sinks = sinks = [Sink(command_rx_description(dw)) for i in range(n)]
         self.sources = sources = [Source(command_rx_description(dw)) for i in range(n)]
 
         # # #
 
-        muxs = [Multiplexer(command_rx_description(dw), 2) for i in range(n)]
-        self.submodules += muxs
-
-        writes = [mux.sink0 for mux in muxs]
-        reads = [mux.sink1 for mux in muxs]
+        writes = [Sink(command_rx_description(dw)) for i in range(n)]
+        reads = [Sink(command_rx_description(dw)) for i in range(n)]
+        for i in range(n):
+            arbiter = Arbiter([writes[i], reads[i]], sources[i])
+            source_status = Status(sources[i])
+            self.submodules += arbiter, source_status
+            self.comb += ctrl.read_dones[i].eq(source_status.eop & sources[i].last &
+                                               (sources[i].read | sources[i].identify))
 
-        for mux, source in zip(muxs, sources):
-            self.comb += [
-                mux.sel.eq(ctrl.reading),
-                Record.connect(mux.source, source)
-            ]
+        if balancer is not None:
+            for i in range(n):
+                self.comb += Record.connect(balancer.sources[i], reads[i])
+            reads = balancer.ctrl_sinks
 
         write_striper = LiteSATAStripingRX(n, dw, mirroring_mode=True)
         write_dispatcher = Dispatcher(write_striper.source, writes)
-        self.comb += write_dispatcher.sel.eq(ctrl.write_sel)
-        self.submodules += write_striper, write_dispatcher
+        write_status = Status(write_striper.source)
+        self.submodules += write_striper, write_dispatcher, write_status
+        self.comb += [
+            write_dispatcher.sel.eq(ctrl.write_sel),
+            ctrl.write_done.eq(write_status.eop & write_striper.source.last)
+        ]
 
+        # responses are routed on their type: a controller can return
+        # read responses while the others are completing a write.
         for i in range(n):
-            sink_status = Status(sinks[i])
-            self.submodules += sink_status
             self.comb += [
                 Record.connect(sinks[i], reads[i], leave_out=set(["stb", "ack"])),
                 Record.connect(sinks[i], write_striper.sinks[i], leave_out=set(["stb", "ack"])),
-                reads[i].stb.eq(sinks[i].stb & ctrl.reading),
-                write_striper.sinks[i].stb.eq(sinks[i].stb & ctrl.writing),
-                sinks[i].ack.eq(reads[i].ack | write_striper.sinks[i].ack),
-                ctrl.ack_cmds[i].eq(sink_status.eop & sinks[i].last)
+                reads[i].stb.eq(sinks[i].stb & ~(sinks[i].write | sinks[i].flush)),
+                write_striper.sinks[i].stb.eq(sinks[i].stb & (sinks[i].write | sinks[i].flush)),
+                If(sinks[i].write | sinks[i].flush,
+                    sinks[i].ack.eq(write_striper.sinks[i].ack)
+                ).Else(
+                    sinks[i].ack.eq(reads[i].ack)
+                )
             ]
 
 
@@ -285,26 +782,48 @@ class LiteSATAMirroring(Module):
         portN (stalled) +----> controllerN | portN ----------+-----> controllerN
 
     Writes have priority on reads. When a write is presented on one of the port, the
-    module waits for all ongoing reads to finish and commute to write mode. Once all writes are
-    serviced it returns to read mode.
+    module commutes to write mode, ongoing reads are not waited: a controller keeps
+    serving reads as soon as it has received its copy of the write. Once all writes are
+    serviced it returns to read mode. A port does not mix reads and writes, its commands
+    of one type are completed before a command of the other type is issued.
+
+    With max_cycles (and optionally max_writes), writes are batched with a bounded
+    starvation of the reads: when reads are waiting, write mode is left after max_writes
+    writes or max_cycles cycles and reads are serviced during (up to) max_cycles cycles
+    before writes resume. max_cycles is required with max_writes since it also bounds
+    the read phase.
 
     Characteristics:
         - port's visible capacity = controller's visible capacity
         - total writes throughput = (slowest) controller's throughput
         - total reads throughput = N x controller's throughput
 
+    With read_balancing, reads of each port are split in chunks of
+    read_chunk_size bytes dispatched on all the controllers, so that a
+    single port can reach N x controller's reads throughput. Read balancing
+    requires a power of 2 number of controllers.
+
     Can be used for data redundancy and/or to increase total reads speed.
     """
-    def __init__(self, controllers):
+    def __init__(self, controllers, read_balancing=False, read_chunk_size=64*1024,
+                 max_writes=None, max_cycles=None):
         n = len(controllers)
         dw = len(controllers[0].sink.data)
         self.ports = [LiteSATAUserPort(dw) for i in range(n)]
 
         # # #
 
-        self.submodules.ctrl = LiteSATAMirroringCtrl(n)
-        self.submodules.tx = LiteSATAMirroringTX(n, dw, self.ctrl)
-        self.submodules.rx = LiteSATAMirroringRX(n, dw, self.ctrl)
+        balancer = None
+        if read_balancing:
+            if n & (n - 1):
+                raise ValueError("read_balancing requires a power of 2 number of controllers")
+            chunk_sectors = read_chunk_size//logical_sector_size
+            balancer = LiteSATAMirroringReadBalancer(n, dw, chunk_sectors)
+            self.submodules.balancer = balancer
+
+        self.submodules.ctrl = LiteSATAMirroringCtrl(n, max_writes, max_cycles)
+        self.submodules.tx = LiteSATAMirroringTX(n, dw, self.ctrl, balancer)
+        self.submodules.rx = LiteSATAMirroringRX(n, dw, self.ctrl, balancer)
         for i in range(n):
             self.comb += [
                 Record.connect(self.ports[i].sink, self.tx.sinks[i]),
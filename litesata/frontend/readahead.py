@@ -0,0 +1,317 @@
+from litesata.common import *
+
+from litex.soc.interconnect.csr import *
+
+
+class LiteSATAReadAhead(Module, AutoCSR):
+    """SATA read-ahead
+
+    Detect sequential reads on user_port and prefetch the following
+    prefetch_count sectors in an on-chip buffer. Reads contained in the
+    buffer are then served without a command to the drive.
+
+    A read starting where the previous one ended is considered sequential,
+    when it misses the buffer, the prefetch is started after it. A read
+    hitting the end of the buffer starts the prefetch of the next sectors.
+
+    The prefetch runs in background: commands are accepted while it is in
+    flight, reads are served from the buffer as soon as their sectors are
+    received and misses, writes and identify are forwarded (responses of
+    the port are then expected in order, so not with NCQ tags).
+
+    Writes of the port invalidate the buffer. With controller (the
+    controller user_port's crossbar is connected to), writes of the other
+    ports are also seen and invalidate the buffer when they overlap it.
+    Without it, the buffer can serve stale data after writes of other ports.
+
+    Parameters
+    ----------
+    user_port : port
+        User port (from crossbar.get_port()) commands are issued on.
+    prefetch_count : int
+        Number of sectors prefetched (size of the buffer).
+    controller : LiteSATACore, optional
+        Controller whose commands are snooped for writes.
+    with_csr : bool
+        Add CSRs for the counters (hits, misses, prefetches).
+
+    Attributes
+    ----------
+    sink : in
+        Commands input (command_tx_description).
+    source : out
+        Responses output (command_rx_description).
+    hits/misses/prefetches : out
+        Reads served from the buffer, reads forwarded to the drive and
+        prefetches done.
+    """
+    def __init__(self, user_port, prefetch_count=64, controller=None, with_csr=True):
+        if prefetch_count > 2**16-1:
+            raise ValueError("prefetch_count must be lower than 2**16")
+        self.dw = dw = user_port.dw
+        self.controller_dw = user_port.controller_dw
+        self.ndrives = user_port.ndrives
+        self.sink = sink = Sink(user_port.sink.description)
+        self.source = source = Source(command_rx_description(dw))
+
+        self.hits = Signal(32)
+        self.misses = Signal(32)
+        self.prefetches = Signal(32)
+
+        if with_csr:
+            self._hits = CSRStatus(32)
+            self._misses = CSRStatus(32)
+            self._prefetches = CSRStatus(32)
+            self.comb += [
+                self._hits.status.eq(self.hits),
+                self._misses.status.eq(self.misses),
+                self._prefetches.status.eq(self.prefetches)
+            ]
+
+        # # #
+
+        cmd_source, cmd_sink = user_port.sink, user_port.source
+
+        # data per sector on user's port
+        sector_words = sectors2dwords(self.ndrives)*32//dw
+
+        # buffer
+        mem = Memory(dw, prefetch_count*sector_words)
+        wr_port = mem.get_port(write_capable=True)
+        rd_port = mem.get_port(async_read=True)
+        self.specials += mem, wr_port, rd_port
+
+        buffer_valid = Signal()
+        buffer_sector = Signal(48)
+        buffer_end = Signal(48)
+        self.comb += buffer_end.eq(buffer_sector + prefetch_count)
+
+        # prefetch in flight: sectors already received are available
+        # (stale when a write overlapped the buffer during the prefetch)
+        prefetching = Signal()
+        stale = Signal()
+        filled = Signal(max=prefetch_count+1)
+        available = Signal()
+        available_end = Signal(48)
+        self.comb += [
+            available.eq(buffer_valid | (prefetching & ~stale)),
+            If(buffer_valid,
+                available_end.eq(buffer_end)
+            ).Else(
+                available_end.eq(buffer_sector + filled)
+            )
+        ]
+
+        in_buffer = Signal()
+        hit = Signal()
+        pending = Signal()
+        self.comb += [
+            in_buffer.eq(available &
+                         (sink.count != 0) &
+                         (sink.sector >= buffer_sector) &
+                         ((sink.sector + sink.count) <= buffer_end)),
+            hit.eq(in_buffer & ((sink.sector + sink.count) <= available_end)),
+            # read in the buffer, waiting for its sectors to be received
+            pending.eq(in_buffer & ~hit)
+        ]
+
+        # command parameters
+        read = Signal()
+        tag = Signal(5)
+        count = Signal(16)
+        end = Signal(48)
+        offset = Signal(max=prefetch_count*sector_words)
+        load = Signal()
+        self.sync += \
+            If(load,
+                read.eq(sink.read),
+                tag.eq(sink.tag),
+                count.eq(sink.count),
+                end.eq(sink.sector + sink.count),
+                offset.eq((sink.sector - buffer_sector)*sector_words)
+            )
+
+        # sequential streams detection
+        last_end = Signal(48)
+        sequential = Signal()
+        self.sync += \
+            If(load,
+                sequential.eq(sink.sector == last_end),
+                If(sink.read,
+                    last_end.eq(sink.sector + sink.count)
+                )
+            )
+
+        counter = Signal(max=prefetch_count*sector_words+1)
+        counter_reset = Signal()
+        counter_ce = Signal()
+        self.sync += \
+            If(counter_reset,
+                counter.eq(0)
+            ).Elif(counter_ce,
+                counter.eq(counter + 1)
+            )
+
+        # word of the sector served
+        word = Signal(max=sector_words)
+        self.sync += \
+            If(counter_reset,
+                word.eq(0)
+            ).Elif(counter_ce,
+                If(word == (sector_words - 1),
+                    word.eq(0)
+                ).Else(
+                    word.eq(word + 1)
+                )
+            )
+
+        prefetch_issue = Signal()
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            counter_reset.eq(1),
+            If(sink.stb & sink.sop & ~(sink.read & pending),
+                load.eq(1),
+                If(sink.read & hit,
+                    sink.ack.eq(1),
+                    NextState("HIT")
+                ).Else(
+                    NextState("FORWARD")
+                )
+            )
+        )
+
+        # misses, writes and identify are forwarded to the drive,
+        # their responses follow the one of the prefetch in flight
+        fsm.act("FORWARD",
+            Record.connect(sink, cmd_source),
+            If(sink.stb & sink.eop & sink.ack,
+                NextState("WAIT_RESPONSE")
+            )
+        )
+        fsm.act("WAIT_RESPONSE",
+            If(~prefetching,
+                Record.connect(cmd_sink, source),
+                If(cmd_sink.stb & cmd_sink.last & cmd_sink.eop & cmd_sink.ack,
+                    If(read & sequential,
+                        NextState("PREFETCH_CMD")
+                    ).Else(
+                        NextState("IDLE")
+                    )
+                )
+            )
+        )
+
+        # hits are served from the buffer
+        self.comb += rd_port.adr.eq(offset + counter)
+        fsm.act("HIT",
+            source.stb.eq(1),
+            source.sop.eq(word == 0),
+            source.eop.eq(word == (sector_words - 1)),
+            source.read.eq(1),
+            source.tag.eq(tag),
+            source.data.eq(rd_port.dat_r),
+            If(source.ack,
+                counter_ce.eq(1),
+                If(counter == (count*sector_words - 1),
+                    NextState("HIT_DONE")
+                )
+            )
+        )
+        fsm.act("HIT_DONE",
+            source.stb.eq(1),
+            source.sop.eq(1),
+            source.eop.eq(1),
+            source.last.eq(1),
+            source.read.eq(1),
+            source.tag.eq(tag),
+            If(source.ack,
+                If(end == buffer_end,
+                    NextState("PREFETCH_CMD")
+                ).Else(
+                    NextState("IDLE")
+                )
+            )
+        )
+
+        # prefetch of the sectors following the read (one in flight)
+        fsm.act("PREFETCH_CMD",
+            cmd_source.stb.eq(~prefetching),
+            cmd_source.sop.eq(1),
+            cmd_source.eop.eq(1),
+            cmd_source.read.eq(1),
+            cmd_source.sector.eq(end),
+            cmd_source.count.eq(prefetch_count),
+            If(cmd_source.stb & cmd_source.ack,
+                prefetch_issue.eq(1),
+                NextState("IDLE")
+            )
+        )
+
+        # prefetch data is written to the buffer in background
+        wr_counter = Signal(max=prefetch_count*sector_words+1)
+        wr_word = Signal(max=sector_words)
+        prefetch_done = Signal()
+        self.comb += [
+            If(prefetching,
+                cmd_sink.ack.eq(1)
+            ),
+            wr_port.adr.eq(wr_counter),
+            wr_port.dat_w.eq(cmd_sink.data),
+            wr_port.we.eq(prefetching & cmd_sink.stb & ~cmd_sink.last),
+            prefetch_done.eq(prefetching & cmd_sink.stb & cmd_sink.last & cmd_sink.eop)
+        ]
+        self.sync += \
+            If(prefetch_issue,
+                wr_counter.eq(0),
+                wr_word.eq(0),
+                filled.eq(0)
+            ).Elif(wr_port.we,
+                wr_counter.eq(wr_counter + 1),
+                If(wr_word == (sector_words - 1),
+                    wr_word.eq(0),
+                    filled.eq(filled + 1)
+                ).Else(
+                    wr_word.eq(wr_word + 1)
+                )
+            )
+
+        # writes invalidate the buffer
+        write = Signal()
+        self.comb += write.eq(load & sink.write)
+        if controller is not None:
+            snoop = controller.sink
+            self.comb += \
+                If(snoop.stb & snoop.sop & snoop.ack & snoop.write &
+                   (snoop.sector < buffer_end) &
+                   ((snoop.sector + snoop.count) > buffer_sector),
+                    write.eq(1)
+                )
+
+        self.sync += [
+            If(prefetch_issue,
+                prefetching.eq(1),
+                stale.eq(0),
+                buffer_valid.eq(0),
+                buffer_sector.eq(end)
+            ).Elif(prefetch_done,
+                prefetching.eq(0),
+                buffer_valid.eq(~cmd_sink.failed & ~stale & ~write)
+            ).Elif(write,
+                stale.eq(1),
+                buffer_valid.eq(0)
+            )
+        ]
+
+        # counters
+        self.sync += [
+            If(fsm.ongoing("HIT_DONE") & source.ack,
+                self.hits.eq(self.hits + 1)
+            ),
+            If(load & sink.read & ~hit,
+                self.misses.eq(self.misses + 1)
+            ),
+            If(prefetch_issue,
+                self.prefetches.eq(self.prefetches + 1)
+            )
+        ]
@@ -0,0 +1,181 @@
+from litesata.common import *
+
+
+class LiteSATASplitter(Module):
+    """SATA transfers splitter
+
+    Accept transfers with a wide sector count and split them in
+    back-to-back commands of at most max_count sectors on user_port.
+    Intermediate completions are hidden: a single completion with
+    "last" is returned at the end of the transfer, "failed" is set if
+    one of the commands failed.
+
+    Parameters
+    ----------
+    user_port : port
+        User port (from crossbar.get_port()) commands are issued on.
+    count_width : int
+        Width of the sector count of the transfers.
+    max_count : int
+        Maximum sector count of a command (<= 2**16-1).
+
+    Attributes
+    ----------
+    sink : in
+        Transfers input (command_tx_description with count_width).
+    source : out
+        Responses output (command_rx_description).
+    """
+    def __init__(self, user_port, count_width=32, max_count=2**16-1):
+        if max_count > 2**16-1:
+            raise ValueError("max_count must be lower than 2**16")
+        self.dw = dw = user_port.dw
+        self.controller_dw = user_port.controller_dw
+        self.ndrives = user_port.ndrives
+        self.sink = sink = Sink(command_tx_description(dw, count_width))
+        self.source = source = Source(command_rx_description(dw))
+
+        # # #
+
+        cmd_source, cmd_sink = user_port.sink, user_port.source
+
+        # data per sector count on user's port
+        sector_words = sectors2dwords(self.ndrives)*32//dw
+
+        # transfer parameters
+        write = Signal()
+        read = Signal()
+        identify = Signal()
+        flush = Signal()
+        tag = Signal(5)
+        sector = Signal(48)
+        remaining = Signal(count_width)
+        load = Signal()
+        update = Signal()
+
+        chunk_count = Signal(16)
+        last_chunk = Signal()
+        self.comb += [
+            last_chunk.eq(remaining <= max_count),
+            If(last_chunk,
+                chunk_count.eq(remaining)
+            ).Else(
+                chunk_count.eq(max_count)
+            )
+        ]
+        self.sync += \
+            If(load,
+                write.eq(sink.write),
+                read.eq(sink.read),
+                identify.eq(sink.identify),
+                flush.eq(sink.flush),
+                tag.eq(sink.tag),
+                sector.eq(sink.sector),
+                remaining.eq(sink.count)
+            ).Elif(update,
+                sector.eq(sector + chunk_count),
+                remaining.eq(remaining - chunk_count)
+            )
+
+        counter = Signal(32)
+        counter_reset = Signal()
+        counter_ce = Signal()
+        self.sync += \
+            If(counter_reset,
+                counter.eq(0)
+            ).Elif(counter_ce,
+                counter.eq(counter + 1)
+            )
+
+        # issued commands / received completions
+        issued = Signal(count_width)
+        issued_ce = Signal()
+        completions = Signal(count_width)
+        completions_ce = Signal()
+        tx_done = Signal()
+        self.sync += [
+            If(load,
+                issued.eq(0),
+                completions.eq(0),
+                tx_done.eq(0)
+            ).Else(
+                If(issued_ce,
+                    issued.eq(issued + 1),
+                    If(last_chunk,
+                        tx_done.eq(1)
+                    )
+                ),
+                If(completions_ce,
+                    completions.eq(completions + 1)
+                )
+            )
+        ]
+
+        # commands
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            counter_reset.eq(1),
+            If(sink.stb & sink.sop,
+                load.eq(1),
+                NextState("SEND")
+            )
+        )
+        self.comb += [
+            cmd_source.sop.eq(counter == 0),
+            If(write,
+                cmd_source.eop.eq(counter == (chunk_count*sector_words - 1))
+            ).Else(
+                cmd_source.eop.eq(1)
+            ),
+            cmd_source.write.eq(write),
+            cmd_source.read.eq(read),
+            cmd_source.identify.eq(identify),
+            cmd_source.flush.eq(flush),
+            cmd_source.tag.eq(tag),
+            cmd_source.sector.eq(sector),
+            cmd_source.count.eq(chunk_count),
+            cmd_source.data.eq(sink.data)
+        ]
+        fsm.act("SEND",
+            cmd_source.stb.eq(sink.stb),
+            # command of a read is only consumed with the last chunk
+            sink.ack.eq(cmd_source.ack & (write | last_chunk)),
+            If(cmd_source.stb & cmd_source.ack,
+                counter_ce.eq(1),
+                If(cmd_source.eop,
+                    counter_reset.eq(1),
+                    issued_ce.eq(1),
+                    update.eq(1),
+                    If(last_chunk,
+                        NextState("WAIT_COMPLETION")
+                    )
+                )
+            )
+        )
+
+        # responses
+        completion = Signal()
+        final = Signal()
+        failed = Signal()
+        self.comb += [
+            completion.eq(cmd_sink.stb & cmd_sink.last),
+            final.eq(tx_done & (issued == (completions + 1))),
+            Record.connect(cmd_sink, source),
+            If(completion & ~final,
+                source.stb.eq(0),
+                cmd_sink.ack.eq(1)
+            ),
+            source.failed.eq(cmd_sink.failed | failed),
+            completions_ce.eq(completion & cmd_sink.eop & cmd_sink.ack)
+        ]
+        self.sync += \
+            If(load,
+                failed.eq(0)
+            ).Elif(cmd_sink.stb & cmd_sink.ack,
+                failed.eq(failed | cmd_sink.failed)
+            )
+        fsm.act("WAIT_COMPLETION",
+            If(completion & final & cmd_sink.eop & cmd_sink.ack,
+                NextState("IDLE")
+            )
+        )
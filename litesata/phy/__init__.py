@@ -2,9 +2,25 @@ from litesata.common import *
 from litesata.phy.ctrl import *
 from litesata.phy.datapath import *
 
+from litex.soc.interconnect.csr import *
 
-class LiteSATAPHY(Module):
-    def __init__(self, device, clock_pads_or_refclk, pads, revision, clk_freq, trx_dw=16):
+
+class LiteSATAPHY(Module, AutoCSR):
+    """SATA PHY
+
+    The line rate is fixed to revision, unless speed_negotiation is enabled:
+    the PHY then negotiates the highest rate (up to revision) supported by
+    the drive at runtime and reports it on ctrl.rate.
+
+    Link initialization timings (in us) and stability check are configured
+    with the ctrl parameters, time_scale scales all the timings of the
+    ctrl and of the transceiver's reset watchdogs (for simulation).
+    """
+    def __init__(self, device, clock_pads_or_refclk, pads, revision, clk_freq, trx_dw=16,
+                 speed_negotiation=False,
+                 retry_timeout=10000, align_timeout=873,
+                 stability_timeout=100000, stability_primitives=None,
+                 time_scale=1.0):
         self.clock_pads = clock_pads_or_refclk
         self.pads = pads
         self.revision = revision
@@ -13,13 +29,20 @@ class LiteSATAPHY(Module):
         if device[:3] == "xc7": # Kintex 7
             from litesata.phy.k7.trx import K7LiteSATAPHYTRX
             from litesata.phy.k7.crg import K7LiteSATAPHYCRG
-            self.submodules.trx = K7LiteSATAPHYTRX(pads, revision, trx_dw)
-            self.submodules.crg = K7LiteSATAPHYCRG(clock_pads_or_refclk, pads, self.trx, revision, clk_freq)
+            self.submodules.trx = K7LiteSATAPHYTRX(pads, revision, trx_dw, speed_negotiation)
+            self.submodules.crg = K7LiteSATAPHYCRG(clock_pads_or_refclk, pads, self.trx, revision, clk_freq,
+                                                   speed_negotiation, time_scale)
         else:
             raise NotImplementedError
 
         # Control
-        self.submodules.ctrl = LiteSATAPHYCtrl(self.trx, self.crg, clk_freq)
+        self.submodules.ctrl = LiteSATAPHYCtrl(self.trx, self.crg, clk_freq, revision,
+                                               speed_negotiation,
+                                               retry_timeout=retry_timeout,
+                                               align_timeout=align_timeout,
+                                               stability_timeout=stability_timeout,
+                                               stability_primitives=stability_primitives,
+                                               time_scale=time_scale)
 
         # Datapath
         self.submodules.datapath = LiteSATAPHYDatapath(self.trx, self.ctrl)
@@ -2,11 +2,37 @@ from litesata.common import *
 
 from litex.gen.genlib.misc import WaitTimer
 
+from litex.soc.interconnect.csr import *
 
-class LiteSATAPHYCtrl(Module):
-    def __init__(self, trx, crg, clk_freq):
+
+class LiteSATAPHYCtrl(Module, AutoCSR):
+    """SATA PHY control
+
+    Link initialization (OOB, COMINIT/COMWAKE, ALIGN) and monitoring.
+
+    With speed_negotiation, initialization starts at the highest rate
+    (revision) and steps down to the next lower rate (wrapping around to
+    the highest one after sata_gen1) after align_retries failed alignments:
+    a drive not supporting the current rate never sends ALIGNs at it. The
+    negotiated rate is reported on rate and in a status register.
+
+    OOB is retried after retry_timeout us without answer from the drive,
+    initialization is restarted after align_timeout us without alignment.
+    Once aligned, ready is declared after stability_timeout us without
+    misalignment or, with stability_primitives, as soon as this number of
+    consecutive aligned primitives has been received. All the timings are
+    multiplied by time_scale (ex: 1/1000 to bring the link up in a few
+    microseconds in simulation).
+    """
+    def __init__(self, trx, crg, clk_freq, revision="sata_gen3",
+                 speed_negotiation=False, align_retries=2,
+                 retry_timeout=10000, align_timeout=873,
+                 stability_timeout=100000, stability_primitives=None,
+                 time_scale=1.0):
         self.clk_freq = clk_freq
+        self.time_scale = time_scale
         self.ready = Signal()
+        self.rate = Signal(2, reset=revisions.index(revision))
         self.sink = sink = Sink(phy_description(32))
         self.source = source = Source(phy_description(32))
 
@@ -17,8 +43,8 @@ class LiteSATAPHYCtrl(Module):
             sink.ack.eq(1)
         ]
 
-        retry_timer = WaitTimer(self.us(10000))
-        align_timer = WaitTimer(self.us(873))
+        retry_timer = WaitTimer(self.us(retry_timeout))
+        align_timer = WaitTimer(self.us(align_timeout))
         self.submodules += align_timer, retry_timer
 
         align_det = Signal()
@@ -42,6 +68,32 @@ class LiteSATAPHYCtrl(Module):
             )
         ]
 
+        # speed negotiation: step down rate on alignment failures
+        if speed_negotiation:
+            self._rate = CSRStatus(2)
+            self.comb += self._rate.status.eq(self.rate)
+
+            align_failures = Signal(max=max(2, align_retries))
+            self.sync += \
+                If(self.ready,
+                    align_failures.eq(0)
+                ).Elif(align_timer.done,
+                    If(align_failures == (align_retries - 1),
+                        align_failures.eq(0),
+                        If(self.rate == 0,
+                            self.rate.eq(revisions.index(revision))
+                        ).Else(
+                            self.rate.eq(self.rate - 1)
+                        )
+                    ).Else(
+                        align_failures.eq(align_failures + 1)
+                    )
+                )
+            self.comb += trx.rate.eq(self.rate)
+            rate_ready = trx.rate_ready
+        else:
+            rate_ready = 1
+
         self.fsm = fsm = ResetInserter()(FSM(reset_state="RESET"))
         self.submodules += fsm
         self.comb += fsm.reset.eq(retry_timer.done | align_timer.done)
@@ -50,7 +102,9 @@ class LiteSATAPHYCtrl(Module):
             trx.rx_cdrhold.eq(1),
             crg.rx_reset.eq(1),
             crg.tx_reset.eq(1),
-            NextState("AWAIT_CRG_RESET")
+            If(rate_ready,
+                NextState("AWAIT_CRG_RESET")
+            )
         )
         fsm.act("AWAIT_CRG_RESET",
             trx.tx_idle.eq(1),
@@ -146,16 +200,31 @@ class LiteSATAPHYCtrl(Module):
             )
         )
 
-        # wait alignement stability for 100ms before declaring ctrl is ready,
+        # wait alignement stability (stability_timeout or stability_primitives
+        # consecutive aligned primitives) before declaring ctrl is ready,
         # reset the RX part of the transceiver when misalignment is detected.
-        stability_timer = WaitTimer(100*clk_freq//1000)
+        stability_timer = WaitTimer(self.us(stability_timeout))
         self.submodules += stability_timer
 
+        stable = Signal()
+        if stability_primitives is not None:
+            aligned_counter = Signal(max=stability_primitives+1)
+            self.sync += \
+                If(~fsm.ongoing("READY") | misalign_det,
+                    aligned_counter.eq(0)
+                ).Elif(sink.stb & (sink.charisk == 0b0001) & ~stable,
+                    aligned_counter.eq(aligned_counter + 1)
+                )
+            self.comb += stable.eq(stability_timer.done |
+                                   (aligned_counter == stability_primitives))
+        else:
+            self.comb += stable.eq(stability_timer.done)
+
         fsm.act("READY",
             source.data.eq(primitives["SYNC"]),
             source.charisk.eq(0b0001),
             stability_timer.wait.eq(1),
-            self.ready.eq(stability_timer.done),
+            self.ready.eq(stable),
             If(trx.rx_idle,
                 NextState("RESET"),
             ).Elif(misalign_det,
@@ -173,4 +242,4 @@ class LiteSATAPHYCtrl(Module):
 
     def us(self, t):
         clk_period_us = 1000000/self.clk_freq
-        return ceil(t/clk_period_us)
+        return ceil(t*self.time_scale/clk_period_us)
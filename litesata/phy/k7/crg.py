@@ -5,7 +5,8 @@ from litex.gen.genlib.misc import WaitTimer
 
 
 class K7LiteSATAPHYCRG(Module):
-    def __init__(self, clock_pads_or_refclk, pads, gtx, revision, clk_freq):
+    def __init__(self, clock_pads_or_refclk, pads, gtx, revision, clk_freq, speed_negotiation=False,
+                 time_scale=1.0):
         self.tx_reset = Signal()
         self.rx_reset = Signal()
         self.ready = Signal()
@@ -41,15 +42,29 @@ class K7LiteSATAPHYCRG(Module):
             "sata_gen2":    8.0*gtx.dw/16,
             "sata_gen3":    4.0*gtx.dw/16
         }
-        mmcm_div = mmcm_div_config[revision]
-        use_mmcm = mmcm_mult/mmcm_div != 1.0
+        #   With speed negotiation, one MMCM output is generated per rate
+        #   (up to revision) and selected at runtime by gtx.rate through
+        #   glitch-free BUFGMUXs. TX is reseted by the ctrl on rate changes.
+        if speed_negotiation:
+            mmcm_divs = [mmcm_div_config[r] for r in revisions[:revisions.index(revision)+1]]
+        else:
+            mmcm_divs = [mmcm_div_config[revision]]
+        use_mmcm = speed_negotiation or mmcm_mult/mmcm_divs[0] != 1.0
 
         if use_mmcm:
             mmcm_reset = Signal()
             mmcm_locked = Signal()
             mmcm_fb = Signal()
             mmcm_clk_i = Signal()
-            mmcm_clk0_o = Signal()
+            mmcm_clk_o = [Signal() for div in mmcm_divs]
+            mmcm_outputs = {}
+            for i, (div, clk) in enumerate(zip(mmcm_divs, mmcm_clk_o)):
+                if i == 0:
+                    mmcm_outputs["p_CLKOUT0_DIVIDE_F"] = div
+                else:
+                    mmcm_outputs["p_CLKOUT{}_DIVIDE".format(i)] = int(div)
+                mmcm_outputs["p_CLKOUT{}_PHASE".format(i)] = 0.000
+                mmcm_outputs["o_CLKOUT{}".format(i)] = clk
             self.specials += [
                 Instance("BUFG", i_I=gtx.txoutclk, o_O=mmcm_clk_i),
                 Instance("MMCME2_ADV",
@@ -64,11 +79,22 @@ class K7LiteSATAPHYCRG(Module):
                      p_CLKFBOUT_MULT_F=mmcm_mult, p_CLKFBOUT_PHASE=0.000, p_DIVCLK_DIVIDE=1,
                      i_CLKIN1=mmcm_clk_i, i_CLKFBIN=mmcm_fb, o_CLKFBOUT=mmcm_fb,
 
-                     # CLK0
-                     p_CLKOUT0_DIVIDE_F=mmcm_div, p_CLKOUT0_PHASE=0.000, o_CLKOUT0=mmcm_clk0_o,
+                     # CLKs
+                     **mmcm_outputs
                 ),
-                Instance("BUFG", i_I=mmcm_clk0_o, o_O=self.cd_sata_tx.clk),
             ]
+            if len(mmcm_clk_o) == 1:
+                self.specials += Instance("BUFG", i_I=mmcm_clk_o[0], o_O=self.cd_sata_tx.clk)
+            else:
+                sata_tx_clk = mmcm_clk_o[0]
+                for i, clk in enumerate(mmcm_clk_o[1:], 1):
+                    sel = Signal()
+                    sata_tx_clk_mux = Signal()
+                    self.comb += sel.eq(gtx.rate == i)
+                    self.specials += Instance("BUFGMUX",
+                        i_I0=sata_tx_clk, i_I1=clk, i_S=sel, o_O=sata_tx_clk_mux)
+                    sata_tx_clk = sata_tx_clk_mux
+                self.comb += self.cd_sata_tx.clk.eq(sata_tx_clk)
         else:
             mmcm_locked = Signal(reset=1)
             mmcm_reset = Signal()
@@ -158,7 +184,7 @@ class K7LiteSATAPHYCRG(Module):
             self.tx_ready.eq(1)
         )
 
-        tx_ready_timer = WaitTimer(1*clk_freq//1000)
+        tx_ready_timer = WaitTimer(ceil(time_scale*clk_freq/1000))
         self.submodules += tx_ready_timer
         self.comb += [
             tx_ready_timer.wait.eq(~self.tx_ready),
@@ -220,7 +246,7 @@ class K7LiteSATAPHYCRG(Module):
             self.rx_ready.eq(1)
         )
 
-        rx_ready_timer = WaitTimer(1*clk_freq//1000)
+        rx_ready_timer = WaitTimer(ceil(time_scale*clk_freq/1000))
         self.submodules += rx_ready_timer
         self.comb += [
             rx_ready_timer.wait.eq(~self.rx_ready),
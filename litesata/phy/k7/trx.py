@@ -36,8 +36,114 @@ class _LowPassFilter(Module):
         self.comb += self.timer.wait.eq(i == i_d)
 
 
+# RXCDR_CFG of each rate
+cdr_config = {
+    "sata_gen1": 0x0380008BFF40100008,
+    "sata_gen2": 0x0388008BFF40200008,
+    "sata_gen3": 0x0380008BFF10200010
+}
+
+
+class _RateReconfig(Module):
+    """Runtime rate reconfiguration
+
+    When trx.rate changes, write the RX CDR configuration of the new rate
+    through DRP (read-modify-write of RXCDR_CFG) then apply the new rate
+    on the TX/RX output dividers (TXRATE/RXRATE).
+    """
+    def __init__(self, trx, revision, cdr_config):
+        self.txrate = Signal(3)
+        self.rxrate = Signal(3)
+
+        # # #
+
+        # RXCDR_CFG (72 bits) at DRP addresses 0x0a8-0x0ac
+        drp_addr = 0x0a8
+        drp_words = 5
+        drp_masks = [0xffff]*(drp_words-1) + [0x00ff]
+        cdr_words = [Array((cdr_config[r] >> 16*i) & drp_masks[i] for r in revisions)
+                     for i in range(drp_words)]
+
+        rate = Signal(2, reset=revisions.index(revision))
+        target = Signal(2)
+        self.comb += trx.rate_ready.eq(trx.rate == rate)
+
+        word = Signal(max=drp_words)
+        word_reset = Signal()
+        word_ce = Signal()
+        self.sync += \
+            If(word_reset,
+                word.eq(0)
+            ).Elif(word_ce,
+                word.eq(word + 1)
+            )
+
+        value = Signal(16)
+        self.comb += value.eq(Array(cdr_words[i][target] for i in range(drp_words))[word])
+
+        drpdo = Signal(16)
+        drpdo_ce = Signal()
+        self.sync += If(drpdo_ce, drpdo.eq(trx.drpdo))
+
+        self.comb += [
+            trx.drpaddr.eq(drp_addr + word),
+            trx.drpdi.eq((drpdo & ~Array(drp_masks)[word]) | value)
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            word_reset.eq(1),
+            If(trx.rate != rate,
+                NextState("READ")
+            )
+        )
+        fsm.act("READ",
+            trx.drpen.eq(1),
+            NextState("WAIT_READ")
+        )
+        fsm.act("WAIT_READ",
+            drpdo_ce.eq(1),
+            If(trx.drprdy,
+                NextState("WRITE")
+            )
+        )
+        fsm.act("WRITE",
+            trx.drpen.eq(1),
+            trx.drpwe.eq(1),
+            NextState("WAIT_WRITE")
+        )
+        fsm.act("WAIT_WRITE",
+            If(trx.drprdy,
+                word_ce.eq(1),
+                If(word == (drp_words - 1),
+                    NextState("DONE")
+                ).Else(
+                    NextState("READ")
+                )
+            )
+        )
+        fsm.act("DONE",
+            NextState("IDLE")
+        )
+        self.sync += [
+            If(fsm.ongoing("IDLE"),
+                target.eq(trx.rate)
+            ),
+            If(fsm.ongoing("DONE"),
+                rate.eq(target)
+            )
+        ]
+
+        # output dividers: /4 (sata_gen1), /2 (sata_gen2), /1 (sata_gen3)
+        rate_config = Array([0b011, 0b010, 0b001])
+        self.comb += [
+            self.txrate.eq(rate_config[rate]),
+            self.rxrate.eq(rate_config[rate])
+        ]
+
+
 class K7LiteSATAPHYTRX(Module):
-    def __init__(self, pads, revision, dw=16):
+    def __init__(self, pads, revision, dw=16, speed_negotiation=False):
     # Common signals
         self.dw = dw
         if dw not in [16, 32]:
@@ -58,6 +164,9 @@ class K7LiteSATAPHYTRX(Module):
         self.rx_cominit_stb = Signal()  #o
         self.rx_comwake_stb = Signal()  #o
 
+        self.rate = Signal(2, reset=revisions.index(revision))  #i
+        self.rate_ready = Signal(reset=1)                        #o
+
         # datapath
         self.sink = Sink(phy_description(dw))
         self.source = Source(phy_description(dw))
@@ -144,13 +253,21 @@ class K7LiteSATAPHYTRX(Module):
         rxout_div = div_config[revision]
         txout_div = div_config[revision]
 
-        cdr_config = {
-            "sata_gen1": 0x0380008BFF40100008,
-            "sata_gen2": 0x0388008BFF40200008,
-            "sata_gen3": 0x0380008BFF10200010
-        }
         rxcdr_cfg = cdr_config[revision]
 
+    # Runtime rate (speed negotiation)
+        #   CPLL VCO stays @ 3GHz, line rate is selected with the output
+        #   dividers and RX CDR is reconfigured through DRP.
+        txrate = Signal(3)
+        rxrate = Signal(3)
+        if speed_negotiation:
+            self.submodules.rate_reconfig = _RateReconfig(self, revision, cdr_config)
+            self.comb += self.drpclk.eq(ClockSignal())
+            self.specials += [
+                MultiReg(self.rate_reconfig.txrate, txrate, "sata_tx"),
+                MultiReg(self.rate_reconfig.rxrate, rxrate, "sata_rx"),
+            ]
+
     # Specific / Generic signals encoding/decoding
         self.comb += [
             self.txelecidle.eq(self.tx_idle | self.txpd),
@@ -580,7 +697,7 @@ class K7LiteSATAPHYTRX(Module):
 
                 # PCI Express Ports
                     #o_PHYSTATUS=,
-                    i_RXRATE=0,
+                    i_RXRATE=rxrate,
                     #o_RXVALID=,
 
                 # Power-Down Ports
@@ -802,7 +919,7 @@ class K7LiteSATAPHYTRX(Module):
                 # Transmit Ports - PCI Express Ports
                     i_TXELECIDLE=txelecidle,
                     i_TXMARGIN=0,
-                    i_TXRATE=0,
+                    i_TXRATE=txrate,
                     i_TXSWING=0,
 
                 # Transmit Ports - Pattern Generator Ports
@@ -0,0 +1,206 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.adapters import *
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+def pack(layout, **kwargs):
+    value = 0
+    offset = 0
+    for name, width in layout:
+        value |= (kwargs.get(name, 0) & (2**width-1)) << offset
+        offset += width
+    return value
+
+
+def unpack(layout, value):
+    fields = {}
+    for name, width in layout:
+        fields[name] = value & (2**width-1)
+        value >>= width
+    return fields
+
+
+class AXIStreamDriver(Module):
+    def __init__(self, dw, user_width):
+        self.source = Record(axi_stream_layout(dw, user_width))
+
+        # # #
+
+        self.beats = []
+        self.stalls = 0
+
+    def send(self, data, user):
+        for i, d in enumerate(data):
+            self.beats.append((d, user, i == len(data)-1))
+        while len(self.beats):
+            yield
+
+    def do_simulation(self, selfp):
+        if selfp.source.tvalid:
+            if selfp.source.tready:
+                self.beats.pop(0)
+            else:
+                self.stalls += 1
+        if len(self.beats):
+            data, user, last = self.beats[0]
+            selfp.source.tvalid = 1
+            selfp.source.tdata = data
+            selfp.source.tuser = user
+            selfp.source.tlast = last
+        else:
+            selfp.source.tvalid = 0
+
+
+class AXIStreamMonitor(Module):
+    def __init__(self, dw, user_width):
+        self.sink = Record(axi_stream_layout(dw, user_width))
+
+        # # #
+
+        self.beats = []
+
+    def do_simulation(self, selfp):
+        selfp.sink.tready = 1
+        if selfp.sink.tvalid:
+            self.beats.append((selfp.sink.tdata, selfp.sink.tuser, selfp.sink.tlast))
+
+
+# params are carried above the dw bits of data
+class AvalonSTDriver(Module):
+    def __init__(self, dw, user_width):
+        self.source = Record(avalon_st_layout(dw + user_width))
+        self.dw = dw
+
+        # # #
+
+        self.beats = []
+        self.stalls = 0
+
+    def send(self, data, user):
+        for i, d in enumerate(data):
+            self.beats.append(((user << self.dw) | d, i == 0, i == len(data)-1))
+        while len(self.beats):
+            yield
+
+    def do_simulation(self, selfp):
+        if selfp.source.valid:
+            if selfp.source.ready:
+                self.beats.pop(0)
+            else:
+                self.stalls += 1
+        if len(self.beats):
+            data, sop, eop = self.beats[0]
+            selfp.source.valid = 1
+            selfp.source.data = data
+            selfp.source.startofpacket = sop
+            selfp.source.endofpacket = eop
+        else:
+            selfp.source.valid = 0
+
+
+class AvalonSTMonitor(Module):
+    def __init__(self, dw, user_width):
+        self.sink = Record(avalon_st_layout(dw + user_width))
+        self.dw = dw
+
+        # # #
+
+        self.beats = []
+        self.sop_errors = 0
+        self.first = True
+
+    def do_simulation(self, selfp):
+        selfp.sink.ready = 1
+        if selfp.sink.valid:
+            data = selfp.sink.data & (2**self.dw-1)
+            user = selfp.sink.data >> self.dw
+            last = selfp.sink.endofpacket
+            # startofpacket must be set on the first beat of each packet only
+            if selfp.sink.startofpacket != self.first:
+                self.sop_errors += 1
+            self.first = bool(last)
+            self.beats.append((data, user, last))
+
+
+class TB(Module):
+    def __init__(self, register=False, avalon=False):
+        self.submodules.controller = ControllerModel()
+        self.submodules.crossbar = LiteSATACrossbar(self.controller)
+        port = self.crossbar.get_port(32)
+
+        self.tx_layout = command_tx_description(32).param_layout
+        self.rx_layout = command_rx_description(32).param_layout
+        tx_user_width = len(port.sink.param)
+        rx_user_width = len(port.source.param)
+        if avalon:
+            self.submodules.adapter = LiteSATAAvalonSTAdapter(port, register)
+            self.submodules.driver = AvalonSTDriver(32, tx_user_width)
+            self.submodules.monitor = AvalonSTMonitor(32, rx_user_width)
+            self.comb += [
+                self.adapter.sink.valid.eq(self.driver.source.valid),
+                self.driver.source.ready.eq(self.adapter.sink.ready),
+                self.adapter.sink.data.eq(self.driver.source.data),
+                self.adapter.sink.startofpacket.eq(self.driver.source.startofpacket),
+                self.adapter.sink.endofpacket.eq(self.driver.source.endofpacket),
+
+                self.monitor.sink.valid.eq(self.adapter.source.valid),
+                self.adapter.source.ready.eq(self.monitor.sink.ready),
+                self.monitor.sink.data.eq(self.adapter.source.data),
+                self.monitor.sink.startofpacket.eq(self.adapter.source.startofpacket),
+                self.monitor.sink.endofpacket.eq(self.adapter.source.endofpacket)
+            ]
+        else:
+            self.submodules.adapter = LiteSATAAXIStreamAdapter(port, register)
+            self.submodules.driver = AXIStreamDriver(32, tx_user_width)
+            self.submodules.monitor = AXIStreamMonitor(32, rx_user_width)
+            self.comb += [
+                self.adapter.sink.tvalid.eq(self.driver.source.tvalid),
+                self.driver.source.tready.eq(self.adapter.sink.tready),
+                self.adapter.sink.tdata.eq(self.driver.source.tdata),
+                self.adapter.sink.tlast.eq(self.driver.source.tlast),
+                self.adapter.sink.tuser.eq(self.driver.source.tuser),
+
+                self.monitor.sink.tvalid.eq(self.adapter.source.tvalid),
+                self.adapter.source.tready.eq(self.monitor.sink.tready),
+                self.monitor.sink.tdata.eq(self.adapter.source.tdata),
+                self.monitor.sink.tlast.eq(self.adapter.source.tlast),
+                self.monitor.sink.tuser.eq(self.adapter.source.tuser)
+            ]
+
+    def gen_simulation(self, selfp):
+        self.controller.malloc(0, 64)
+        count = 4
+        write_data = [seed_to_data(i, True) for i in range(sectors2dwords(count))]
+
+        # write
+        user = pack(self.tx_layout, write=1, sector=2, count=count)
+        yield from self.driver.send(write_data, user)
+        while len(self.monitor.beats) < 1:
+            yield
+        write_stalls = self.driver.stalls
+
+        # read
+        user = pack(self.tx_layout, read=1, sector=2, count=count)
+        yield from self.driver.send([0], user)
+        while not (len(self.monitor.beats) and
+                   unpack(self.rx_layout, self.monitor.beats[-1][1])["last"] and
+                   unpack(self.rx_layout, self.monitor.beats[-1][1])["read"]):
+            yield
+
+        # check results
+        read_data = [data for data, user, last in self.monitor.beats
+                     if not unpack(self.rx_layout, user)["last"]]
+        s, l, e = check(write_data, read_data)
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+        print("write stalls {} ({} beats)".format(write_stalls, len(write_data)))
+        if hasattr(self.monitor, "sop_errors"):
+            print("startofpacket errors " + str(self.monitor.sop_errors))
+
+if __name__ == "__main__":
+    run_simulation(TB(), ncycles=4096, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(register=True), ncycles=4096)
+    run_simulation(TB(avalon=True), ncycles=4096)
+    run_simulation(TB(register=True, avalon=True), ncycles=4096)
@@ -0,0 +1,64 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTChecker
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+class TB(Module):
+    def __init__(self, policy, weights, counts, max_counts=None):
+        if max_counts is None:
+            max_counts = [None]*len(weights)
+        self.submodules.core = ControllerModel(debug=False)
+        self.submodules.crossbar = LiteSATACrossbar(self.core, policy)
+        self.checkers = []
+        for i, (weight, max_count) in enumerate(zip(weights, max_counts)):
+            port = self.crossbar.get_port(weight=weight, max_count=max_count)
+            checker = LiteSATABISTChecker(port)
+            setattr(self.submodules, "checker{}".format(i), checker)
+            self.checkers.append(checker)
+        self.policy = policy
+        self.weights = weights
+        self.counts = counts
+        self.max_counts = max_counts
+
+    def gen_simulation(self, selfp):
+        self.core.malloc(0, 1024)
+        n = len(self.checkers)
+        checkers = [getattr(selfp, "checker{}".format(i)) for i in range(n)]
+        commands = [0]*n
+        sectors = [0]*n
+        latencies = [0]*n
+        started = [None]*n
+        for cycle in range(8192):
+            for i, checker in enumerate(checkers):
+                checker.start = 0
+                if started[i] is not None and cycle > started[i] + 1 and checker.done:
+                    commands[i] += 1
+                    sectors[i] += self.counts[i]
+                    latencies[i] = max(latencies[i], cycle - started[i])
+                    started[i] = None
+                if started[i] is None:
+                    checker.sector = 0
+                    checker.count = self.counts[i]
+                    checker.start = 1
+                    started[i] = cycle
+            yield
+        print("[{}] weights {} / counts {} / max_counts {}".format(
+            self.policy, self.weights, self.counts, self.max_counts))
+        for i in range(n):
+            print("  port {}: {} commands / {} sectors / max latency {} cycles".format(
+                i, commands[i], sectors[i], latencies[i]))
+
+if __name__ == "__main__":
+    for policy, weights, counts in [
+        ("roundrobin", [1, 1, 1], [1, 1, 8]),
+        ("priority", [2, 1, 0], [1, 1, 8]),
+        ("weighted", [4, 2, 1], [1, 1, 1]),
+        ("deficit", [8, 8, 8], [1, 2, 8])]:
+        run_simulation(TB(policy, weights, counts), ncycles=8192 + 16)
+
+    # slicing of large commands bounds latency of small commands
+    for max_counts in [None, [4, None]]:
+        run_simulation(TB("roundrobin", [1, 1], [32, 1], max_counts), ncycles=8192 + 16)
@@ -8,12 +8,12 @@ from test.model.hdd import *
 
 
 class TB(Module):
-    def __init__(self, dw=64):
+    def __init__(self, dw=64, core_dw=32):
         self.submodules.hdd = HDD(
                 link_debug=False, link_random_level=0,
                 transport_debug=False, transport_loopback=False,
                 hdd_debug=True)
-        self.submodules.core = LiteSATACore(self.hdd.phy)
+        self.submodules.core = LiteSATACore(self.hdd.phy, dw=core_dw)
         self.submodules.crossbar = LiteSATACrossbar(self.core)
         self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port(dw))
         self.submodules.checker = LiteSATABISTChecker(self.crossbar.get_port(dw))
@@ -53,4 +53,7 @@ class TB(Module):
 
 if __name__ == "__main__":
     run_simulation(TB(32), ncycles=8192*2, vcd_name="my.vcd", keep_files=True)
-    run_simulation(TB(64), ncycles=8192*2, vcd_name="my.vcd", keep_files=True)
\ No newline at end of file
+    run_simulation(TB(64), ncycles=8192*2, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(64, core_dw=64), ncycles=8192*2, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(128, core_dw=64), ncycles=8192*2, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(128, core_dw=128), ncycles=8192*2, vcd_name="my.vcd", keep_files=True)
\ No newline at end of file
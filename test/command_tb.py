@@ -6,11 +6,12 @@ from test.model.hdd import *
 
 
 class CommandTXPacket(list):
-    def __init__(self, write=0, read=0, sector=0, count=0, data=[]):
+    def __init__(self, write=0, read=0, flush=0, sector=0, count=0, data=[]):
         self.ongoing = False
         self.done = False
         self.write = write
         self.read = read
+        self.flush = flush
         self.sector = sector
         self.count = count
         for d in data:
@@ -25,6 +26,7 @@ class CommandStreamer(PacketStreamer):
         PacketStreamer.do_simulation(self, selfp)
         selfp.source.write = self.packet.write
         selfp.source.read = self.packet.read
+        selfp.source.flush = self.packet.flush
         selfp.source.sector = self.packet.sector
         selfp.source.count = self.packet.count
 
@@ -35,29 +37,46 @@ class CommandRXPacket(list):
         self.done = False
         self.write = 0
         self.read = 0
+        self.flush = 0
+        self.last = 0
         self.failed = 0
 
 
 class CommandLogger(PacketLogger):
-    def __init__(self):
+    def __init__(self, stall=0):
         PacketLogger.__init__(self, command_rx_description(32), CommandRXPacket)
+        self.stall = stall
+        self.stall_counter = 0
+        self.packets = []
+
+    def receive_responses(self, n):
+        while len([p for p in self.packets if p.last]) < n:
+            yield
 
     def do_simulation(self, selfp):
-        selfp.sink.ack = 1
-        if selfp.sink.stb == 1 and selfp.sink.sop == 1:
-            self.packet = CommandRXPacket()
-            self.packet.write = selfp.sink.write
-            self.packet.read = selfp.sink.read
-            self.packet.failed = selfp.sink.failed
-            self.packet.append(selfp.sink.data)
-        elif selfp.sink.stb:
+        if selfp.sink.stb == 1 and selfp.sink.ack == 1:
+            if selfp.sink.sop == 1:
+                self.packet = CommandRXPacket()
+                self.packet.write = selfp.sink.write
+                self.packet.read = selfp.sink.read
+                self.packet.flush = selfp.sink.flush
+                self.packet.last = selfp.sink.last
+                self.packet.failed = selfp.sink.failed
             self.packet.append(selfp.sink.data)
-        if selfp.sink.stb == 1 and selfp.sink.eop == 1:
-            self.packet.done = True
+            if selfp.sink.eop == 1:
+                self.packet.done = True
+                self.packets.append(self.packet)
+                self.stall_counter = 0
+        # consumer busy for stall cycles after each packet
+        if self.stall_counter < self.stall:
+            self.stall_counter += 1
+            selfp.sink.ack = 0
+        else:
+            selfp.sink.ack = 1
 
 
 class TB(Module):
-    def __init__(self):
+    def __init__(self, stall=0):
         self.submodules.hdd = HDD(
                 link_debug=False, link_random_level=50,
                 transport_debug=False, transport_loopback=False,
@@ -67,7 +86,7 @@ class TB(Module):
         self.submodules.streamer = CommandStreamer()
         self.submodules.streamer_randomizer = Randomizer(command_tx_description(32), level=50)
 
-        self.submodules.logger = CommandLogger()
+        self.submodules.logger = CommandLogger(stall)
         self.submodules.logger_randomizer = Randomizer(command_rx_description(32), level=50)
 
         self.submodules.pipeline = Pipeline(
@@ -95,5 +114,46 @@ class TB(Module):
         s, l, e = check(write_data, read_data)
         print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
 
+        # back-to-back commands (next command sent while the response
+        # of the previous one is stalled by the consumer)
+        self.logger.packets = []
+        write_data = [seed_to_data(i, True) for i in range(sectors2dwords(2))]
+        for i in range(2):
+            offset = sectors2dwords(i)
+            write_packet = CommandTXPacket(write=1, sector=8+i, count=1,
+                data=write_data[offset:offset+sectors2dwords(1)])
+            yield from self.streamer.send(write_packet, blocking=False)
+        read_packet = CommandTXPacket(read=1, sector=8, count=2)
+        yield from self.streamer.send(read_packet, blocking=False)
+        yield from self.logger.receive_responses(3)
+        responses = [p for p in self.logger.packets if p.last]
+        read_data = []
+        for p in self.logger.packets:
+            if not p.last:
+                read_data += p
+
+        # check results
+        print("failed: " + str([p.failed for p in responses]))
+        s, l, e = check(write_data, read_data)
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+
+        # flush alone, then issued right behind queued writes: it must
+        # complete last
+        self.logger.packets = []
+        yield from self.streamer.send(CommandTXPacket(flush=1))
+        yield from self.logger.receive_responses(1)
+        for i in range(2):
+            offset = sectors2dwords(i)
+            write_packet = CommandTXPacket(write=1, sector=16+i, count=1,
+                data=write_data[offset:offset+sectors2dwords(1)])
+            yield from self.streamer.send(write_packet, blocking=False)
+        yield from self.streamer.send(CommandTXPacket(flush=1), blocking=False)
+        yield from self.logger.receive_responses(4)
+        responses = [p for p in self.logger.packets if p.last]
+        print("responses (write, flush, failed): " +
+              str([(p.write, p.flush, p.failed) for p in responses]))
+        print("flush completed last: " + str(responses[-1].flush == 1))
+
 if __name__ == "__main__":
-    run_simulation(TB(), ncycles=2048, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(), ncycles=8192, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(stall=16), ncycles=8192)
@@ -0,0 +1,116 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.dma import *
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+class WishboneMemory(Module):
+    """Wishbone slave model of a system memory (dword addressed)"""
+    def __init__(self, bus, latency=1):
+        self.bus = bus
+
+        # # #
+
+        self.latency = latency
+        self.mem = {}
+        self.wait = 0
+
+    def write(self, address, dwords):
+        for i, dword in enumerate(dwords):
+            self.mem[address//4 + i] = dword
+
+    def read(self, address, n):
+        return [self.mem.get(address//4 + i, 0) for i in range(n)]
+
+    def do_simulation(self, selfp):
+        bus = selfp.bus
+        if bus.ack:
+            bus.ack = 0
+        elif bus.cyc and bus.stb:
+            if self.wait < self.latency:
+                self.wait += 1
+                return
+            self.wait = 0
+            if bus.we:
+                self.mem[bus.adr] = bus.dat_w
+            else:
+                bus.dat_r = self.mem.get(bus.adr, 0)
+            bus.ack = 1
+
+
+def descriptor(write, sector, count, address, length):
+    return [write << dma_control["write"],
+            sector & 0xffffffff,
+            sector >> 32,
+            count,
+            address,
+            length,
+            0,
+            0]
+
+
+class TB(Module):
+    def __init__(self):
+        self.submodules.controller = ControllerModel()
+        self.submodules.crossbar = LiteSATACrossbar(self.controller)
+        self.submodules.dma = LiteSATADMA(self.crossbar.get_port(32), with_csr=False)
+        self.submodules.memory = WishboneMemory(self.dma.bus)
+
+    def gen_simulation(self, selfp):
+        self.controller.malloc(0, 64)
+        memory = self.memory
+        dma = selfp.dma
+
+        ring = 0x1000
+        src = 0x10000
+        dst = 0x20000
+        dst2 = 0x30000
+        size = 8
+        count = 4
+
+        write_data = [seed_to_data(i, True) for i in range(sectors2dwords(count))]
+        memory.write(src, write_data)
+        descriptors = [
+            descriptor(1, 8, count, src, count*logical_sector_size),
+            descriptor(0, 8, count, dst, count*logical_sector_size),
+            descriptor(0, 8, count, dst, count*logical_sector_size//2), # too small
+            # write back the buffer of the previous read, must not be
+            # read from memory before the read is completed
+            descriptor(1, 16, count, dst, count*logical_sector_size),
+            descriptor(0, 16, count, dst2, count*logical_sector_size)
+        ]
+        for i, d in enumerate(descriptors):
+            memory.write(ring + i*dma_descriptor_dwords*4, d)
+
+        dma.base = ring
+        dma.size = size
+        dma.enable = 1
+        dma.head = len(descriptors)
+        yield
+        cycles = 0
+        while dma.tail != len(descriptors):
+            cycles += 1
+            yield
+
+        # check results
+        for i in range(len(descriptors)):
+            control = memory.read(ring + i*dma_descriptor_dwords*4, 1)[0]
+            print("descriptor {}: done {} / failed {}".format(i,
+                (control >> dma_control["done"]) & 0x1,
+                (control >> dma_control["failed"]) & 0x1))
+        s, l, e = check(write_data, memory.read(dst, len(write_data)))
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+        s, l, e = check(write_data, memory.read(dst2, len(write_data)))
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+        print("{} cycles".format(cycles))
+
+        # disable resets the ring indexes
+        dma.enable = 0
+        yield
+        yield
+        print("tail after disable {}".format(dma.tail))
+
+if __name__ == "__main__":
+    run_simulation(TB(), ncycles=16384, vcd_name="my.vcd", keep_files=True)
@@ -0,0 +1,167 @@
+from litesata.common import *
+from litesata.core.link import LiteSATACRC, LiteSATACRCInserter, LiteSATACRCChecker
+
+from test.common import *
+from test.model.link import compute_crc
+
+
+class TB(Module):
+    def __init__(self, dw, length):
+        self.submodules.crc = LiteSATACRC(dw)
+        self.dw = dw
+        self.length = length
+
+    def gen_simulation(self, selfp):
+        n = self.dw//32
+        for length in range(self.length, self.length + n):
+            # init CRC
+            selfp.crc.data = 0
+            selfp.crc.valid = 0
+            selfp.crc.ce = 1
+            selfp.crc.reset = 1
+            yield
+            selfp.crc.reset = 0
+
+            # feed CRC with n dwords per cycle, last data can be partial
+            datas = [seed_to_data(i, True) for i in range(length)]
+            cycles = 0
+            for i in range(0, length, n):
+                words = datas[i:i+n]
+                data = 0
+                for j, word in enumerate(words):
+                    data |= word << 32*j
+                selfp.crc.data = data
+                selfp.crc.valid = 2**len(words)-1
+                cycles += 1
+                yield
+            selfp.crc.ce = 0
+            yield
+            sim_crc = selfp.crc.value
+
+            # check results against the python reference
+            ref_crc = compute_crc(datas)
+            print("dw {:3d} / dwords {:5d}: {:5d} cycles / crc 0x{:08x} / ref 0x{:08x} / {}".format(
+                self.dw, length, cycles, sim_crc, ref_crc,
+                "ok" if sim_crc == ref_crc else "ko"))
+
+class LinkDriver(Module):
+    def __init__(self, dw):
+        self.source = Source(link_description(dw))
+        self.n = dw//32
+
+        # # #
+
+        self.beats = []
+
+    def send(self, dwords):
+        # n dwords per beat, last beat can be partial
+        for i in range(0, len(dwords), self.n):
+            words = dwords[i:i+self.n]
+            data = 0
+            for j, word in enumerate(words):
+                data |= word << 32*j
+            self.beats.append((data, 2**len(words)-1, i == 0, i + self.n >= len(dwords)))
+        while len(self.beats):
+            yield
+
+    def do_simulation(self, selfp):
+        if selfp.source.stb and selfp.source.ack:
+            self.beats.pop(0)
+        if len(self.beats):
+            data, valid, sop, eop = self.beats[0]
+            selfp.source.stb = 1
+            selfp.source.data = data
+            if self.n > 1:
+                selfp.source.valid = valid
+            selfp.source.sop = sop
+            selfp.source.eop = eop
+        else:
+            selfp.source.stb = 0
+
+
+class LinkMonitor(Module):
+    def __init__(self, endpoint, drive_ack=True):
+        self.endpoint = endpoint
+        self.n = len(endpoint.data)//32
+        self.drive_ack = drive_ack
+
+        # # #
+
+        self.dwords = []
+        self.packets = []
+        self.errors = []
+
+    def do_simulation(self, selfp):
+        if self.drive_ack:
+            selfp.endpoint.ack = 1
+        if selfp.endpoint.stb and selfp.endpoint.ack:
+            if selfp.endpoint.sop:
+                self.dwords = []
+            valid = selfp.endpoint.valid if self.n > 1 else 1
+            for j in range(self.n):
+                if valid & (1 << j):
+                    self.dwords.append((selfp.endpoint.data >> 32*j) & 0xffffffff)
+            if selfp.endpoint.eop:
+                self.packets.append(self.dwords)
+                self.errors.append(selfp.endpoint.error)
+
+
+class InserterCheckerTB(Module):
+    def __init__(self, dw, npackets):
+        self.dw = dw
+        self.npackets = npackets
+
+        # single-dword reference
+        self.submodules.driver_ref = LinkDriver(32)
+        self.submodules.inserter_ref = LiteSATACRCInserter(link_description(32))
+        self.submodules.monitor_ref = LinkMonitor(self.inserter_ref.source)
+        self.comb += Record.connect(self.driver_ref.source, self.inserter_ref.sink)
+
+        # wide inserter -> randomizer -> wide checker
+        self.submodules.driver = LinkDriver(dw)
+        self.submodules.inserter = LiteSATACRCInserter(link_description(dw))
+        self.submodules.randomizer = Randomizer(link_description(dw), level=50)
+        self.submodules.checker = LiteSATACRCChecker(link_description(dw))
+        self.submodules.monitor_inserter = LinkMonitor(self.inserter.source, drive_ack=False)
+        self.submodules.monitor = LinkMonitor(self.checker.source)
+        self.comb += [
+            Record.connect(self.driver.source, self.inserter.sink),
+            Record.connect(self.inserter.source, self.randomizer.sink),
+            Record.connect(self.randomizer.source, self.checker.sink)
+        ]
+
+    def gen_simulation(self, selfp):
+        n = self.dw//32
+        errors = 0
+        seed = 0
+        for i in range(self.npackets):
+            # random lengths, mostly not multiple of n
+            length = 1 + randn(8*n)
+            dwords = [seed_to_data(seed + j, True) for j in range(length)]
+            seed += length
+            yield from self.driver_ref.send(dwords)
+            yield from self.driver.send(dwords)
+            while (len(self.monitor_ref.packets) <= i or
+                   len(self.monitor_inserter.packets) <= i or
+                   len(self.monitor.packets) <= i):
+                yield
+
+            # wide inserter output must match the single-dword inserter,
+            # checker must strip the CRC and report no error
+            ref = self.monitor_ref.packets[i]
+            inserted = self.monitor_inserter.packets[i]
+            checked = self.monitor.packets[i]
+            if (inserted != ref or
+                ref[-1] != compute_crc(dwords) or
+                checked != dwords or
+                self.monitor.errors[i]):
+                errors += 1
+        print("dw {:3d}: {} packets / errors {}".format(self.dw, self.npackets, errors))
+
+if __name__ == "__main__":
+    from litex.gen.sim.generic import run_simulation
+    length = 1024
+    for dw in [32, 64, 128]:
+        run_simulation(TB(dw, length), ncycles=4*(length+8))
+    for dw in [64, 128]:
+        run_simulation(InserterCheckerTB(dw, 64), ncycles=16384)
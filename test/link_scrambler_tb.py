@@ -7,9 +7,10 @@ from test.common import *
 
 
 class TB(Module):
-    def __init__(self, length):
-        self.submodules.scrambler = ResetInserter()(Scrambler())
+    def __init__(self, length, n=1):
+        self.submodules.scrambler = ResetInserter()(Scrambler(n))
         self.length = length
+        self.n = n
 
     def get_c_values(self, length):
         stdin = "0x{:08x}".format(length)
@@ -30,8 +31,10 @@ class TB(Module):
         # log results
         yield
         sim_values = []
-        for i in range(self.length):
-            sim_values.append(selfp.scrambler.value)
+        for i in range(self.length//self.n):
+            value = selfp.scrambler.value
+            for j in range(self.n):
+                sim_values.append((value >> 32*j) & 0xffffffff)
             yield
 
         # stop
@@ -50,3 +53,5 @@ if __name__ == "__main__":
     from litex.gen.sim.generic import run_simulation
     length = 8192
     run_simulation(TB(length), ncycles=length+100, vcd_name="my.vcd")
+    for n in [2, 4]:
+        run_simulation(TB(length, n), ncycles=length//n+100)
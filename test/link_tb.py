@@ -6,39 +6,86 @@ from test.common import *
 
 
 class LinkStreamer(PacketStreamer):
-    def __init__(self):
-        PacketStreamer.__init__(self, link_description(32), LinkTXPacket)
+    def __init__(self, dw=32):
+        PacketStreamer.__init__(self, link_description(dw), LinkTXPacket)
+        self.n = dw//32
+
+    def do_simulation(self, selfp):
+        PacketStreamer.do_simulation(self, selfp)
+        if self.n > 1:
+            selfp.source.valid = 2**self.n-1
 
 
 class LinkLogger(PacketLogger):
-    def __init__(self):
-        PacketLogger.__init__(self, link_description(32), LinkRXPacket)
+    def __init__(self, dw=32):
+        PacketLogger.__init__(self, link_description(dw), LinkRXPacket)
 
 
 class TB(Module):
-    def __init__(self):
+    def __init__(self, tx_buffer_depth=None, tx_threshold=None, dw=32, clock_domain="sys",
+                 bandwidth_matched=False):
+        self.n = dw//32
+        if clock_domain != "sys":
+            cd = ClockDomain(clock_domain)
+            self.clock_domains += cd
+            self.comb += cd.rst.eq(ResetSignal())
+            if bandwidth_matched:
+                # clock_domain at sys_clk*32/dw: exactly the bandwidth of the link
+                divider = Signal(max=self.n)
+                self.sync += divider.eq(divider + 1)
+                self.comb += cd.clk.eq(divider[-1])
+            else:
+                # use sys_clk for the link's clock_domain
+                self.comb += cd.clk.eq(ClockSignal())
+
         self.submodules.hdd = HDD(
                 link_debug=False, link_random_level=50,
                 transport_debug=False, transport_loopback=True)
-        self.submodules.link = ResetInserter()(LiteSATALink(self.hdd.phy, buffer_depth=512))
+        link = LiteSATALink(self.hdd.phy, buffer_depth=512,
+                            tx_buffer_depth=tx_buffer_depth,
+                            tx_threshold=tx_threshold,
+                            dw=dw, clock_domain=clock_domain)
+        if clock_domain == "sys":
+            link = ResetInserter()(link)
+        self.submodules.link = link
+
+        self.submodules.streamer = LinkStreamer(dw)
+        self.submodules.streamer_randomizer = Randomizer(link_description(dw), level=50)
 
-        self.submodules.streamer = LinkStreamer()
-        self.submodules.streamer_randomizer = Randomizer(link_description(32), level=50)
+        self.submodules.logger_randomizer = Randomizer(link_description(dw), level=50)
+        self.submodules.logger = LinkLogger(dw)
 
-        self.submodules.logger_randomizer = Randomizer(link_description(32), level=50)
-        self.submodules.logger = LinkLogger()
+        if bandwidth_matched:
+            # streamer/logger run in sys: cross to/from the link's
+            # clock_domain, the logger's randomizer then randomly
+            # deasserts ack on the link's source.
+            tx_cdc = AsyncFIFO(link_description(dw), 4)
+            tx_cdc = ClockDomainsRenamer({"write": "sys", "read": clock_domain})(tx_cdc)
+            rx_cdc = AsyncFIFO(link_description(dw), 4)
+            rx_cdc = ClockDomainsRenamer({"write": clock_domain, "read": "sys"})(rx_cdc)
+            self.submodules += tx_cdc, rx_cdc
+            link_modules = [tx_cdc, self.link, rx_cdc]
+        else:
+            link_modules = [self.link]
 
         self.submodules.pipeline = Pipeline(
             self.streamer,
             self.streamer_randomizer,
-            self.link,
+            *link_modules,
             self.logger_randomizer,
             self.logger
         )
 
     def gen_simulation(self, selfp):
         for i in range(8):
-            streamer_packet = LinkTXPacket([i for i in range(64)])
+            # 64 dwords, n dwords per data (first dword in LSBs)
+            datas = []
+            for j in range(0, 64, self.n):
+                data = 0
+                for k in range(self.n):
+                    data |= (j + k) << 32*k
+                datas.append(data)
+            streamer_packet = LinkTXPacket(datas)
             yield from self.streamer.send(streamer_packet)
             yield from self.logger.receive()
 
@@ -48,4 +95,17 @@ class TB(Module):
 
 
 if __name__ == "__main__":
+    print("[store-and-forward]")
     run_simulation(TB(), ncycles=2048, vcd_name="my.vcd", keep_files=True)
+    print("[cut-through]")
+    run_simulation(TB(tx_buffer_depth=32, tx_threshold=16), ncycles=2048)
+    for dw in [64, 128]:
+        print("[{} bits]".format(dw))
+        run_simulation(TB(dw=dw), ncycles=2048)
+    print("[64 bits, cut-through]")
+    run_simulation(TB(tx_buffer_depth=32, tx_threshold=16, dw=64), ncycles=2048)
+    print("[64 bits, clock domain crossing]")
+    run_simulation(TB(dw=64, clock_domain="core"), ncycles=2048)
+    for dw in [64, 128]:
+        print("[{} bits, bandwidth matched clock domain]".format(dw))
+        run_simulation(TB(dw=dw, clock_domain="core", bandwidth_matched=True), ncycles=8192)
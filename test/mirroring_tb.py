@@ -9,7 +9,8 @@ from test.model.hdd import *
 
 
 class TB(Module):
-    def __init__(self):
+    def __init__(self, read_balancing=False, count=1, max_writes=None, max_cycles=None,
+                 concurrent=False, read_stream=False):
         self.submodules.hdd0 = HDD(n=0,
                 link_debug=False, link_random_level=0,
                 transport_debug=False, transport_loopback=False,
@@ -22,7 +23,14 @@ class TB(Module):
                 hdd_debug=True)
         self.submodules.core1 = LiteSATACore(self.hdd1.phy)
 
-        self.submodules.mirroring = LiteSATAMirroring([self.core0, self.core1])
+        self.submodules.mirroring = LiteSATAMirroring([self.core0, self.core1],
+                                                      read_balancing=read_balancing,
+                                                      read_chunk_size=logical_sector_size,
+                                                      max_writes=max_writes,
+                                                      max_cycles=max_cycles)
+        self.count = count
+        self.concurrent = concurrent
+        self.read_stream = read_stream
 
         self.submodules.crossbar0 = LiteSATACrossbar(self.mirroring.ports[0])
         self.submodules.generator0 = LiteSATABISTGenerator(self.crossbar0.get_port())
@@ -38,20 +46,53 @@ class TB(Module):
         hdd1 = self.hdd1
         hdd1.malloc(0, 64)
         sector = 0
-        count = 1
+        count = self.count
         checker0 = selfp.checker0
         checker1 = selfp.checker1
+
+        # continuous reads on the 2 ports plus one write: the write must
+        # not be starved by the reads
+        if self.read_stream:
+            generator0 = selfp.generator0
+            cycles = 0
+            while not (cycles > 66 and generator0.done):
+                for checker in [checker0, checker1]:
+                    if checker.done:
+                        checker.sector = 0
+                        checker.count = count
+                        checker.start = 1
+                if cycles == 64:
+                    generator0.sector = 1
+                    generator0.count = count
+                    generator0.start = 1
+                yield
+                checker0.start = 0
+                checker1.start = 0
+                generator0.start = 0
+                cycles += 1
+            print("write completed in {} cycles under continuous reads".format(cycles - 64))
+            return
+
         while True:
-            for generator in [selfp.generator0, selfp.generator1]:
+            for generator, checker in [(selfp.generator0, checker1), (selfp.generator1, checker0)]:
                 # write data (alternate generators)
+                # with concurrent, verify previous data on the other port during the write
+                concurrent = self.concurrent and sector > 0
                 generator.sector = sector
                 generator.count = count
                 generator.start = 1
+                if concurrent:
+                    checker.sector = sector - 1
+                    checker.count = count
+                    checker.start = 1
                 yield
                 generator.start = 0
+                checker.start = 0
                 yield
-                while generator.done == 0:
+                while (generator.done == 0) or (concurrent and checker.done == 0):
                     yield
+                if concurrent:
+                    print("concurrent errors {}".format(checker.errors))
 
                 # verify data on the 2 hdds in //
                 checker0.sector = sector
@@ -73,3 +114,6 @@ class TB(Module):
 
 if __name__ == "__main__":
     run_simulation(TB(), ncycles=4096, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(read_balancing=True, count=4), ncycles=8192)
+    run_simulation(TB(max_writes=1, max_cycles=256, concurrent=True), ncycles=8192)
+    run_simulation(TB(max_writes=1, max_cycles=64, read_stream=True), ncycles=8192)
@@ -24,9 +24,14 @@ class CommandLayer(Module):
                 resp = self.hdd.write_dma_callback(fis)
             elif fis.command == regs["READ_DMA_EXT"]:
                 resp = self.hdd.read_dma_callback(fis)
+            elif fis.command == regs["WRITE_FPDMA_QUEUED"]:
+                resp = self.hdd.write_fpdma_callback(fis)
+            elif fis.command == regs["READ_FPDMA_QUEUED"]:
+                resp = self.hdd.read_fpdma_callback(fis)
+            elif fis.command == regs["FLUSH_CACHE_EXT"]:
+                resp = self.hdd.flush_callback(fis)
         elif isinstance(fis, FIS_DATA):
             resp = self.hdd.data_callback(fis)
 
         if resp is not None:
-            for packet in resp:
-                self.transport.send(packet)
+            self.hdd.schedule(resp)
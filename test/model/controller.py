@@ -0,0 +1,117 @@
+from litesata.common import *
+
+from test.common import *
+from test.model.hdd import HDDMemRegion, print_hdd
+
+
+class ControllerModelBeat:
+    def __init__(self, data=0, sop=0, eop=0,
+                 write=0, read=0, identify=0, flush=0, last=0, failed=0):
+        self.data = data
+        self.sop = sop
+        self.eop = eop
+        self.write = write
+        self.read = read
+        self.identify = identify
+        self.flush = flush
+        self.last = last
+        self.failed = failed
+
+
+class ControllerModel(Module):
+    """Transaction level model of LiteSATACore + HDD
+
+    Exposes the same sink/source as LiteSATACore and services commands
+    directly against a sector store, bypassing the PHY/Link/Transport
+    layers. Useful to simulate frontends with a lot of transfers.
+    """
+    def __init__(self, n=None, debug=False):
+        self.sink = Sink(command_tx_description(32))
+        self.source = Source(command_rx_description(32))
+
+        # # #
+
+        self.n = n
+        self.debug = debug
+        self.mem = None
+        self.busy = 0
+
+        self.command = None
+        self.write_data = []
+        self.beats = []
+        self.beat = None
+
+    def malloc(self, sector, count, filename=None):
+        if self.debug:
+            s = "Allocating {n} sectors: {s} to {e}".format(n=count, s=sector, e=sector+count-1)
+            print_hdd(s, self.n)
+        if self.mem is not None:
+            self.mem.close()
+        self.mem = HDDMemRegion(sector, count, logical_sector_size, filename)
+
+    def set_busy(self, value):
+        self.busy = value & 0x1
+
+    def respond(self, packet, **kwargs):
+        for i, data in enumerate(packet):
+            beat = ControllerModelBeat(data, sop=(i == 0), eop=(i == len(packet)-1), **kwargs)
+            self.beats.append(beat)
+
+    def execute(self, write, read, identify, flush, sector, count):
+        failed = self.busy
+        if write:
+            if self.debug:
+                print_hdd("Writing {} sectors at {}".format(count, sector), self.n)
+            if not failed:
+                self.mem.write(sector, self.write_data)
+            self.respond([0], write=1, last=1, failed=failed)
+        elif read:
+            if self.debug:
+                print_hdd("Reading {} sectors at {}".format(count, sector), self.n)
+            if not failed:
+                data = self.mem.read(sector, count).tolist()
+                for i in range(0, len(data), fis_max_dwords):
+                    self.respond(data[i:i+fis_max_dwords], read=1)
+            self.respond([0], read=1, last=1, failed=failed)
+        elif identify:
+            self.respond([0]*sectors2dwords(1), identify=1, last=1, failed=failed)
+        elif flush:
+            if self.debug:
+                print_hdd("Flushing cache", self.n)
+            self.respond([0], flush=1, last=1, failed=failed)
+
+    def do_simulation(self, selfp):
+        # command
+        selfp.sink.ack = 1
+        if selfp.sink.stb:
+            if selfp.sink.sop:
+                self.command = (selfp.sink.write,
+                                selfp.sink.read,
+                                selfp.sink.identify,
+                                selfp.sink.flush,
+                                selfp.sink.sector,
+                                selfp.sink.count)
+                self.write_data = []
+            if selfp.sink.write:
+                self.write_data.append(selfp.sink.data)
+            if selfp.sink.eop:
+                self.execute(*self.command)
+
+        # response
+        if self.beat is not None and selfp.source.stb and selfp.source.ack:
+            self.beat = None
+        if self.beat is None and len(self.beats):
+            self.beat = self.beats.pop(0)
+        if self.beat is not None:
+            selfp.source.stb = 1
+            selfp.source.sop = self.beat.sop
+            selfp.source.eop = self.beat.eop
+            selfp.source.write = self.beat.write
+            selfp.source.read = self.beat.read
+            selfp.source.identify = self.beat.identify
+            selfp.source.flush = self.beat.flush
+            selfp.source.last = self.beat.last
+            selfp.source.failed = self.beat.failed
+            selfp.source.data = self.beat.data
+        else:
+            selfp.source.stb = 0
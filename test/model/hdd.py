@@ -1,4 +1,8 @@
+import os
 import math
+import mmap
+import random
+from array import array
 
 from litesata.common import *
 
@@ -7,6 +11,7 @@ from test.model.phy import *
 from test.model.link import *
 from test.model.transport import *
 from test.model.command import *
+from test.model.timing import *
 
 
 def print_hdd(s, n=None):
@@ -14,17 +19,80 @@ def print_hdd(s, n=None):
 
 
 class HDDMemRegion:
-    def __init__(self, base, count, sector_size):
+    """Sparse sector storage
+
+    Sectors are stored in pages of page_sectors sectors that are only
+    allocated on first write; unwritten sectors read as zeros. When a
+    filename is given, the region is backed by a mmap'd (sparse) image
+    file instead.
+    """
+    def __init__(self, base, count, sector_size, filename=None, page_sectors=64):
         self.base = base
         self.count = count
-        self.data = [0]*(count*sector_size//4)
+        self.sector_size = sector_size
+        self.page_dwords = page_sectors*sector_size//4
+        self.pages = {}
+        self.file = None
+        self.mmap = None
+        if filename is not None:
+            self.file = open(filename, "a+b")
+            if os.fstat(self.file.fileno()).st_size < count*sector_size:
+                self.file.truncate(count*sector_size)
+            self.mmap = mmap.mmap(self.file.fileno(), count*sector_size)
+            self.view = memoryview(self.mmap)
+
+    def close(self):
+        if self.mmap is not None:
+            self.view.release()
+            self.mmap.close()
+            self.file.close()
+            self.mmap = None
+
+    def check(self, offset, length):
+        if offset < 0 or offset + length > self.count*self.sector_size//4:
+            raise IndexError("Access outside of allocated sectors")
+
+    def write(self, sector, data):
+        offset = sectors2dwords(sector - self.base)
+        data = array("I", data)
+        self.check(offset, len(data))
+        if self.mmap is not None:
+            self.view[4*offset:4*(offset + len(data))] = memoryview(data).cast("B")
+            return
+        i = 0
+        while i < len(data):
+            page, page_offset = divmod(offset + i, self.page_dwords)
+            n = min(len(data) - i, self.page_dwords - page_offset)
+            if page not in self.pages:
+                self.pages[page] = array("I", bytes(4*self.page_dwords))
+            self.pages[page][page_offset:page_offset+n] = data[i:i+n]
+            i += n
+
+    def read(self, sector, count):
+        offset = sectors2dwords(sector - self.base)
+        length = sectors2dwords(count)
+        self.check(offset, length)
+        data = array("I")
+        if self.mmap is not None:
+            data.frombytes(self.view[4*offset:4*(offset + length)])
+            return data
+        i = 0
+        while i < length:
+            page, page_offset = divmod(offset + i, self.page_dwords)
+            n = min(length - i, self.page_dwords - page_offset)
+            if page in self.pages:
+                data.extend(self.pages[page][page_offset:page_offset+n])
+            else:
+                data.frombytes(bytes(4*n))
+            i += n
+        return data
 
 
 class HDD(Module):
     def __init__(self, n=None,
             link_debug=False, link_random_level=0,
             transport_debug=False, transport_loopback=False,
-            hdd_debug=False):
+            hdd_debug=False, timing=None):
         self.n = n
         self.submodules.phy = PHYLayer()
         self.submodules.link = LinkLayer(self.phy, link_debug, link_random_level)
@@ -44,12 +112,24 @@ class HDD(Module):
         self.data_error_injection = 0
         self.busy = 0
 
-    def malloc(self, sector, count):
+        self.ncq_queue = {}
+        self.ncq_write_tag = None
+
+        self.timing = HDDTiming() if timing is None else timing
+        self.cycle = 0
+        self.scheduled = []
+        self.scheduled_cycle = 0
+
+    def malloc(self, sector, count, filename=None):
         if self.debug:
             s = "Allocating {n} sectors: {s} to {e}".format(n=count, s=sector, e=sector+count-1)
             s += " ({} KB)".format(count*logical_sector_size//1024)
+            if filename is not None:
+                s += " in " + filename
             print_hdd(s, self.n)
-        self.mem = HDDMemRegion(sector, count, logical_sector_size)
+        if self.mem is not None:
+            self.mem.close()
+        self.mem = HDDMemRegion(sector, count, logical_sector_size, filename)
 
     def write(self, sector, data):
         n = math.ceil(dwords2sectors(len(data)))
@@ -59,9 +139,7 @@ class HDD(Module):
             else:
                 s = "{s} to {e}".format(s=sector, e=sector+n-1)
             print_hdd("Writing sector " + s, self.n)
-        for i in range(len(data)):
-            offset = sectors2dwords(sector)
-            self.mem.data[offset+i] = data[i]
+        self.mem.write(sector, data)
 
     def read(self, sector, count):
         if self.debug:
@@ -70,10 +148,7 @@ class HDD(Module):
             else:
                 s = "{s} to {e}".format(s=sector, e=sector+count-1)
             print_hdd("Reading sector " + s, self.n)
-        data = []
-        for i in range(sectors2dwords(count)):
-            data.append(self.mem.data[sectors2dwords(sector)+i])
-        return data
+        return self.mem.read(sector, count).tolist()
 
     def set_reg_d2h_status(self, value):
         self.reg_d2h_status = value & 0xff
@@ -90,20 +165,28 @@ class HDD(Module):
         self.busy = value & 0x1
 
     def write_dma_callback(self, fis):
-        self.wr_sector = fis.lba_lsb + (fis.lba_msb << 32)
+        self.wr_sector = fis.lba_lsb + (fis.lba_msb << 24)
         self.wr_end_sector = self.wr_sector + fis.count
-        return [FIS_DMA_ACTIVATE_D2H()] if not self.busy else [self.get_reg_d2h()] 
+        if self.busy:
+            return [self.get_reg_d2h()]
+        dma_activate = FIS_DMA_ACTIVATE_D2H()
+        dma_activate.delay = self.timing.command_delay(self.cycle, True, self.wr_sector, fis.count)
+        return [dma_activate]
 
     def read_dma_callback(self, fis):
-        self.rd_sector = fis.lba_lsb + (fis.lba_msb << 32)
+        self.rd_sector = fis.lba_lsb + (fis.lba_msb << 24)
         self.rd_end_sector = self.rd_sector + fis.count
         packets = []
         if not self.busy:
+            delay = self.timing.command_delay(self.cycle, False, self.rd_sector, fis.count)
             while self.rd_sector != self.rd_end_sector:
                 count = min(self.rd_end_sector-self.rd_sector, (fis_max_dwords*4)//logical_sector_size)
                 packet = self.read(self.rd_sector, count)
                 packet.insert(0, 0)
-                packets.append(FIS_DATA(packet, direction="D2H"))
+                data = FIS_DATA(packet, direction="D2H")
+                data.delay = delay + self.timing.transfer_delay(len(packet) - 1)
+                packets.append(data)
+                delay = 0
                 self.rd_sector += count
             if self.data_error_injection:
                 for packet in packets:
@@ -111,10 +194,101 @@ class HDD(Module):
         packets.append(self.get_reg_d2h())
         return packets
 
+    def flush_callback(self, fis):
+        if self.debug:
+            print_hdd("Flushing cache", self.n)
+        return [self.get_reg_d2h()]
+
     def data_callback(self, fis):
         self.write(self.wr_sector, fis.packet[1:])
         self.wr_sector += dwords2sectors(len(fis.packet[1:]))
         if self.wr_sector == self.wr_end_sector or self.busy:
-            return [self.get_reg_d2h()]
+            if self.ncq_write_tag is not None:
+                response = self.get_set_device_bits(self.ncq_write_tag)
+                self.ncq_write_tag = None
+            else:
+                response = self.get_reg_d2h()
         else:
-            return [FIS_DMA_ACTIVATE_D2H()]
+            response = FIS_DMA_ACTIVATE_D2H()
+        response.delay = self.timing.transfer_delay(len(fis.packet[1:]))
+        return [response]
+
+    # Native Command Queuing
+    def get_set_device_bits(self, tag):
+        sdb = FIS_SET_DEVICE_BITS_D2H()
+        sdb.status = self.reg_d2h_status or self.busy
+        sdb.sactive = 1 << tag
+        return sdb
+
+    def queue_fpdma(self, fis, write):
+        tag = (fis.count >> 3) & 0x1f
+        sector = fis.lba_lsb + (fis.lba_msb << 24)
+        count = fis.features_lsb + (fis.features_msb << 8)
+        if self.debug:
+            s = "Queuing {} of {} sectors at {} (tag {})".format(
+                "write" if write else "read", count, sector, tag)
+            print_hdd(s, self.n)
+        if not self.busy:
+            self.ncq_queue[tag] = (write, sector, count)
+        return [self.get_reg_d2h()]
+
+    def write_fpdma_callback(self, fis):
+        return self.queue_fpdma(fis, write=True)
+
+    def read_fpdma_callback(self, fis):
+        return self.queue_fpdma(fis, write=False)
+
+    def service_fpdma(self):
+        # queued commands are serviced in random order to exercise
+        # out of order completions
+        tag = random.choice(list(self.ncq_queue.keys()))
+        write, sector, count = self.ncq_queue.pop(tag)
+        dma_setup = FIS_DMA_SETUP()
+        dma_setup.tag = tag
+        dma_setup.dma_transfer_count = count*logical_sector_size
+        dma_setup.delay = self.timing.command_delay(self.cycle, write, sector, count)
+        packets = [dma_setup]
+        if write:
+            dma_setup.d = 0
+            self.ncq_write_tag = tag
+            self.wr_sector = sector
+            self.wr_end_sector = sector + count
+            packets.append(FIS_DMA_ACTIVATE_D2H())
+        else:
+            dma_setup.d = 1
+            data_packets = []
+            while count:
+                n = min(count, (fis_max_dwords*4)//logical_sector_size)
+                packet = self.read(sector, n)
+                packet.insert(0, 0)
+                data = FIS_DATA(packet, direction="D2H")
+                data.delay = self.timing.transfer_delay(len(packet) - 1)
+                data_packets.append(data)
+                sector += n
+                count -= n
+            if self.data_error_injection:
+                for packet in data_packets:
+                    packet.data_error_injection = True
+            packets += data_packets
+            packets.append(self.get_set_device_bits(tag))
+        self.schedule(packets)
+
+    # Timing
+    def schedule(self, packets):
+        # packets are emitted in order, each one delay cycles after
+        # the previous one (or after now if the device was idle).
+        for packet in packets:
+            delay = getattr(packet, "delay", 0)
+            self.scheduled_cycle = max(self.scheduled_cycle, self.cycle) + delay
+            self.scheduled.append((self.scheduled_cycle, packet))
+
+    def do_simulation(self, selfp):
+        self.cycle += 1
+        while len(self.scheduled) and self.scheduled[0][0] <= self.cycle:
+            cycle, packet = self.scheduled.pop(0)
+            self.transport.send(packet)
+        if (self.ncq_queue and
+            self.ncq_write_tag is None and
+            not self.scheduled and
+            self.link.idle()):
+            self.service_fpdma()
@@ -1,7 +1,7 @@
-import subprocess
 import math
 
 from litesata.common import *
+from litesata.core.link import LiteSATACRC, scrambler_lfsr_coefs
 
 from test.common import *
 
@@ -10,20 +10,64 @@ def print_link(s, n=None):
     print_with_prefix(s, "[LNK{}]: ".format("" if n is None else str(n)))
 
 
-def import_scrambler_datas():
-    with subprocess.Popen(["./scrambler"],
-                          stdin=subprocess.PIPE,
-                          stdout=subprocess.PIPE) as process:
-        process.stdin.write("0x10000".encode("ASCII"))
-        out, err = process.communicate()
-    return [int(e, 16) for e in out.decode("utf-8").split("\n")[:-1]]
+# scrambler sequence, computed once and shared by all packets
+scrambler_length = 0x10000
+_scrambler_datas = None
+
+
+def get_scrambler_datas():
+    global _scrambler_datas
+    if _scrambler_datas is None:
+        # next value is linear in the 16 bits context: split
+        # the context in two bytes and use lookup tables.
+        lsb_table = [0]*256
+        msb_table = [0]*256
+        for n, coefs in enumerate(scrambler_lfsr_coefs):
+            for i in coefs:
+                table = lsb_table if i < 8 else msb_table
+                for v in range(256):
+                    if (v >> (i%8)) & 0x1:
+                        table[v] ^= (1 << n)
+        context = 0xf0f6
+        datas = []
+        for i in range(scrambler_length):
+            value = lsb_table[context & 0xff] ^ msb_table[context >> 8]
+            datas.append(value)
+            context = value >> 16
+        _scrambler_datas = datas
+    return _scrambler_datas
+
+
+# table driven crc, equivalent to LiteSATACRC
+def _crc_table():
+    table = []
+    for v in range(256):
+        crc = v << 24
+        for i in range(8):
+            if crc & 0x80000000:
+                crc = ((crc << 1) ^ LiteSATACRC.polynom) & 0xffffffff
+            else:
+                crc = (crc << 1) & 0xffffffff
+        table.append(crc)
+    return table
+
+crc_table = _crc_table()
+
+
+def compute_crc(dwords):
+    crc = LiteSATACRC.init
+    for dword in dwords:
+        crc ^= dword
+        for i in range(4):
+            crc = ((crc << 8) & 0xffffffff) ^ crc_table[crc >> 24]
+    return crc
 
 
 class LinkPacket(list):
     def __init__(self, init=[]):
         self.ongoing = False
         self.done = False
-        self.scrambled_datas = import_scrambler_datas()
+        self.scrambled_datas = get_scrambler_datas()
         for dword in init:
             self.append(dword)
 
@@ -34,16 +78,7 @@ class LinkRXPacket(LinkPacket):
             self[i] = self[i] ^ self.scrambled_datas[i]
 
     def check_crc(self):
-        stdin = ""
-        for v in self[:-1]:
-            stdin += "0x{:08x} ".format(v)
-        stdin += "exit"
-        with subprocess.Popen("./crc",
-                              stdin=subprocess.PIPE,
-                              stdout=subprocess.PIPE) as process:
-            process.stdin.write(stdin.encode("ASCII"))
-            out, err = process.communicate()
-        crc = int(out.decode("ASCII"), 16)
+        crc = compute_crc(self[:-1])
         r = (self[-1] == crc)
         self.pop()
         return r
@@ -55,17 +90,7 @@ class LinkRXPacket(LinkPacket):
 
 class LinkTXPacket(LinkPacket):
     def insert_crc(self):
-        stdin = ""
-        for v in self:
-            stdin += "0x{:08x} ".format(v)
-        stdin += "exit"
-        with subprocess.Popen("./crc",
-                              stdin=subprocess.PIPE,
-                              stdout=subprocess.PIPE) as process:
-            process.stdin.write(stdin.encode("ASCII"))
-            out, err = process.communicate()
-        crc = int(out.decode("ASCII"), 16)
-        self.append(crc)
+        self.append(compute_crc(self))
 
     def scramble(self):
         for i in range(len(self)):
@@ -93,7 +118,7 @@ class LinkLayer(Module):
         self.tx_cont_nb = -1
         self.tx_lasts = [0, 0, 0]
 
-        self.scrambled_datas = import_scrambler_datas()
+        self.scrambled_datas = get_scrambler_datas()
 
         self.transport = None
         self.n = None
@@ -104,6 +129,12 @@ class LinkLayer(Module):
     def set_transport(self, transport):
         self.transport = transport
 
+    def idle(self):
+        return (len(self.tx_packets) == 0 and
+                self.tx_packet.done and
+                not self.rx_packet.ongoing and
+                self.rx_last == primitives["SYNC"])
+
     def send(self, dword):
         if self.send_state == "RDY":
             self.phy.send(primitives["X_RDY"])
@@ -0,0 +1,82 @@
+import math
+
+
+class HDDTiming:
+    """Instantaneous device: responses are emitted as soon as possible.
+
+    Timings are expressed in simulation cycles, clk_freq is used to
+    convert physical times (us) and bandwidths (MB/s) to cycles.
+    """
+    def __init__(self, clk_freq=100*1000000):
+        self.clk_freq = clk_freq
+
+    def us(self, t):
+        return math.ceil(t*self.clk_freq/1000000)
+
+    def command_delay(self, now, write, sector, count):
+        """Cycles between command reception and the start of the data phase"""
+        return 0
+
+    def transfer_delay(self, ndwords):
+        """Cycles needed by the media to provide/absorb ndwords"""
+        return 0
+
+
+class ThrottledTiming(HDDTiming):
+    """Device limited by its media rate (in MB/s)"""
+    def __init__(self, clk_freq=100*1000000, bandwidth=100):
+        HDDTiming.__init__(self, clk_freq)
+        self.bandwidth = bandwidth
+
+    def transfer_delay(self, ndwords):
+        return math.ceil(ndwords*4*self.clk_freq/(self.bandwidth*1000000))
+
+
+class SSDTiming(ThrottledTiming):
+    """SSD with fixed read/write command latencies (in us) and an
+    internal bandwidth cap (in MB/s)"""
+    def __init__(self, clk_freq=100*1000000, bandwidth=500,
+                 read_latency=50, write_latency=20):
+        ThrottledTiming.__init__(self, clk_freq, bandwidth)
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+
+    def command_delay(self, now, write, sector, count):
+        return self.us(self.write_latency if write else self.read_latency)
+
+
+class RotationalTiming(ThrottledTiming):
+    """Rotational drive with seek and rotational latency
+
+    Seek time grows with the square root of the seek distance, from
+    track_to_track_seek to full_stroke_seek (in us). The rotational
+    latency is the time needed for the platter to bring the first
+    sector of the command under the head.
+    """
+    def __init__(self, clk_freq=100*1000000, bandwidth=150,
+                 rpm=7200, sectors_per_track=2048, ntracks=2**20,
+                 track_to_track_seek=1000, full_stroke_seek=15000):
+        ThrottledTiming.__init__(self, clk_freq, bandwidth)
+        self.revolution = self.us(60*1000000/rpm)
+        self.sectors_per_track = sectors_per_track
+        self.ntracks = ntracks
+        self.track_to_track_seek = track_to_track_seek
+        self.full_stroke_seek = full_stroke_seek
+        self.track = 0
+
+    def seek_delay(self, track):
+        distance = abs(track - self.track)
+        if distance == 0:
+            return 0
+        t = self.track_to_track_seek
+        t += (self.full_stroke_seek - self.track_to_track_seek)*math.sqrt(distance/self.ntracks)
+        return self.us(t)
+
+    def command_delay(self, now, write, sector, count):
+        track = (sector//self.sectors_per_track)%self.ntracks
+        delay = self.seek_delay(track)
+        self.track = track
+        angle = ((now + delay)%self.revolution)/self.revolution
+        target = (sector%self.sectors_per_track)/self.sectors_per_track
+        delay += math.ceil(((target - angle)%1)*self.revolution)
+        return delay
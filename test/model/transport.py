@@ -74,6 +74,33 @@ class FIS_DMA_ACTIVATE_D2H(FIS):
         return r
 
 
+class FIS_DMA_SETUP(FIS):
+    def __init__(self, packet=None, direction="D2H"):
+        if packet is None:
+            packet = [0]*fis_dma_setup_header.length
+        FIS.__init__(self, packet, fis_dma_setup_header.fields, direction)
+        self.type = fis_types["DMA_SETUP"]
+
+    def __repr__(self):
+        r = "FIS_DMA_SETUP\n"
+        r += FIS.__repr__(self)
+        return r
+
+
+class FIS_SET_DEVICE_BITS_D2H(FIS):
+    def __init__(self, packet=None):
+        if packet is None:
+            packet = [0]*fis_set_device_bits_d2h_header.length
+        FIS.__init__(self, packet, fis_set_device_bits_d2h_header.fields)
+        self.type = fis_types["SET_DEVICE_BITS_D2H"]
+        self.direction = "D2H"
+
+    def __repr__(self):
+        r = "FIS_SET_DEVICE_BITS_D2H\n"
+        r += FIS.__repr__(self)
+        return r
+
+
 class FIS_DATA(FIS):
     def __init__(self, packet=[0], direction="H2D"):
         FIS.__init__(self, packet, fis_data_header.fields, direction)
@@ -132,6 +159,10 @@ class TransportLayer(Module):
             fis = FIS_REG_D2H(packet)
         elif fis_type == fis_types["DMA_ACTIVATE_D2H"]:
             fis = FIS_DMA_ACTIVATE_D2H(packet)
+        elif fis_type == fis_types["DMA_SETUP"]:
+            fis = FIS_DMA_SETUP(packet)
+        elif fis_type == fis_types["SET_DEVICE_BITS_D2H"]:
+            fis = FIS_SET_DEVICE_BITS_D2H(packet)
         elif fis_type == fis_types["DATA"]:
             fis = FIS_DATA(packet, direction="H2D")
         else:
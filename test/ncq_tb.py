@@ -0,0 +1,120 @@
+from litesata.common import *
+from litesata.core import LiteSATACore
+
+from test.common import *
+from test.model.hdd import *
+
+
+class NCQCommandTXPacket(list):
+    def __init__(self, write=0, read=0, flush=0, sector=0, count=0, tag=0, data=[]):
+        self.ongoing = False
+        self.done = False
+        self.write = write
+        self.read = read
+        self.flush = flush
+        self.sector = sector
+        self.count = count
+        self.tag = tag
+        for d in data:
+            self.append(d)
+
+
+class NCQCommandStreamer(PacketStreamer):
+    def __init__(self):
+        PacketStreamer.__init__(self, command_tx_description(32), NCQCommandTXPacket)
+
+    def do_simulation(self, selfp):
+        PacketStreamer.do_simulation(self, selfp)
+        selfp.source.write = self.packet.write
+        selfp.source.read = self.packet.read
+        selfp.source.flush = self.packet.flush
+        selfp.source.sector = self.packet.sector
+        selfp.source.count = self.packet.count
+        selfp.source.tag = self.packet.tag
+
+
+class NCQCommandLogger(Module):
+    def __init__(self):
+        self.sink = Sink(command_rx_description(32))
+
+        # # #
+
+        self.data = {}
+        self.completions = []
+
+    def receive(self, n):
+        while len(self.completions) < n:
+            yield
+
+    def do_simulation(self, selfp):
+        selfp.sink.ack = 1
+        if selfp.sink.stb:
+            tag = "flush" if selfp.sink.flush else selfp.sink.tag
+            if selfp.sink.last:
+                self.completions.append((tag, selfp.sink.failed))
+            else:
+                self.data.setdefault(tag, []).append(selfp.sink.data)
+
+
+class TB(Module):
+    def __init__(self):
+        self.submodules.hdd = HDD(
+                link_debug=False, link_random_level=50,
+                transport_debug=False, transport_loopback=False,
+                hdd_debug=False)
+        self.submodules.core = LiteSATACore(self.hdd.phy, buffer_depth=512,
+                                            with_ncq=True, ncq_depth=8)
+
+        self.submodules.streamer = NCQCommandStreamer()
+        self.submodules.streamer_randomizer = Randomizer(command_tx_description(32), level=50)
+
+        self.submodules.logger = NCQCommandLogger()
+        self.submodules.logger_randomizer = Randomizer(command_rx_description(32), level=50)
+
+        self.submodules.pipeline = Pipeline(
+            self.streamer,
+            self.streamer_randomizer,
+            self.core,
+            self.logger_randomizer,
+            self.logger
+        )
+
+    def gen_simulation(self, selfp):
+        hdd = self.hdd
+        hdd.malloc(0, 64)
+        ntags = 4
+        write_datas = {}
+        for tag in range(ntags):
+            write_datas[tag] = [seed_to_data(tag*1024 + i) for i in range(sectors2dwords(2))]
+            write_len = dwords2sectors(len(write_datas[tag]))
+            write_packet = NCQCommandTXPacket(write=1, sector=4*tag, count=write_len,
+                                              tag=tag, data=write_datas[tag])
+            yield from self.streamer.send(write_packet)
+        yield from self.logger.receive(ntags)
+
+        for tag in range(ntags):
+            read_packet = NCQCommandTXPacket(read=1, sector=4*tag, count=2, tag=tag)
+            yield from self.streamer.send(read_packet, blocking=False)
+        yield from self.logger.receive(2*ntags)
+
+        # check results
+        print("completion order (tag, failed): " + str(self.logger.completions))
+        for tag in range(ntags):
+            s, l, e = check(write_datas[tag], self.logger.data[tag])
+            print("tag " + str(tag) + ": shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+
+        # flush issued right behind queued writes: it is only sent to the
+        # drive once they are completed and must complete last
+        n = len(self.logger.completions)
+        for tag in range(ntags):
+            write_packet = NCQCommandTXPacket(write=1, sector=4*tag, count=2,
+                                              tag=tag, data=write_datas[tag])
+            yield from self.streamer.send(write_packet, blocking=False)
+        yield from self.streamer.send(NCQCommandTXPacket(flush=1), blocking=False)
+        yield from self.logger.receive(n + ntags + 1)
+        completions = self.logger.completions[n:]
+        print("completion order (tag, failed): " + str(completions))
+        print("flush completed last: " + str(completions[-1][0] == "flush"))
+
+if __name__ == "__main__":
+    run_simulation(TB(), ncycles=16384, vcd_name="my.vcd", keep_files=True)
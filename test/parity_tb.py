@@ -0,0 +1,90 @@
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+from litesata.frontend.raid import LiteSATAParity
+
+from test.common import *
+from test.model.hdd import *
+
+
+class TB(Module):
+    def __init__(self, ndrives=2):
+        self.hdds = []
+        cores = []
+        for i in range(ndrives+1):
+            hdd = HDD(n=i,
+                    link_debug=False, link_random_level=0,
+                    transport_debug=False, transport_loopback=False,
+                    hdd_debug=False)
+            core = LiteSATACore(hdd.phy)
+            self.submodules += hdd, core
+            self.hdds.append(hdd)
+            cores.append(core)
+
+        self.submodules.parity = LiteSATAParity(cores)
+        self.submodules.crossbar = LiteSATACrossbar(self.parity)
+        self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port())
+        self.submodules.checker = LiteSATABISTChecker(self.crossbar.get_port())
+
+    def check_parity(self, sector, count):
+        datas = [hdd.mem.read(sector, count).tolist() for hdd in self.hdds]
+        errors = 0
+        for dwords in zip(*datas):
+            p = 0
+            for dword in dwords:
+                p ^= dword
+            if p != 0:
+                errors += 1
+        return errors
+
+    def gen_simulation(self, selfp):
+        for hdd in self.hdds:
+            hdd.malloc(0, 64)
+        generator = selfp.generator
+        checker = selfp.checker
+        parity = selfp.parity
+        for degraded, failed_drive in [(0, 0), (1, 0), (1, len(self.hdds)-1)]:
+            parity.degraded = degraded
+            parity.failed_drive = failed_drive
+            for sector, count in [(0, 1), (1, 4), (8, 2)]:
+                # verify data written out of degraded mode
+                if degraded:
+                    checker.sector = sector
+                    checker.count = count
+                    checker.start = 1
+                    yield
+                    checker.start = 0
+                    yield
+                    while checker.done == 0:
+                        yield
+                    print("degraded {} / failed drive {}: reconstruction errors {}".format(
+                        degraded, failed_drive, checker.errors))
+
+                # write data
+                generator.sector = sector + 16*degraded*(failed_drive + 1)
+                generator.count = count
+                generator.start = 1
+                yield
+                generator.start = 0
+                yield
+                while generator.done == 0:
+                    yield
+
+                # verify data
+                checker.sector = sector + 16*degraded*(failed_drive + 1)
+                checker.count = count
+                checker.start = 1
+                yield
+                checker.start = 0
+                yield
+                while checker.done == 0:
+                    yield
+                s = "degraded {} / failed drive {}: errors {}".format(
+                    degraded, failed_drive, checker.errors)
+                if not degraded:
+                    s += " / parity errors {}".format(self.check_parity(sector, count))
+                print(s)
+
+if __name__ == "__main__":
+    run_simulation(TB(), ncycles=16384, vcd_name="my.vcd", keep_files=True)
@@ -0,0 +1,124 @@
+from litesata.common import *
+from litesata.phy.ctrl import LiteSATAPHYCtrl
+
+from litex.gen.genlib.misc import WaitTimer
+
+from test.common import *
+
+
+class TRX(Module):
+    """Transceiver and drive model
+
+    The drive answers COMINIT/COMWAKE then sends ALIGNs, only received by
+    the host when its rate is supported by the drive (<= drive_rate).
+    """
+    def __init__(self, revision, drive_revision):
+        self.dw = 16
+        self.sink = Sink(phy_description(32))
+        self.source = Source(phy_description(32))
+
+        self.tx_idle = Signal()
+        self.tx_cominit_stb = Signal()
+        self.tx_cominit_ack = Signal()
+        self.tx_comwake_stb = Signal()
+        self.tx_comwake_ack = Signal()
+        self.rx_idle = Signal(reset=1)
+        self.rx_cdrhold = Signal()
+        self.rx_cominit_stb = Signal()
+        self.rx_comwake_stb = Signal()
+
+        self.rate = Signal(2, reset=revisions.index(revision))
+        self.rate_ready = Signal(reset=1)
+
+        self.comb += [
+            self.sink.ack.eq(1),
+            self.tx_cominit_ack.eq(self.tx_cominit_stb),
+            self.tx_comwake_ack.eq(self.tx_comwake_stb)
+        ]
+
+        # # #
+
+        self.drive_rate = revisions.index(drive_revision)
+        self.state = "IDLE"
+        self.counter = 0
+
+    def do_simulation(self, selfp):
+        if selfp.tx_cominit_stb:
+            self.state = "COMINIT"
+            self.counter = 0
+        elif selfp.tx_comwake_stb and self.state == "AWAIT_COMWAKE":
+            self.state = "COMWAKE"
+            self.counter = 0
+
+        selfp.rx_cominit_stb = self.state == "COMINIT"
+        selfp.rx_comwake_stb = self.state == "COMWAKE"
+        selfp.rx_idle = self.state not in ["ALIGN", "SYNC"]
+        selfp.source.stb = 1
+        selfp.source.charisk = 0
+        selfp.source.data = 0
+
+        if self.state == "COMINIT":
+            self.counter += 1
+            if self.counter == 16:
+                self.state = "AWAIT_COMWAKE"
+        elif self.state == "COMWAKE":
+            self.counter += 1
+            if self.counter == 16:
+                self.state = "ALIGN"
+        elif self.state == "ALIGN":
+            if selfp.rate <= self.drive_rate:
+                selfp.source.charisk = 0b0001
+                selfp.source.data = primitives["ALIGN"]
+                if selfp.sink.data == primitives["ALIGN"]:
+                    self.state = "SYNC"
+            else:
+                selfp.source.data = randn(2**32)
+        elif self.state == "SYNC":
+            selfp.source.charisk = 0b0001
+            selfp.source.data = primitives["SYNC"]
+
+
+class CRG(Module):
+    def __init__(self):
+        self.tx_reset = Signal()
+        self.rx_reset = Signal()
+        self.ready = Signal()
+
+        # # #
+
+        self.submodules.timer = WaitTimer(8)
+        self.comb += [
+            self.timer.wait.eq(~(self.tx_reset | self.rx_reset)),
+            self.ready.eq(self.timer.done)
+        ]
+
+
+class TB(Module):
+    def __init__(self, revision, drive_revision, stability_primitives=16):
+        self.clk_freq = 150*1000000
+        self.submodules.trx = TRX(revision, drive_revision)
+        self.submodules.crg = CRG()
+        self.submodules.ctrl = LiteSATAPHYCtrl(self.trx, self.crg, self.clk_freq, revision,
+                                               speed_negotiation=True,
+                                               stability_primitives=stability_primitives,
+                                               time_scale=1/1000)
+        self.comb += [
+            Record.connect(self.trx.source, self.ctrl.sink),
+            Record.connect(self.ctrl.source, self.trx.sink)
+        ]
+        self.drive_revision = drive_revision
+
+    def gen_simulation(self, selfp):
+        cycles = 0
+        while not selfp.ctrl.ready:
+            cycles += 1
+            yield
+        print("drive {}: negotiated {} in {} cycles ({:.2f}us)".format(
+            self.drive_revision, revisions[selfp.ctrl.rate], cycles,
+            cycles*1000000/self.clk_freq))
+
+if __name__ == "__main__":
+    run_simulation(TB("sata_gen3", "sata_gen3"), ncycles=32768, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB("sata_gen3", "sata_gen2"), ncycles=32768)
+    run_simulation(TB("sata_gen3", "sata_gen1"), ncycles=32768)
+    run_simulation(TB("sata_gen3", "sata_gen3", stability_primitives=None), ncycles=32768)
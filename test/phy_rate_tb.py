@@ -0,0 +1,103 @@
+from litesata.common import *
+from litesata.phy.k7.trx import _RateReconfig, cdr_config
+
+from test.common import *
+
+
+# RXCDR_CFG at DRP addresses 0x0a8-0x0ac, last word only has 8 bits
+drp_addr = 0x0a8
+drp_masks = [0xffff]*4 + [0x00ff]
+
+
+class DRP(Module):
+    """Transceiver DRP port model
+
+    Accesses are acknowledged with drprdy after latency cycles, drpen
+    asserted while an access is pending is reported as a protocol error.
+    """
+    def __init__(self, revision, latency=4):
+        self.rate = Signal(2, reset=revisions.index(revision))
+        self.rate_ready = Signal()
+
+        self.drpaddr = Signal(9)
+        self.drpdi = Signal(16)
+        self.drpdo = Signal(16)
+        self.drpen = Signal()
+        self.drprdy = Signal()
+        self.drpwe = Signal()
+
+        # # #
+
+        self.latency = latency
+        self.mem = {}
+        self.pending = None
+        self.wait = 0
+        self.writes = 0
+        self.protocol_errors = 0
+
+    def do_simulation(self, selfp):
+        selfp.drprdy = 0
+        if self.pending is not None:
+            if selfp.drpen:
+                self.protocol_errors += 1
+            self.wait -= 1
+            if self.wait == 0:
+                adr, we, di = self.pending
+                if we:
+                    self.mem[adr] = di
+                    self.writes += 1
+                else:
+                    selfp.drpdo = self.mem.get(adr, 0)
+                selfp.drprdy = 1
+                self.pending = None
+        elif selfp.drpen:
+            self.pending = (selfp.drpaddr, selfp.drpwe, selfp.drpdi)
+            self.wait = self.latency
+
+
+class TB(Module):
+    def __init__(self, revision, rates):
+        self.submodules.drp = DRP(revision)
+        self.submodules.rate_reconfig = _RateReconfig(self.drp, revision, cdr_config)
+        self.revision = revision
+        self.rates = rates
+
+    def gen_simulation(self, selfp):
+        drp = self.drp
+        # RXCDR_CFG of the initial rate, with bits not belonging to
+        # RXCDR_CFG set in the last word (must be preserved)
+        for i in range(len(drp_masks)):
+            drp.mem[drp_addr + i] = (cdr_config[self.revision] >> 16*i) & drp_masks[i]
+        drp.mem[drp_addr + 4] |= 0xa500
+        yield
+
+        rate_config = [0b011, 0b010, 0b001]
+        for revision in self.rates:
+            selfp.drp.rate = revisions.index(revision)
+            yield
+            writes = drp.writes
+            # rate_ready is deasserted until the reconfiguration is done
+            not_ready = 0
+            cycles = 0
+            while not selfp.drp.rate_ready:
+                not_ready = 1
+                cycles += 1
+                yield
+
+            # check DRP words and output dividers
+            errors = 0
+            for i in range(len(drp_masks)):
+                expected = (cdr_config[revision] >> 16*i) & drp_masks[i]
+                if i == 4:
+                    expected |= 0xa500
+                if drp.mem[drp_addr + i] != expected:
+                    errors += 1
+            if (selfp.rate_reconfig.txrate != rate_config[revisions.index(revision)] or
+                selfp.rate_reconfig.rxrate != rate_config[revisions.index(revision)]):
+                errors += 1
+            print("{}: {} cycles / rate_ready deasserted {} / {} writes / errors {} / protocol errors {}".format(
+                revision, cycles, not_ready, drp.writes - writes, errors, drp.protocol_errors))
+
+if __name__ == "__main__":
+    run_simulation(TB("sata_gen3", ["sata_gen2", "sata_gen1", "sata_gen3"]), ncycles=1024,
+                   vcd_name="my.vcd", keep_files=True)
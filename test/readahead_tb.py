@@ -0,0 +1,123 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.readahead import LiteSATAReadAhead
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+class ReadAheadTXPacket(list):
+    def __init__(self, write=0, read=0, sector=0, count=0, data=[]):
+        self.ongoing = False
+        self.done = False
+        self.write = write
+        self.read = read
+        self.sector = sector
+        self.count = count
+        for d in data:
+            self.append(d)
+
+
+class ReadAheadStreamer(PacketStreamer):
+    def __init__(self):
+        PacketStreamer.__init__(self, command_tx_description(32), ReadAheadTXPacket)
+
+    def do_simulation(self, selfp):
+        PacketStreamer.do_simulation(self, selfp)
+        selfp.source.write = self.packet.write
+        selfp.source.read = self.packet.read
+        selfp.source.sector = self.packet.sector
+        selfp.source.count = self.packet.count
+
+
+class ReadAheadLogger(Module):
+    def __init__(self):
+        self.sink = Sink(command_rx_description(32))
+
+        # # #
+
+        self.data = []
+        self.completions = []
+
+    def receive(self):
+        n = len(self.completions)
+        while len(self.completions) == n:
+            yield
+
+    def do_simulation(self, selfp):
+        selfp.sink.ack = 1
+        if selfp.sink.stb:
+            if selfp.sink.last:
+                if selfp.sink.eop:
+                    self.completions.append(selfp.sink.failed)
+            else:
+                self.data.append(selfp.sink.data)
+
+
+class TB(Module):
+    def __init__(self, prefetch_count):
+        self.submodules.core = ControllerModel()
+        self.submodules.crossbar = LiteSATACrossbar(self.core)
+        self.submodules.readahead = LiteSATAReadAhead(self.crossbar.get_port(), prefetch_count,
+                                                      controller=self.core,
+                                                      with_csr=False)
+
+        self.submodules.streamer = ReadAheadStreamer()
+        self.submodules.logger = ReadAheadLogger()
+        self.submodules.pipeline = Pipeline(
+            self.streamer,
+            self.readahead,
+            self.logger
+        )
+
+        # other port writing to the drive
+        port = self.crossbar.get_port()
+        self.submodules.writer = ReadAheadStreamer()
+        self.submodules.writer_logger = ReadAheadLogger()
+        self.comb += [
+            Record.connect(self.writer.source, port.sink),
+            Record.connect(port.source, self.writer_logger.sink)
+        ]
+
+    def gen_simulation(self, selfp):
+        self.core.malloc(0, 64)
+        nsectors = 32
+        count = 2
+        data = [seed_to_data(i) for i in range(sectors2dwords(nsectors))]
+        self.core.mem.write(0, data)
+
+        # sequential reads
+        cycle = 0
+        latencies = []
+        for sector in range(0, nsectors, count):
+            read_packet = ReadAheadTXPacket(read=1, sector=sector, count=count)
+            start = cycle
+            yield from self.streamer.send(read_packet, blocking=False)
+            n = len(self.logger.completions)
+            while len(self.logger.completions) == n:
+                cycle += 1
+                yield
+            latencies.append(cycle - start)
+
+        # check results
+        print("latencies: " + str(latencies))
+        print("hits {} / misses {} / prefetches {}".format(
+            selfp.readahead.hits, selfp.readahead.misses, selfp.readahead.prefetches))
+        s, l, e = check(data, self.logger.data)
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+
+        # write of the other port to the prefetched sectors, read must
+        # return the new data
+        write_data = [seed_to_data(i + 0x1000) for i in range(sectors2dwords(count))]
+        write_packet = ReadAheadTXPacket(write=1, sector=nsectors, count=count, data=write_data)
+        yield from self.writer.send(write_packet, blocking=False)
+        yield from self.writer_logger.receive()
+        self.logger.data = []
+        read_packet = ReadAheadTXPacket(read=1, sector=nsectors, count=count)
+        yield from self.streamer.send(read_packet, blocking=False)
+        yield from self.logger.receive()
+        s, l, e = check(write_data, self.logger.data)
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+
+if __name__ == "__main__":
+    run_simulation(TB(prefetch_count=8), ncycles=32768, vcd_name="my.vcd", keep_files=True)
@@ -0,0 +1,94 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.splitter import LiteSATASplitter
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+class SplitterTXPacket(list):
+    def __init__(self, write=0, read=0, sector=0, count=0, data=[]):
+        self.ongoing = False
+        self.done = False
+        self.write = write
+        self.read = read
+        self.sector = sector
+        self.count = count
+        for d in data:
+            self.append(d)
+
+
+class SplitterStreamer(PacketStreamer):
+    def __init__(self):
+        PacketStreamer.__init__(self, command_tx_description(32, 32), SplitterTXPacket)
+
+    def do_simulation(self, selfp):
+        PacketStreamer.do_simulation(self, selfp)
+        selfp.source.write = self.packet.write
+        selfp.source.read = self.packet.read
+        selfp.source.sector = self.packet.sector
+        selfp.source.count = self.packet.count
+
+
+class SplitterLogger(Module):
+    def __init__(self):
+        self.sink = Sink(command_rx_description(32))
+
+        # # #
+
+        self.data = []
+        self.completions = []
+
+    def receive(self):
+        n = len(self.completions)
+        while len(self.completions) == n:
+            yield
+
+    def do_simulation(self, selfp):
+        selfp.sink.ack = 1
+        if selfp.sink.stb:
+            if selfp.sink.last:
+                if selfp.sink.eop:
+                    self.completions.append(selfp.sink.failed)
+            else:
+                self.data.append(selfp.sink.data)
+
+
+class TB(Module):
+    def __init__(self, max_count):
+        self.submodules.core = ControllerModel(debug=True)
+        self.submodules.crossbar = LiteSATACrossbar(self.core)
+        self.submodules.splitter = LiteSATASplitter(self.crossbar.get_port(), 32, max_count)
+
+        self.submodules.streamer = SplitterStreamer()
+        self.submodules.streamer_randomizer = Randomizer(command_tx_description(32, 32), level=50)
+
+        self.submodules.logger_randomizer = Randomizer(command_rx_description(32), level=50)
+        self.submodules.logger = SplitterLogger()
+
+        self.submodules.pipeline = Pipeline(
+            self.streamer,
+            self.streamer_randomizer,
+            self.splitter,
+            self.logger_randomizer,
+            self.logger
+        )
+
+    def gen_simulation(self, selfp):
+        self.core.malloc(0, 64)
+        count = 10
+        write_data = [seed_to_data(i) for i in range(sectors2dwords(count))]
+        write_packet = SplitterTXPacket(write=1, sector=2, count=count, data=write_data)
+        yield from self.streamer.send(write_packet)
+        yield from self.logger.receive()
+        read_packet = SplitterTXPacket(read=1, sector=2, count=count)
+        yield from self.streamer.send(read_packet)
+        yield from self.logger.receive()
+
+        # check results
+        print("completions (failed): " + str(self.logger.completions))
+        s, l, e = check(write_data, self.logger.data)
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+
+if __name__ == "__main__":
+    run_simulation(TB(max_count=4), ncycles=8192, vcd_name="my.vcd", keep_files=True)
@@ -0,0 +1,81 @@
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.core.statistics import LiteSATALatencyHistogram
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+
+from test.common import *
+from test.model.hdd import *
+
+
+statistics = [
+    "write_cmds", "read_cmds", "write_cmds_done", "read_cmds_done", "failed_cmds",
+    "flush_cmds", "flush_cmds_done",
+    "tx_bytes", "rx_bytes",
+    "tx_holds", "tx_holdas", "rx_holds", "rx_holdas",
+    "r_errs", "crc_errors",
+    "busy_cycles", "idle_cycles"
+]
+
+
+class TB(Module):
+    def __init__(self):
+        self.submodules.hdd = HDD(
+                link_debug=False, link_random_level=50,
+                transport_debug=False, transport_loopback=False,
+                hdd_debug=False)
+        self.submodules.core = LiteSATACore(self.hdd.phy, buffer_depth=512,
+                                            with_statistics=True)
+        self.submodules.crossbar = LiteSATACrossbar(self.core)
+        generator_port = self.crossbar.get_port()
+        checker_port = self.crossbar.get_port()
+        self.submodules.generator = LiteSATABISTGenerator(generator_port)
+        self.submodules.checker = LiteSATABISTChecker(checker_port)
+
+        # per port latency histograms
+        self.submodules.generator_histogram = LiteSATALatencyHistogram(generator_port, nbuckets=16)
+        self.submodules.checker_histogram = LiteSATALatencyHistogram(checker_port, nbuckets=16)
+
+    def gen_simulation(self, selfp):
+        hdd = self.hdd
+        hdd.malloc(0, 64)
+        generator = selfp.generator
+        checker = selfp.checker
+        for sector, count in [(0, 4), (4, 2), (8, 8)]:
+            # write data
+            generator.sector = sector
+            generator.count = count
+            generator.start = 1
+            yield
+            generator.start = 0
+            yield
+            while generator.done == 0:
+                yield
+
+            # verify data
+            checker.sector = sector
+            checker.count = count
+            checker.start = 1
+            yield
+            checker.start = 0
+            yield
+            while checker.done == 0:
+                yield
+            print("sector {} / count {}: errors {}".format(sector, count, checker.errors))
+
+        # dump statistics (14 sectors written and read back)
+        print("expected tx_bytes/rx_bytes: {}".format(14*logical_sector_size))
+        for name in statistics:
+            print("{:16s}: {}".format(name, getattr(selfp.core.statistics, name)))
+
+        # dump latency histograms
+        for name in ["generator_histogram", "checker_histogram"]:
+            histogram = getattr(selfp, name)
+            print("[{}] count {} / min {} / max {} / sum {}".format(
+                name, histogram.count, histogram.min, histogram.max, histogram.sum))
+            for i in range(16):
+                print("  [{:5d}, {:5d}[: {}".format(2**i if i else 0, 2**(i+1),
+                                                  getattr(histogram, "bucket{}".format(i))))
+
+if __name__ == "__main__":
+    run_simulation(TB(), ncycles=16384)
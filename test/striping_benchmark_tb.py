@@ -0,0 +1,78 @@
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+from litesata.frontend.raid import LiteSATAStriping
+
+from test.common import *
+from test.model.hdd import *
+
+
+class TB(Module):
+    def __init__(self, ndrives, fifo_depth, link_random_level):
+        self.hdds = []
+        cores = []
+        for i in range(ndrives):
+            hdd = HDD(n=i,
+                    link_debug=False, link_random_level=link_random_level,
+                    transport_debug=False, transport_loopback=False,
+                    hdd_debug=False)
+            core = LiteSATACore(hdd.phy)
+            setattr(self.submodules, "hdd{}".format(i), hdd)
+            setattr(self.submodules, "core{}".format(i), core)
+            self.hdds.append(hdd)
+            cores.append(core)
+
+        self.submodules.striping = LiteSATAStriping(cores, fifo_depth)
+        self.submodules.crossbar = LiteSATACrossbar(self.striping)
+
+        self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port(32*ndrives))
+        self.submodules.checker = LiteSATABISTChecker(self.crossbar.get_port(32*ndrives))
+
+        self.fifo_depth = fifo_depth
+        self.link_random_level = link_random_level
+
+    def gen_simulation(self, selfp):
+        for hdd in self.hdds:
+            hdd.malloc(0, 64)
+        generator = selfp.generator
+        checker = selfp.checker
+        cycle = 0
+        sector = 0
+        count = 8
+
+        # write data
+        start = cycle
+        generator.sector = sector
+        generator.count = count
+        generator.start = 1
+        yield
+        generator.start = 0
+        yield
+        cycle += 2
+        while generator.done == 0:
+            cycle += 1
+            yield
+        write_cycles = cycle - start
+
+        # verify data
+        start = cycle
+        checker.sector = sector
+        checker.count = count
+        checker.start = 1
+        yield
+        checker.start = 0
+        yield
+        cycle += 2
+        while checker.done == 0:
+            cycle += 1
+            yield
+        read_cycles = cycle - start
+
+        print("fifo_depth {:4d} / link_random_level {:2d}: write {} cycles / read {} cycles / errors {}".format(
+            self.fifo_depth, self.link_random_level, write_cycles, read_cycles, checker.errors))
+
+if __name__ == "__main__":
+    for link_random_level in [0, 50]:
+        for fifo_depth in [0, 64, 512]:
+            run_simulation(TB(2, fifo_depth, link_random_level), ncycles=16384)
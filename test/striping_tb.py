@@ -2,14 +2,14 @@ from litesata.common import *
 from litesata.core import LiteSATACore
 from litesata.frontend.arbitration import LiteSATACrossbar
 from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
-from litesata.frontend.raid import LiteSATAStriping
+from litesata.frontend.raid import LiteSATAStriping, LiteSATAChunkedStriping
 
 from test.common import *
 from test.model.hdd import *
 
 
 class TB(Module):
-    def __init__(self):
+    def __init__(self, stripe_size=None):
         self.submodules.hdd0 = HDD(n=0,
                 link_debug=False, link_random_level=0,
                 transport_debug=False, transport_loopback=False,
@@ -22,11 +22,18 @@ class TB(Module):
                 hdd_debug=True)
         self.submodules.core1 = LiteSATACore(self.hdd1.phy)
 
-        self.submodules.striping = LiteSATAStriping([self.core0, self.core1])
-        self.submodules.crossbar = LiteSATACrossbar(self.striping)
+        if stripe_size is None:
+            self.submodules.striping = LiteSATAStriping([self.core0, self.core1])
+            self.submodules.crossbar = LiteSATACrossbar(self.striping)
+            generator_port = self.crossbar.get_port()
+            checker_port = self.crossbar.get_port()
+        else:
+            self.submodules.striping = LiteSATAChunkedStriping([self.core0, self.core1], stripe_size)
+            generator_port = self.striping.get_port()
+            checker_port = self.striping.get_port()
 
-        self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port())
-        self.submodules.checker = LiteSATABISTChecker(self.crossbar.get_port())
+        self.submodules.generator = LiteSATABISTGenerator(generator_port)
+        self.submodules.checker = LiteSATABISTChecker(checker_port)
 
     def gen_simulation(self, selfp):
         hdd0 = self.hdd0
@@ -65,3 +72,4 @@ class TB(Module):
 
 if __name__ == "__main__":
     run_simulation(TB(), ncycles=4096, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(stripe_size=2*logical_sector_size), ncycles=8192)
@@ -0,0 +1,64 @@
+from litesata.common import *
+from litesata.core import LiteSATACore
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+
+from test.common import *
+from test.model.hdd import *
+
+
+class TB(Module):
+    def __init__(self, timing, dw=32):
+        self.submodules.hdd = HDD(
+                link_debug=False, link_random_level=0,
+                transport_debug=False, transport_loopback=False,
+                hdd_debug=False, timing=timing)
+        self.submodules.core = LiteSATACore(self.hdd.phy)
+        self.submodules.crossbar = LiteSATACrossbar(self.core)
+        self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port(dw))
+        self.submodules.checker = LiteSATABISTChecker(self.crossbar.get_port(dw))
+
+    def gen_simulation(self, selfp):
+        hdd = self.hdd
+        hdd.malloc(0, 2**20)
+        generator = selfp.generator
+        checker = selfp.checker
+        for sector, count in [(0, 8), (8, 8), (4096, 16), (64, 4)]:
+            # write data
+            start = hdd.cycle
+            generator.sector = sector
+            generator.count = count
+            generator.start = 1
+            yield
+            generator.start = 0
+            yield
+            while generator.done == 0:
+                yield
+            write_cycles = hdd.cycle - start
+
+            # verify data
+            start = hdd.cycle
+            checker.sector = sector
+            checker.count = count
+            checker.start = 1
+            yield
+            checker.start = 0
+            yield
+            while checker.done == 0:
+                yield
+            read_cycles = hdd.cycle - start
+
+            print("sector {} / count {}: write {} cycles / read {} cycles / errors {}".format(
+                sector, count, write_cycles, read_cycles, checker.errors))
+
+if __name__ == "__main__":
+    profiles = [
+        ("instantaneous", HDDTiming()),
+        ("throttled", ThrottledTiming(bandwidth=100)),
+        ("ssd", SSDTiming(bandwidth=500, read_latency=20, write_latency=5)),
+        ("rotational", RotationalTiming(bandwidth=150, rpm=15000*10, sectors_per_track=512, ntracks=4096,
+                                        track_to_track_seek=20, full_stroke_seek=200))
+    ]
+    for name, timing in profiles:
+        print("[{}]".format(name))
+        run_simulation(TB(timing), ncycles=2**18)
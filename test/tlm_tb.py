@@ -0,0 +1,51 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.bist import LiteSATABISTGenerator, LiteSATABISTChecker
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+class TB(Module):
+    def __init__(self, dw=64):
+        self.submodules.core = ControllerModel(debug=False)
+        self.submodules.crossbar = LiteSATACrossbar(self.core)
+        self.submodules.generator = LiteSATABISTGenerator(self.crossbar.get_port(dw))
+        self.submodules.checker = LiteSATABISTChecker(self.crossbar.get_port(dw))
+
+    def gen_simulation(self, selfp):
+        core = self.core
+        core.malloc(0, 2**48)
+        sector = 0
+        count = 17
+        generator = selfp.generator
+        checker = selfp.checker
+        while True:
+            # write data
+            generator.sector = sector
+            generator.count = count
+            generator.start = 1
+            yield
+            generator.start = 0
+            yield
+            while generator.done == 0:
+                yield
+
+            # verify data
+            checker.sector = sector
+            checker.count = count
+            checker.start = 1
+            yield
+            checker.start = 0
+            yield
+            while checker.done == 0:
+                yield
+            print("sector {} / count {}: errors {}".format(sector, count, checker.errors))
+
+            # prepare next iteration
+            sector = (sector*0x31415979 + 1) % (2**48 - 64)
+            count = max((count + 1)%64, 1)
+
+if __name__ == "__main__":
+    run_simulation(TB(32), ncycles=8192*8, vcd_name="my.vcd", keep_files=True)
+    run_simulation(TB(64), ncycles=8192*8, vcd_name="my.vcd", keep_files=True)
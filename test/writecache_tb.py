@@ -0,0 +1,109 @@
+from litesata.common import *
+from litesata.frontend.arbitration import LiteSATACrossbar
+from litesata.frontend.cache import LiteSATAWriteBackCache
+
+from test.common import *
+from test.model.controller import ControllerModel
+
+
+class WriteCacheTXPacket(list):
+    def __init__(self, write=0, read=0, flush=0, sector=0, count=0, data=[0]):
+        self.ongoing = False
+        self.done = False
+        self.write = write
+        self.read = read
+        self.flush = flush
+        self.sector = sector
+        self.count = count
+        for d in data:
+            self.append(d)
+
+
+class WriteCacheStreamer(PacketStreamer):
+    def __init__(self):
+        PacketStreamer.__init__(self, command_tx_description(32), WriteCacheTXPacket)
+
+    def do_simulation(self, selfp):
+        PacketStreamer.do_simulation(self, selfp)
+        selfp.source.write = self.packet.write
+        selfp.source.read = self.packet.read
+        selfp.source.flush = self.packet.flush
+        selfp.source.sector = self.packet.sector
+        selfp.source.count = self.packet.count
+
+
+class WriteCacheLogger(Module):
+    def __init__(self):
+        self.sink = Sink(command_rx_description(32))
+
+        # # #
+
+        self.data = []
+        self.completions = []
+
+    def receive(self):
+        n = len(self.completions)
+        while len(self.completions) == n:
+            yield
+
+    def do_simulation(self, selfp):
+        selfp.sink.ack = 1
+        if selfp.sink.stb:
+            if selfp.sink.last:
+                if selfp.sink.eop:
+                    self.completions.append(selfp.sink.failed)
+            else:
+                self.data.append(selfp.sink.data)
+
+
+class TB(Module):
+    def __init__(self, buffer_sectors):
+        self.submodules.controller = ControllerModel()
+        self.submodules.cache = LiteSATAWriteBackCache(self.controller, buffer_sectors)
+        self.submodules.crossbar = LiteSATACrossbar(self.cache)
+        self.user_port = self.crossbar.get_port()
+
+        self.submodules.streamer = WriteCacheStreamer()
+        self.submodules.logger = WriteCacheLogger()
+        self.submodules.pipeline = Pipeline(
+            self.streamer,
+            self.user_port,
+            self.logger
+        )
+
+    def gen_simulation(self, selfp):
+        self.controller.malloc(0, 64)
+        nsectors = 16
+        count = 1
+        data = [seed_to_data(i, True) for i in range(sectors2dwords(nsectors))]
+
+        # small sequential writes (merged in the cache)
+        latencies = []
+        for sector in range(0, nsectors, count):
+            offset = sectors2dwords(sector)
+            write_packet = WriteCacheTXPacket(write=1, sector=sector, count=count,
+                data=data[offset:offset+sectors2dwords(count)])
+            cycle = 0
+            yield from self.streamer.send(write_packet, blocking=False)
+            n = len(self.logger.completions)
+            while len(self.logger.completions) == n:
+                cycle += 1
+                yield
+            latencies.append(cycle)
+        print("write latencies: " + str(latencies))
+
+        # flush (barrier)
+        yield from self.streamer.send(WriteCacheTXPacket(flush=1))
+        yield from self.logger.receive()
+        print("flush failed: " + str(self.logger.completions[-1]))
+
+        # read back
+        yield from self.streamer.send(WriteCacheTXPacket(read=1, sector=0, count=nsectors))
+        yield from self.logger.receive()
+
+        # check results
+        s, l, e = check(data, self.logger.data)
+        print("shift " + str(s) + " / length " + str(l) + " / errors " + str(e))
+
+if __name__ == "__main__":
+    run_simulation(TB(buffer_sectors=8), ncycles=16384, vcd_name="my.vcd", keep_files=True)